@@ -1,3 +1,45 @@
 from django.test import TestCase
+from django.urls import reverse
+
+from carts.tests import create_product, create_user
+from orders.models import Order, OrderProduct
+from orders.tests import create_order
+from .views import ORDERS_PER_PAGE
 
 # Create your tests here.
+class MyOrdersTest(TestCase):
+    def setUp(self):
+        self.user = create_user('shopper')
+        self.client.force_login(self.user)
+
+    def test_keyset_pagination_walks_all_orders(self):
+        for i in range(ORDERS_PER_PAGE * 2 + 5):
+            create_order(self.user, '2023010%d' % i)
+        Order.objects.update(is_ordered=True)
+
+        seen = []
+        response = self.client.get(reverse('my_orders'))
+        while True:
+            seen += [order.id for order in response.context['orders']]
+            if not response.context['next_page']:
+                break
+            response = self.client.get(reverse('my_orders'), {'before': response.context['next_page']})
+
+        self.assertEqual(seen, list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_order_detail_subtotal(self):
+        product = create_product()
+        order = create_order(self.user, '202301011')
+        OrderProduct.objects.create(order=order, user=self.user, product=product, quantity=3, product_price=2.5)
+        OrderProduct.objects.create(order=order, user=self.user, product=product, quantity=1, product_price=4)
+
+        response = self.client.get(reverse('order_detail', args=[order.order_number]))
+
+        self.assertEqual(response.context['subtotal'], 11.5)
+
+    def test_order_detail_of_another_user_is_not_found(self):
+        order = create_order(create_user('someone'), '202301012')
+
+        response = self.client.get(reverse('order_detail', args=[order.order_number]))
+
+        self.assertEqual(response.status_code, 404)
@@ -1,4 +1,4 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from .forms import RegistrationForm, UserForm, UserProfileForm
 from .models import Account, UserProfile
 from django.contrib import messages, auth
@@ -18,10 +18,15 @@ from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import EmailMessage
 from carts.views import _cart_id
-from carts.models import Cart, CartItem
+from carts.models import CartItem
+from retailstore.db_router import read_from_replica
+from django.db.models import F, Q, Sum
+from datetime import datetime
 import requests
 
 # Create your views here.
+ORDERS_PER_PAGE = 20
+
 def register(request):
     if request.method == 'POST':
         form = RegistrationForm(request.POST)
@@ -72,42 +77,15 @@ def login(request):
         user = auth.authenticate(email=email, password=password)
 
         if user is not None:
-            try:
-                cart = Cart.objects.get(cart_id=_cart_id(request)) # get cart ID from session (browser cookie)
-                is_cart_item_exists = CartItem.objects.filter(cart=cart).exists()
-                if is_cart_item_exists: 
-                    cart_item = CartItem.objects.filter(cart=cart)
-
-                    # get product variations by cart ID
-                    product_variation = []
-                    for item in cart_item:
-                        variation = item.variations.all()
-                        product_variation.append(list(variation))
-
-                    #get cart items from user to access their product variations
-                    cart_item = CartItem.objects.filter(user=user)
-                    ex_var_list = []
-                    id = []
-                    for item in cart_item:
-                        existing_variation = item.variations.all()
-                        ex_var_list.append(list(existing_variation))
-                        id.append(item.id)
-
-                    for pr in product_variation:
-                        if pr in ex_var_list:
-                            index = ex_var_list.index(pr)
-                            item_id = id[index]
-                            item = CartItem.objects.get(id=item_id)
-                            item.quantity += 1
-                            item.user = user
-                            item.save()
-                        else:
-                            cart_item = CartItem.objects.filter(cart=cart)
-                            for item in cart_item:
-                                item.user = user
-                                item.save()
-            except:
-                pass
+            # items of the session's guest carts (cart_id isn't unique, there may be several)
+            for item in CartItem.objects.filter(cart__cart_id=_cart_id(request), user=None): # get cart ID from session (browser cookie)
+                # same product and variations already in the user's cart -> merge quantities
+                merged = CartItem.objects.filter(user=user, product_id=item.product_id, variation_key=item.variation_key).update(quantity=F('quantity') + item.quantity)
+                if merged:
+                    item.delete()
+                else:
+                    item.user = user
+                    item.save(update_fields=['user'])
             
             auth.login(request, user)
             messages.success(request, 'You are now logged in!')
@@ -123,7 +101,8 @@ def login(request):
                     #print("next_page -> " + str(next_page))
                     #next_page -> /cart/checkout/
                     return redirect(next_page)
-            except:
+            except (TypeError, ValueError):
+                # no referer, or no usable ?next= in it
                 return redirect('dashboard')
         else:
             messages.error(request, 'Invalid login credentials!')
@@ -165,24 +144,43 @@ def dashboard(request):
     return render(request, 'accounts/dashboard.html', context)
 
 @login_required(login_url='login')
+@read_from_replica
 def my_orders(request):
-    orders = Order.objects.filter(user=request.user, is_ordered=True).order_by('-created_at')
+    orders = Order.objects.filter(user=request.user, is_ordered=True).order_by('-created_at', '-id')
+
+    # keyset pagination: continue after the last order of the previous page
+    before = request.GET.get('before')
+    if before:
+        try:
+            created_at, order_id = before.rsplit('_', 1)
+            created_at = datetime.fromisoformat(created_at)
+            orders = orders.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=int(order_id)))
+        except ValueError:
+            return redirect('my_orders')
+
+    orders = list(orders[:ORDERS_PER_PAGE + 1])
+    next_page = None
+    if len(orders) > ORDERS_PER_PAGE:
+        orders = orders[:ORDERS_PER_PAGE]
+        next_page = f'{orders[-1].created_at.isoformat()}_{orders[-1].id}'
+
     context = {
         'orders': orders,
+        'next_page': next_page,
+        'is_first_page': not before,
     }
     return render(request, 'accounts/my_orders.html', context)
 
 @login_required(login_url='login')
+@read_from_replica
 def order_detail(request, order_id):
-    order_detail = OrderProduct.objects.filter(order__order_number=order_id)
-    order = Order.objects.get(order_number=order_id)
-    subtotal = 0
-    for i in order_detail:
-        subtotal += i.product_price * i.quantity
+    order = get_object_or_404(Order, order_number=order_id, user=request.user)
+    order_detail = OrderProduct.objects.filter(order=order).select_related('product').prefetch_related('variations')
+    subtotal = order_detail.aggregate(subtotal=Sum(F('product_price') * F('quantity')))['subtotal'] or 0
 
     context = {
         'order_detail': order_detail,
         'order': order,
         'subtotal': subtotal,
     }
-    return render(request, 'accounts/order_detail.html', context)
\ No newline at end of file
+    return render(request, 'accounts/order_detail.html', context)
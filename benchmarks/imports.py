@@ -0,0 +1,107 @@
+# What a worker imports before it serves its first request, measured with
+# `python -X importtime`, and the comparison with a saved baseline.
+#
+# Each run starts a new interpreter that loads the WSGI application and the URL
+# patterns, as gunicorn does, with the settings of the current process. The self times
+# of the modules are added up per top-level package (django, boto3, store...). Import
+# times vary between runs and machines, so the fastest of a few runs is kept and only
+# changes beyond a relative threshold are regressions; a package of HEAVY_PACKAGES
+# being imported at all is always one.
+
+import json
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'import_baseline.json'
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+BOOT_CODE = '''
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+get_wsgi_application()
+get_resolver().url_patterns
+'''
+
+# packages only the GenAI features need, which store/genai_views.py and store/clients.py
+# import on first use
+HEAVY_PACKAGES = ('langchain', 'numpy', 'pgvector', 'PIL', 'store.genai_views')
+# boot times within this many milliseconds of the baseline are never regressions
+MIN_CHANGE_MS = 20.0
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$')
+
+
+def parse(output):
+    """(module, self us, cumulative us, depth) of each line of -X importtime output."""
+    modules = []
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            modules.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return modules
+
+
+def summarize(modules):
+    """Total milliseconds, number of modules and milliseconds per top-level package."""
+    imported = {module for module, _, _, _ in modules}
+    packages = defaultdict(int)
+    for module, self_us, _, _ in modules:
+        packages[module.split('.')[0]] += self_us
+    return {
+        'total_ms': round(sum(self_us for _, self_us, _, _ in modules) / 1000, 1),
+        'modules': len(modules),
+        'packages': {name: round(us / 1000, 1) for name, us in sorted(packages.items(), key=lambda item: -item[1])},
+        'heavy': [name for name in HEAVY_PACKAGES if name in imported],
+    }
+
+
+def measure_once(code=BOOT_CODE):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=PROJECT_DIR,
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError('Booting the application failed:\n' + result.stderr[-2000:])
+    return parse(result.stderr)
+
+
+def measure(runs=5, code=BOOT_CODE):
+    """Summary of the fastest of `runs` boots."""
+    summaries = [summarize(measure_once(code)) for _ in range(runs)]
+    return min(summaries, key=lambda summary: summary['total_ms'])
+
+
+def compare(summary, baseline, threshold=0.2):
+    """Regressions of `summary` against `baseline`, as readable lines."""
+    regressions = ['%s is imported at boot' % name for name in summary['heavy'] if name not in baseline['heavy']]
+    if summary['total_ms'] > baseline['total_ms'] * (1 + threshold) and summary['total_ms'] - baseline['total_ms'] > MIN_CHANGE_MS:
+        regressions.append('boot imports take %.1f ms, was %.1f' % (summary['total_ms'], baseline['total_ms']))
+    for name, ms in summary['packages'].items():
+        before = baseline['packages'].get(name, 0.0)
+        if ms > before * (1 + threshold) and ms - before > MIN_CHANGE_MS:
+            regressions.append('%s: %.1f ms, was %.1f' % (name, ms, before))
+    return regressions
+
+
+def format_table(summary, baseline=None, top=15):
+    """Lines of a table of the slowest packages, with the baseline's times next to them."""
+    previous = baseline['packages'] if baseline else {}
+    lines = ['%-30s %9s %9s' % ('package', 'ms', 'baseline')]
+    for name, ms in list(summary['packages'].items())[:top]:
+        lines.append('%-30s %9.1f %9s' % (name, ms, '%.1f' % previous[name] if name in previous else '-'))
+    lines.append('%-30s %9.1f %9s' % ('total (%d modules)' % summary['modules'], summary['total_ms'],
+                                      '%.1f' % baseline['total_ms'] if baseline else '-'))
+    return lines
+
+
+def save(summary, path=DEFAULT_BASELINE):
+    Path(path).write_text(json.dumps(summary, indent=2) + '\n')
+
+
+def load(path=DEFAULT_BASELINE):
+    path = Path(path)
+    if not path.is_file():
+        return None
+    return json.loads(path.read_text())
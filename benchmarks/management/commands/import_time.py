@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import imports
+
+
+class Command(BaseCommand):
+    help = ('Measure the imports of a worker booting (the WSGI application and the URL patterns) with '
+            'python -X importtime, per package, compared with a saved baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='boots measured; the fastest is reported')
+        parser.add_argument('--top', type=int, default=15, help='packages listed')
+        parser.add_argument('--baseline', default=str(imports.DEFAULT_BASELINE), help='summary of an earlier run to compare with')
+        parser.add_argument('--save-baseline', action='store_true', help='save this run as the baseline')
+        parser.add_argument('--threshold', type=float, default=0.2, help='relative import time change reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true', help='exit with an error when the run regressed')
+
+    def handle(self, *args, **options):
+        try:
+            summary = imports.measure(options['runs'])
+        except RuntimeError as e:
+            raise CommandError(e)
+        baseline = imports.load(options['baseline'])
+
+        for line in imports.format_table(summary, baseline, options['top']):
+            self.stdout.write(line)
+        for name in summary['heavy']:
+            self.stdout.write(self.style.WARNING('%s is imported at boot' % name))
+
+        if options['save_baseline']:
+            imports.save(summary, options['baseline'])
+            self.stdout.write(self.style.SUCCESS('Saved as the baseline in %s' % options['baseline']))
+        elif baseline:
+            regressions = imports.compare(summary, baseline, options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.WARNING('Regression: ' + regression))
+            if regressions and options['fail_on_regression']:
+                raise CommandError('%d regressions against the baseline' % len(regressions))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from benchmarks import report
+from benchmarks.traffic import MIXES, run_mix
+
+
+class Command(BaseCommand):
+    help = ('Drive a traffic mix over the storefront and report latency percentiles, throughput '
+            'and queries per request, compared with a saved baseline. Run seed_benchmark_data first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', choices=sorted(MIXES), default='default')
+        parser.add_argument('--requests', type=int, default=1000, help='timed requests in total')
+        parser.add_argument('--duration', type=float, help='run for this many seconds instead of a number of requests')
+        parser.add_argument('--workers', type=int, default=4, help='concurrent visitors')
+        parser.add_argument('--warmup', type=int, default=2, help='untimed requests to each endpoint per visitor')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', default=str(report.DEFAULT_BASELINE), help='summary of an earlier run to compare with')
+        parser.add_argument('--save-baseline', action='store_true', help='save this run as the baseline')
+        parser.add_argument('--threshold', type=float, default=0.2, help='relative latency and throughput change reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true', help='exit with an error when the run regressed')
+
+    def handle(self, *args, **options):
+        try:
+            samples, elapsed = run_mix(options['mix'], None if options['duration'] else options['requests'], options['duration'],
+                                       options['workers'], options['warmup'], options['seed'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        summary = report.summarize(samples, elapsed, mix=options['mix'], workers=options['workers'],
+                                   seed=options['seed'], database=connection.vendor)
+        baseline = report.load(options['baseline'])
+        if baseline and baseline['run'].get('mix') != options['mix']:
+            self.stderr.write('The baseline is a run of the %s mix, not compared.' % baseline['run'].get('mix'))
+            baseline = None
+
+        for line in report.format_table(summary, baseline):
+            self.stdout.write(line)
+
+        if options['save_baseline']:
+            report.save(summary, options['baseline'])
+            self.stdout.write(self.style.SUCCESS('Saved as the baseline in %s' % options['baseline']))
+        elif baseline:
+            regressions = report.compare(summary, baseline, options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.WARNING('Regression: ' + regression))
+            if regressions and options['fail_on_regression']:
+                raise CommandError('%d regressions against the baseline' % len(regressions))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
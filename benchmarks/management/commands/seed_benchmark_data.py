@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from benchmarks.seed import clear_catalog, seed_catalog
+
+
+class Command(BaseCommand):
+    help = 'Seed a synthetic catalog, customers and orders for the storefront benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--variations', type=int, default=6, help='variations per product, half colors and half sizes')
+        parser.add_argument('--reviews', type=int, default=10, help='reviews per product')
+        parser.add_argument('--users', type=int, default=100, help='customers; a run needs one per worker')
+        parser.add_argument('--orders', type=int, default=200, help='past orders of the customers')
+        parser.add_argument('--seed', type=int, default=0, help='the same seed gives the same data')
+        parser.add_argument('--clear', action='store_true', help='only remove the seeded data and what benchmark runs created for it')
+
+    def handle(self, *args, **options):
+        # seeding twice would collide on the unique slugs, start from a clean slate
+        clear_catalog()
+        if options['clear']:
+            self.stdout.write(self.style.SUCCESS('Benchmark data removed.'))
+            return
+
+        counts = seed_catalog(options['products'], options['categories'], options['variations'], options['reviews'],
+                              options['users'], options['orders'], options['seed'])
+        self.stdout.write(', '.join('%d %s' % (count, name) for name, count in counts.items()))
+        self.stdout.write(self.style.SUCCESS('Benchmark data seeded.'))
@@ -0,0 +1,39 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from utils import tracing
+
+
+class Command(BaseCommand):
+    help = ('Summarize the request traces written with TRACING_EXPORTER=file: mean time per route '
+            'and where it went (db, bedrock, aws, http, image, render), and the span trees of the slowest requests')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=settings.TRACING_FILE, help='OTLP/JSON lines written by the file exporter')
+        parser.add_argument('--route', help='only traces whose root span name contains this, e.g. vector_search')
+        parser.add_argument('--slowest', type=int, default=0, help='print the span trees of this many slowest traces')
+
+    def handle(self, *args, **options):
+        if not os.path.isfile(options['file']):
+            raise CommandError('No traces in %s; run the server with TRACING_EXPORTER=file first.' % options['file'])
+        traces = list(tracing.read_file(options['file']))
+        if options['route']:
+            traces = [t for t in traces if options['route'] in tracing.root_span(t)['name']]
+        if not traces:
+            raise CommandError('No matching traces.')
+
+        summary = tracing.aggregate(traces)
+        components = sorted({c for entry in summary.values() for c in entry['components']})
+        self.stdout.write('%-60s %7s %10s' % ('route', 'traces', 'mean ms') + ''.join(' %9s' % c for c in components))
+        for name, entry in sorted(summary.items(), key=lambda item: -item[1]['mean_ms']):
+            self.stdout.write('%-60s %7d %10.1f' % (name[:60], entry['traces'], entry['mean_ms'])
+                              + ''.join(' %9.1f' % entry['components'].get(c, 0) for c in components))
+
+        slowest = sorted(traces, key=lambda t: -tracing.duration_ms(tracing.root_span(t)))[:options['slowest']]
+        for spans in slowest:
+            self.stdout.write('')
+            self.stdout.write('trace %s' % spans[0]['traceId'])
+            for line in tracing.format_tree(spans):
+                self.stdout.write(line)
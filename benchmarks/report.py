@@ -0,0 +1,97 @@
+# Latency percentiles, throughput and queries per request of a benchmark run, and
+# the comparison with a saved baseline.
+#
+# A baseline is the JSON summary of an earlier run. Query counts don't depend on the
+# machine and only vary a little with the products visited, so half a query more per
+# request is reported; latency and throughput are only compared beyond a relative
+# threshold, since they vary between runs.
+
+import json
+import math
+from pathlib import Path
+
+from .traffic import ENDPOINTS
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+
+# latencies within this many milliseconds of the baseline are never regressions
+MIN_LATENCY_CHANGE_MS = 1.0
+# more queries per request than the baseline by at least this much is a regression
+MIN_QUERY_CHANGE = 0.5
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of `values`, 0 when there are none."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def _stats(samples, elapsed):
+    latencies = [s.seconds * 1000 for s in samples]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if s.status >= 400),
+        'throughput': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries': round(sum(s.queries for s in samples) / len(samples), 2) if samples else 0.0,
+    }
+
+
+def summarize(samples, elapsed, **run):
+    """Summary of a run, per endpoint and in total; `run` describes the run (mix, workers...)."""
+    endpoints = {}
+    for endpoint in sorted({s.endpoint for s in samples}, key=lambda e: ENDPOINTS.index(e) if e in ENDPOINTS else len(ENDPOINTS)):
+        endpoints[endpoint] = _stats([s for s in samples if s.endpoint == endpoint], elapsed)
+    return {'run': dict(run, elapsed=round(elapsed, 3)), 'total': _stats(samples, elapsed), 'endpoints': endpoints}
+
+
+def compare(summary, baseline, threshold=0.2):
+    """Regressions of `summary` against `baseline`, as readable lines."""
+    regressions = []
+    current = dict(summary['endpoints'], total=summary['total'])
+    previous = dict(baseline['endpoints'], total=baseline['total'])
+    for endpoint, stats in current.items():
+        before = previous.get(endpoint)
+        if not before:
+            continue
+        # the total depends on how many requests each endpoint happened to get
+        if endpoint != 'total' and stats['queries'] - before['queries'] >= MIN_QUERY_CHANGE:
+            regressions.append('%s: %.2f queries per request, was %.2f' % (endpoint, stats['queries'], before['queries']))
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if stats[key] > before[key] * (1 + threshold) and stats[key] - before[key] > MIN_LATENCY_CHANGE_MS:
+                regressions.append('%s: %s %.1f, was %.1f' % (endpoint, key, stats[key], before[key]))
+        if stats['errors'] > before['errors']:
+            regressions.append('%s: %d errors, was %d' % (endpoint, stats['errors'], before['errors']))
+    if summary['total']['throughput'] < baseline['total']['throughput'] * (1 - threshold):
+        regressions.append('throughput %.1f req/s, was %.1f' % (summary['total']['throughput'], baseline['total']['throughput']))
+    return regressions
+
+
+def format_table(summary, baseline=None):
+    """Lines of a table of the summary, with the baseline's p95 and queries next to them."""
+    lines = ['%-15s %8s %7s %9s %9s %9s %9s %8s' % ('endpoint', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries')]
+    previous = dict(baseline['endpoints'], total=baseline['total']) if baseline else {}
+    for endpoint, stats in list(summary['endpoints'].items()) + [('total', summary['total'])]:
+        line = '%-15s %8d %7d %9.1f %9.1f %9.1f %9.1f %8.2f' % (
+            endpoint, stats['requests'], stats['errors'], stats['throughput'],
+            stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['queries'])
+        before = previous.get(endpoint)
+        if before:
+            line += '   (baseline p95 %.1f, queries %.2f)' % (before['p95_ms'], before['queries'])
+        lines.append(line)
+    return lines
+
+
+def save(summary, path=DEFAULT_BASELINE):
+    Path(path).write_text(json.dumps(summary, indent=2) + '\n')
+
+
+def load(path=DEFAULT_BASELINE):
+    path = Path(path)
+    if not path.is_file():
+        return None
+    return json.loads(path.read_text())
@@ -0,0 +1,133 @@
+# Synthetic catalog for the storefront benchmarks.
+#
+# seed_catalog writes categories, products with color and size variations, reviews,
+# active customers and their past orders with bulk INSERTs. Everything it writes is
+# marked so clear_catalog can remove it again without touching real data: slugs,
+# usernames and order numbers start with "bench", emails end with @bench.example.com.
+
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from accounts.models import Account
+from category.models import Category
+from orders.models import Order, OrderProduct, Payment
+from store.models import Product, ReviewRating, Variation
+
+PREFIX = 'bench'
+EMAIL_DOMAIN = 'bench.example.com'
+# every seeded customer has this password
+PASSWORD = 'bench-password'
+
+COLORS = ['red', 'blue', 'green', 'black', 'white', 'grey', 'navy', 'yellow']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+FIRST_NAMES = ['Ana', 'Ben', 'Chen', 'Dara', 'Eli', 'Fatima', 'Goran', 'Hana', 'Ivan', 'Jaya']
+LAST_NAMES = ['Garcia', 'Smith', 'Wang', 'Okafor', 'Novak', 'Khan', 'Silva', 'Ito', 'Berg', 'Rossi']
+WORDS = ('soft cotton slim fit relaxed classic stretch denim linen wool breathable warm light '
+         'durable casual everyday summer winter stitched washed organic premium comfortable').split()
+# search keywords, most of them match some products
+KEYWORDS = WORDS[:12] + ['product', 'nothing-matches']
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed_catalog(products=500, categories=10, variations=6, reviews=10, users=100, orders=200, seed=0, batch_size=1000):
+    """Seed a synthetic catalog; the same arguments always produce the same data.
+    Returns the number of rows written per model."""
+    rng = random.Random(seed)
+    counts = {}
+    with transaction.atomic():
+        Category.objects.bulk_create([
+            Category(category_name='Bench category %d' % i, slug='%s-category-%d' % (PREFIX, i), description=_text(rng, 8))
+            for i in range(categories)
+        ], batch_size=batch_size)
+        # fetched again rather than relying on bulk_create setting ids, which not every database does
+        category_ids = list(Category.objects.filter(slug__startswith=PREFIX + '-').order_by('id').values_list('id', flat=True))
+        counts['categories'] = categories
+
+        Product.objects.bulk_create([
+            Product(product_name='Bench product %05d' % i,
+                    product_brand=rng.choice(['reinvent', 'northwind', 'contoso']),
+                    slug='%s-product-%05d' % (PREFIX, i),
+                    description=_text(rng, 40),
+                    price=rng.randint(10, 200),
+                    images='photos/products/%s.jpg' % PREFIX,
+                    # high enough that checkouts during a run never run out
+                    stock=10 ** 6,
+                    category_id=category_ids[i % len(category_ids)])
+            for i in range(products)
+        ], batch_size=batch_size)
+        product_ids = list(Product.objects.filter(slug__startswith=PREFIX + '-').order_by('id').values_list('id', flat=True))
+        counts['products'] = products
+
+        # about half colors and half sizes
+        colors = (variations + 1) // 2
+        rows = []
+        for product_id in product_ids:
+            rows += [Variation(product_id=product_id, variation_category='color', variation_value=value) for value in rng.sample(COLORS, min(colors, len(COLORS)))]
+            rows += [Variation(product_id=product_id, variation_category='size', variation_value=value) for value in rng.sample(SIZES, min(variations - colors, len(SIZES)))]
+        Variation.objects.bulk_create(rows, batch_size=batch_size)
+        counts['variations'] = len(rows)
+
+        rows = [
+            ReviewRating(product_id=product_id,
+                         subject=_text(rng, 3),
+                         review=_text(rng, 30),
+                         rating=rng.randint(2, 10) / 2,
+                         # some reviews are hidden, like the ones a manager turned off
+                         status=rng.random() < 0.9,
+                         first_name=rng.choice(FIRST_NAMES),
+                         last_name=rng.choice(LAST_NAMES))
+            for product_id in product_ids for _ in range(reviews)
+        ]
+        ReviewRating.objects.bulk_create(rows, batch_size=batch_size)
+        counts['reviews'] = len(rows)
+
+        # hashing is slow on purpose, all customers share one hash
+        password = make_password(PASSWORD)
+        Account.objects.bulk_create([
+            Account(first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                    username='%s-user-%d' % (PREFIX, i), email='%s-user-%d@%s' % (PREFIX, i, EMAIL_DOMAIN),
+                    password=password, is_active=True)
+            for i in range(users)
+        ], batch_size=batch_size)
+        user_ids = list(Account.objects.filter(email__endswith='@' + EMAIL_DOMAIN).order_by('id').values_list('id', flat=True))
+        counts['users'] = users
+
+        if orders and user_ids:
+            owners = [rng.choice(user_ids) for _ in range(orders)]
+            Payment.objects.bulk_create([
+                Payment(user_id=owner, payment_id='%s-%d' % (PREFIX, i), payment_method='PayPal', amount_paid='0', status='COMPLETED')
+                for i, owner in enumerate(owners)
+            ], batch_size=batch_size)
+            payment_ids = list(Payment.objects.filter(payment_id__startswith=PREFIX + '-').order_by('id').values_list('id', flat=True))
+            Order.objects.bulk_create([
+                Order(user_id=owner, payment_id=payment_id, order_number='%s%015d' % (PREFIX, i),
+                      first_name='Bench', last_name='Customer', phone='555', email='orders@' + EMAIL_DOMAIN,
+                      address_line_1='1 Main St', country='US', state='WA', city='Seattle',
+                      order_total=0, tax=0, status='Completed', is_ordered=True)
+                for i, (owner, payment_id) in enumerate(zip(owners, payment_ids))
+            ], batch_size=batch_size)
+            placed = Order.objects.filter(order_number__startswith=PREFIX).order_by('id').values_list('id', 'user_id', 'payment_id')
+            rows = [
+                OrderProduct(order_id=order_id, payment_id=payment_id, user_id=user_id, product_id=rng.choice(product_ids),
+                             quantity=rng.randint(1, 3), product_price=rng.randint(10, 200), ordered=True)
+                for order_id, user_id, payment_id in placed for _ in range(rng.randint(1, 4))
+            ]
+            OrderProduct.objects.bulk_create(rows, batch_size=batch_size)
+        counts['orders'] = orders
+    return counts
+
+
+def clear_catalog():
+    """Remove the seeded data, and the carts and orders benchmark runs created for it."""
+    with transaction.atomic():
+        # orders keep their rows when the user is deleted, remove them first
+        Order.objects.filter(user__email__endswith='@' + EMAIL_DOMAIN).delete()
+        Order.objects.filter(order_number__startswith=PREFIX).delete()
+        # payments, order lines and cart items go with the users and products
+        Account.objects.filter(email__endswith='@' + EMAIL_DOMAIN).delete()
+        Category.objects.filter(slug__startswith=PREFIX + '-').delete()
@@ -0,0 +1,127 @@
+import random
+
+from django.test import TestCase, override_settings
+
+from accounts.models import Account
+from category.models import Category
+from orders.models import Order, OrderProduct
+from store.models import Product, ReviewRating, Variation
+from . import imports, report
+from .seed import clear_catalog, seed_catalog
+from .traffic import ENDPOINTS, Catalog, Sample, Visitor, run_mix
+
+# Create your tests here.
+class SeedCatalogTest(TestCase):
+    def test_seed_and_clear(self):
+        counts = seed_catalog(products=12, categories=3, variations=4, reviews=2, users=3, orders=5)
+
+        self.assertEqual(counts, {'categories': 3, 'products': 12, 'variations': 48, 'reviews': 24, 'users': 3, 'orders': 5})
+        self.assertEqual(Product.objects.count(), 12)
+        self.assertEqual(Variation.objects.colors().count(), 24)
+        self.assertEqual(Order.objects.filter(is_ordered=True).count(), 5)
+        self.assertTrue(OrderProduct.objects.exists())
+        self.assertTrue(Account.objects.get(username='bench-user-0').check_password('bench-password'))
+
+        clear_catalog()
+
+        for model in (Category, Product, ReviewRating, Account, Order, OrderProduct):
+            self.assertFalse(model.objects.exists(), model)
+
+
+class RunMixTest(TestCase):
+    def test_every_endpoint_is_timed_and_counted(self):
+        seed_catalog(products=12, categories=3, reviews=2, users=2, orders=2)
+        mix = {endpoint: 1 for endpoint in ENDPOINTS}
+
+        samples, elapsed = run_mix(mix, requests=40, workers=1, warmup=1, seed=1)
+
+        self.assertEqual(len(samples), 40)
+        self.assertEqual({s.status for s in samples if s.status >= 400}, set())
+        self.assertEqual({s.endpoint for s in samples}, set(ENDPOINTS))
+        self.assertTrue(all(s.queries > 0 for s in samples))
+        # the payments checked out the cart into orders
+        self.assertTrue(Order.objects.filter(user__username='bench-user-0', is_ordered=True).exists())
+
+    def test_payment_without_an_order_is_a_failure(self):
+        seed_catalog(products=3, categories=1, reviews=0, users=1, orders=0)
+        catalog = Catalog()
+        visitor = Visitor(catalog, catalog.customers[0], random.Random(0))
+        # the visitor believes it filled its cart, but place_order finds it empty
+        visitor.cart_lines = 1
+
+        sample = visitor.payments()
+
+        self.assertEqual((sample.endpoint, sample.status), ('payments', 500))
+
+    def test_needs_a_seeded_catalog(self):
+        with self.assertRaises(ValueError):
+            run_mix('browse', requests=1, workers=1)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class HotPathQueryBudgetTest(TestCase):
+    def test_hot_paths_stay_within_their_query_budgets(self):
+        # a request over budget raises QueryBudgetExceeded, the visitors get a server error
+        seed_catalog(products=30, categories=3, reviews=5, users=1, orders=3)
+        mix = {endpoint: 1 for endpoint in ENDPOINTS}
+
+        samples, elapsed = run_mix(mix, requests=50, workers=1, seed=2)
+
+        self.assertEqual({s.endpoint for s in samples}, set(ENDPOINTS))
+        self.assertEqual([(s.endpoint, s.status) for s in samples if s.status >= 500], [])
+
+
+class ReportTest(TestCase):
+    def summary(self, seconds, queries):
+        samples = [Sample('store', s / 1000, queries, 200) for s in seconds]
+        return report.summarize(samples, 1.0, mix='browse')
+
+    def test_percentiles(self):
+        stats = self.summary(range(1, 101), 10)['endpoints']['store']
+
+        self.assertEqual((stats['p50_ms'], stats['p95_ms'], stats['p99_ms']), (50, 95, 99))
+        self.assertEqual(stats['throughput'], 100)
+        self.assertEqual(stats['queries'], 10)
+
+    def test_compare_reports_query_and_latency_regressions(self):
+        baseline = self.summary([10] * 20, 10)
+
+        self.assertEqual(report.compare(self.summary([11] * 20, 10), baseline), [])
+        regressions = report.compare(self.summary([20] * 20, 12), baseline)
+        self.assertIn('store: 12.00 queries per request, was 10.00', regressions)
+        self.assertIn('store: p95_ms 20.0, was 10.0', regressions)
+
+
+class ImportTimeTest(TestCase):
+    OUTPUT = (
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       120 |        120 |     django.utils.version\n'
+        'import time:      2000 |       2120 |   django\n'
+        'import time:       500 |        500 |     numpy.core\n'
+        'import time:      1000 |       1500 |   numpy\n'
+        'import time:       300 |       3920 | store.views\n'
+    )
+
+    def test_parse_and_summarize(self):
+        modules = imports.parse(self.OUTPUT)
+
+        self.assertEqual(modules[0], ('django.utils.version', 120, 120, 2))
+        self.assertEqual(modules[-1], ('store.views', 300, 3920, 0))
+        summary = imports.summarize(modules)
+        self.assertEqual(summary['total_ms'], 3.9)
+        self.assertEqual(summary['packages'], {'django': 2.1, 'numpy': 1.5, 'store': 0.3})
+        self.assertEqual(summary['heavy'], ['numpy'])
+
+    def test_compare(self):
+        baseline = {'total_ms': 300.0, 'modules': 800, 'packages': {'django': 90.0}, 'heavy': []}
+        summary = {'total_ms': 420.0, 'modules': 900, 'packages': {'django': 95.0, 'langchain': 120.0}, 'heavy': ['langchain']}
+
+        self.assertEqual(imports.compare(baseline, baseline), [])
+        self.assertEqual(imports.compare(summary, baseline), [
+            'langchain is imported at boot', 'boot imports take 420.0 ms, was 300.0', 'langchain: 120.0 ms, was 0.0'])
+
+    def test_booting_imports_no_genai_dependencies(self):
+        summary = imports.summarize(imports.measure_once())
+
+        self.assertEqual(summary['heavy'], [])
+        self.assertIn('store', summary['packages'])
@@ -0,0 +1,210 @@
+# Traffic mixes over the storefront, driven in-process through Django's test client.
+#
+# Each worker thread plays a visitor: catalog pages are requested as a guest, cart and
+# checkout steps as one of the seeded customers. Endpoints are picked at random with
+# the weights of the mix, from a seeded generator, so runs are repeatable. Every timed
+# request records its latency, status and the queries it ran on this thread's database
+# connections; the set-up requests a step needs (filling the cart before a checkout,
+# placing the order before a payment) are not timed.
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from accounts.models import Account
+from category.models import Category
+from orders.models import Order
+from store.models import Product, Variation
+from .seed import EMAIL_DOMAIN, KEYWORDS
+
+ENDPOINTS = ('home', 'store', 'search', 'product_detail', 'add_cart', 'checkout', 'payments')
+
+# relative weights of the endpoints in each mix
+MIXES = {
+    # a typical day: mostly browsing, a few percent of visits end in an order
+    'default': {'home': 15, 'store': 25, 'search': 15, 'product_detail': 30, 'add_cart': 8, 'checkout': 4, 'payments': 3},
+    # catalog pages only, no writes
+    'browse': {'home': 20, 'store': 35, 'search': 15, 'product_detail': 30},
+    # a sale: many carts and orders
+    'checkout': {'product_detail': 20, 'add_cart': 40, 'checkout': 20, 'payments': 20},
+}
+
+ADDRESS = {'first_name': 'Bench', 'last_name': 'Customer', 'phone': '555', 'email': 'orders@' + EMAIL_DOMAIN,
+           'address_line_1': '1 Main St', 'country': 'US', 'state': 'WA', 'city': 'Seattle'}
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    seconds: float
+    queries: int
+    status: int
+
+
+class Catalog:
+    """Urls, variations and customers the visitors pick from, loaded once before a run."""
+
+    def __init__(self):
+        self.products = list(Product.objects.filter(is_available=True).select_related('category').order_by('id'))
+        self.categories = list(Category.objects.order_by('id').values_list('slug', flat=True))
+        self.customers = list(Account.objects.filter(is_active=True, email__endswith='@' + EMAIL_DOMAIN).order_by('id'))
+        self.variations = {}
+        for product_id, category, value in Variation.objects.filter(is_active=True).values_list('product_id', 'variation_category', 'variation_value'):
+            self.variations.setdefault(product_id, {}).setdefault(category, []).append(value)
+
+    def pages(self):
+        # store pages of 6 products, as the store view paginates
+        return max(1, (len(self.products) + 5) // 6)
+
+
+class Visitor:
+    """One worker's guest and customer sessions, and the state of the customer's cart."""
+
+    def __init__(self, catalog, customer, rng):
+        self.catalog = catalog
+        self.rng = rng
+        self.guest = Client(raise_request_exception=False)
+        self.customer = Client(raise_request_exception=False)
+        self.customer.force_login(customer)
+        self.user = customer
+        self.cart_lines = 0
+
+    def timed(self, endpoint, send):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count))
+            start = time.perf_counter()
+            response = send()
+            seconds = time.perf_counter() - start
+        return Sample(endpoint, seconds, len(queries), response.status_code)
+
+    def product(self):
+        return self.rng.choice(self.catalog.products)
+
+    def fill_cart(self):
+        product = self.product()
+        choices = self.catalog.variations.get(product.id, {})
+        data = {category: self.rng.choice(values) for category, values in choices.items()}
+        return lambda: self.customer.post(reverse('add_cart', args=[product.id]), data)
+
+    # endpoints
+
+    def home(self):
+        return self.timed('home', lambda: self.guest.get(reverse('home')))
+
+    def store(self):
+        params = {'page': self.rng.randint(1, self.catalog.pages())}
+        if self.catalog.categories and self.rng.random() < 0.5:
+            url = reverse('products_by_category', args=[self.rng.choice(self.catalog.categories)])
+            params = {}
+        else:
+            url = reverse('store')
+        return self.timed('store', lambda: self.guest.get(url, params))
+
+    def search(self):
+        keyword = self.rng.choice(KEYWORDS)
+        return self.timed('search', lambda: self.guest.get(reverse('search'), {'keyword': keyword}))
+
+    def product_detail(self):
+        url = self.product().get_url()
+        return self.timed('product_detail', lambda: self.guest.get(url))
+
+    def add_cart(self):
+        sample = self.timed('add_cart', self.fill_cart())
+        self.cart_lines += 1
+        return sample
+
+    def checkout(self):
+        if not self.cart_lines:
+            self.fill_cart()()
+            self.cart_lines += 1
+        return self.timed('checkout', lambda: self.customer.get(reverse('checkout')))
+
+    def payments(self):
+        if not self.cart_lines:
+            self.fill_cart()()
+        placed = self.timed('payments', lambda: self.customer.post(reverse('place_order'), ADDRESS))
+        order = Order.objects.filter(user=self.user, is_ordered=False).order_by('-id').first()
+        if order is None:
+            # place_order didn't create the order (empty cart, invalid form): a failed payment
+            return Sample('payments', placed.seconds, placed.queries, placed.status if placed.status >= 400 else 500)
+        body = {'orderID': order.order_number, 'transID': 'bench-%d' % order.id, 'payment_method': 'PayPal', 'status': 'COMPLETED'}
+        sample = self.timed('payments', lambda: self.customer.post(reverse('payments'), json.dumps(body), content_type='application/json'))
+        self.cart_lines = 0
+        return sample
+
+
+def run_mix(mix, requests=1000, duration=None, workers=4, warmup=0, seed=0, catalog=None):
+    """Send `requests` requests (or as many as fit in `duration` seconds, or both) picked from
+    `mix` by `workers` concurrent visitors, after `warmup` untimed requests to each
+    endpoint per visitor. Returns the samples and the elapsed time in seconds."""
+    catalog = catalog or Catalog()
+    if not catalog.products or len(catalog.customers) < workers:
+        raise ValueError('Seed the benchmark catalog first: it needs products and at least %d customers.' % workers)
+    weights = MIXES[mix] if isinstance(mix, str) else mix
+    endpoints, weights = list(weights), list(weights.values())
+    samples = []
+    lock = threading.Lock()
+    remaining = [float('inf') if requests is None else requests]
+    clock = {}
+
+    def start_clock():
+        clock['start'] = time.perf_counter()
+        clock['deadline'] = clock['start'] + duration if duration else None
+
+    # the clock starts when every visitor has finished its warm-up
+    barrier = threading.Barrier(workers, action=start_clock)
+
+    def take():
+        with lock:
+            if remaining[0] <= 0 or (clock['deadline'] and time.perf_counter() >= clock['deadline']):
+                return False
+            remaining[0] -= 1
+            return True
+
+    def work(index):
+        try:
+            visitor = Visitor(catalog, catalog.customers[index], random.Random('%s-%d' % (seed, index)))
+            for endpoint in endpoints:
+                for _ in range(warmup):
+                    getattr(visitor, endpoint)()
+        except BaseException:
+            barrier.abort()
+            raise
+        barrier.wait()
+        local = []
+        while take():
+            local.append(getattr(visitor, visitor.rng.choices(endpoints, weights)[0])())
+        with lock:
+            samples.extend(local)
+
+    def work_in_thread(index):
+        try:
+            work(index)
+        finally:
+            # each thread opened its own connections
+            connections.close_all()
+
+    if workers == 1:
+        # in the calling thread, so it sees the caller's transaction (e.g. in tests)
+        work(0)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(work_in_thread, i) for i in range(workers)]
+            for future in futures:
+                future.result()
+    return samples, time.perf_counter() - clock['start']
@@ -1,20 +1,8 @@
 from .models import Cart, CartItem
 from category.models import Category
-from .views import _cart_id
+from .views import _cart_totals
 
 def counter(request): 
-    cart_count = 0
     if 'admin' in request.path:
         return {}
-    else:
-        try:
-            cart = Cart.objects.filter(cart_id=_cart_id(request))
-            if request.user.is_authenticated:
-                cart_items = CartItem.objects.all().filter(user=request.user)
-            else:
-                cart_items = CartItem.objects.all().filter(cart=cart[:1])
-            for cart_item in cart_items:
-                cart_count += cart_item.quantity
-        except Cart.DoesNotExist:
-            cart_count = 0
-    return dict(cart_count=cart_count)
\ No newline at end of file
+    return dict(cart_count=_cart_totals(request)['quantity'])
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.6 on 2026-10-19 13:50
+
+from django.db import migrations, models
+
+
+def backfill_variation_key(apps, schema_editor):
+    # compute the signature for existing rows and fold duplicates into one row
+    # so the unique constraints below can be created
+    CartItem = apps.get_model('carts', 'CartItem')
+    seen = {}
+    for item in CartItem.objects.prefetch_related('variations').order_by('id'):
+        item.variation_key = '-'.join(str(pk) for pk in sorted(v.id for v in item.variations.all()))
+        owner = ('user', item.user_id) if item.user_id is not None else ('cart', item.cart_id)
+        signature = (owner, item.product_id, item.variation_key)
+        if signature in seen:
+            kept = seen[signature]
+            kept.quantity += item.quantity
+            kept.save(update_fields=['quantity'])
+            item.delete()
+        else:
+            item.save(update_fields=['variation_key'])
+            seen[signature] = item
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='variation_key',
+            field=models.CharField(blank=True, default='', max_length=250),
+        ),
+        migrations.RunPython(backfill_variation_key, migrations.RunPython.noop),
+    ]
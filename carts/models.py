@@ -1,9 +1,29 @@
+from decimal import Decimal
+from django.conf import settings
 from django.db import models
+from django.db.models import F, Sum
 from store.models import Product, Variation
 from django.contrib.auth.models import User
 from accounts.models import Account
 
 # Create your models here.
+def variation_key(variations):
+    # sorted variation ids, e.g. "3-7", so equal selections always map to the same cart row
+    return '-'.join(str(pk) for pk in sorted(variation.id for variation in variations))
+
+class CartItemQuerySet(models.QuerySet):
+    def totals(self):
+        # subtotal, quantity, tax and grand total of the selected items in one aggregate query
+        totals = self.aggregate(total=Sum(F('product__price') * F('quantity')), quantity=Sum('quantity'))
+        total = Decimal(totals['total'] or 0)
+        tax = (total * settings.TAX_RATE).quantize(Decimal('0.01'))
+        return {
+            'total': total,
+            'quantity': totals['quantity'] or 0,
+            'tax': tax,
+            'grand_total': total + tax,
+        }
+
 class Cart(models.Model):
     cart_id = models.CharField(max_length=250, blank=True)
     date_added = models.DateField(auto_now_add=True)
@@ -15,10 +35,19 @@ class CartItem(models.Model):
     user = models.ForeignKey(Account, on_delete=models.CASCADE, null=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     variations = models.ManyToManyField('store.Variation', blank=True)
+    variation_key = models.CharField(max_length=250, blank=True, default='')
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, null=True)
     quantity = models.IntegerField()
     is_active = models.BooleanField(default=True)
 
+    objects = CartItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product', 'variation_key'], condition=models.Q(user__isnull=False), name='unique_user_cart_item'),
+            models.UniqueConstraint(fields=['cart', 'product', 'variation_key'], condition=models.Q(user__isnull=True), name='unique_guest_cart_item'),
+        ]
+
     def sub_total(self):
         return self.product.price * self.quantity
 
@@ -1,3 +1,183 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import Account
+from category.models import Category
+from store.models import Product, Variation
+from .models import Cart, CartItem, variation_key
 
 # Create your tests here.
+def create_product():
+    category = Category.objects.create(category_name='Shirts', slug='shirts')
+    product = Product.objects.create(product_name='Shirt', slug='shirt', price=10, images='photos/products/shirt.jpg', stock=100, category=category)
+    Variation.objects.create(product=product, variation_category='color', variation_value='red')
+    Variation.objects.create(product=product, variation_category='size', variation_value='medium')
+    return product
+
+def fill_cart(user, category, lines):
+    # one product per line, each with a color and a size variation
+    start = Product.objects.count()
+    for i in range(start, start + lines):
+        product = Product.objects.create(product_name='Product %d' % i, slug='product-%d' % i, price=5, images='photos/products/p.jpg', stock=10, category=category)
+        color = Variation.objects.create(product=product, variation_category='color', variation_value='blue')
+        size = Variation.objects.create(product=product, variation_category='size', variation_value='large')
+        cart_item = CartItem.objects.create(user=user, product=product, quantity=2, variation_key=variation_key([color, size]))
+        cart_item.variations.add(color, size)
+
+def create_user(username):
+    user = Account.objects.create_user(first_name='Test', last_name='User', username=username, email=username + '@example.com', password='password')
+    user.is_active = True
+    user.save()
+    return user
+
+
+class AddCartTest(TestCase):
+    def setUp(self):
+        self.product = create_product()
+        self.url = reverse('add_cart', args=[self.product.id])
+
+    def test_same_variations_increase_quantity(self):
+        self.client.post(self.url, {'color': 'Red', 'size': 'Medium'})
+        self.client.post(self.url, {'size': 'medium', 'color': 'red'})
+        self.client.post(self.url, {'color': 'red'})
+
+        quantities = sorted(CartItem.objects.values_list('quantity', flat=True))
+        self.assertEqual(quantities, [1, 2])
+
+    def test_customer_items_are_upserted_per_variation(self):
+        user = create_user('shopper')
+        self.client.force_login(user)
+        for data in ({'color': 'red'}, {'color': 'red'}, {'color': 'red', 'size': 'medium'}):
+            self.client.post(self.url, data)
+
+        items = {item.variation_key: item for item in CartItem.objects.filter(user=user, cart=None).prefetch_related('variations')}
+        red, medium = Variation.objects.get(variation_value='red'), Variation.objects.get(variation_value='medium')
+        self.assertEqual(set(items), {variation_key([red]), variation_key([red, medium])})
+        self.assertEqual(items[variation_key([red])].quantity, 2)
+        self.assertEqual(set(items[variation_key([red, medium])].variations.all()), {red, medium})
+
+    def test_remove_cart_decreases_then_deletes(self):
+        self.client.post(self.url, {'color': 'red'})
+        self.client.post(self.url, {'color': 'red'})
+        cart_item = CartItem.objects.get()
+        remove_url = reverse('remove_cart', args=[self.product.id, cart_item.id])
+
+        self.client.get(remove_url)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+        self.client.get(remove_url)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_login_merges_guest_cart(self):
+        user = create_user('shopper')
+        self.client.post(self.url, {'color': 'red'})
+        self.client.post(self.url, {'color': 'red'})
+        CartItem.objects.create(user=user, product=self.product, quantity=3, variation_key=CartItem.objects.get().variation_key)
+
+        self.client.post(reverse('login'), {'email': user.email, 'password': 'password'})
+
+        cart_item = CartItem.objects.get()
+        self.assertEqual((cart_item.user, cart_item.quantity), (user, 5))
+
+    def test_session_with_duplicate_carts(self):
+        self.client.post(self.url, {'color': 'red'})
+        cart = Cart.objects.get()
+        Cart.objects.create(cart_id=cart.cart_id)
+
+        self.client.post(self.url, {'color': 'red'})
+        cart_item = CartItem.objects.get()
+        self.assertEqual((cart_item.cart, cart_item.quantity), (cart, 2))
+        response = self.client.get(reverse('remove_cart_item', args=[self.product.id, cart_item.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CartTotalsTest(TestCase):
+    def setUp(self):
+        self.product = create_product()
+        self.user = create_user('shopper')
+        self.client.force_login(self.user)
+        CartItem.objects.create(user=self.user, product=self.product, quantity=3)
+
+    def test_totals_in_one_query(self):
+        with self.assertNumQueries(1):
+            totals = CartItem.objects.filter(user=self.user).totals()
+        self.assertEqual(totals, {'total': Decimal('30'), 'quantity': 3, 'tax': Decimal('0.60'), 'grand_total': Decimal('30.60')})
+
+    def test_cart_and_checkout_agree(self):
+        cart = self.client.get(reverse('cart')).context
+        checkout = self.client.get(reverse('checkout')).context
+        for key in ('total', 'quantity', 'tax', 'grand_total'):
+            self.assertEqual(cart[key], checkout[key])
+        self.assertEqual(cart['cart_count'], 3)
+
+
+class CartQueryBudgetTest(TestCase):
+    def test_cart_page_query_count_is_fixed(self):
+        user = create_user('shopper')
+        self.client.force_login(user)
+        category = create_product().category
+
+        fill_cart(user, category, 1)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('cart'))
+        small_queries = len(small)
+
+        fill_cart(user, category, 49)
+        with self.assertNumQueries(small_queries):
+            response = self.client.get(reverse('cart'))
+        self.assertContains(response, 'Large', count=50 * 2)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class AddCartConcurrencyTest(TransactionTestCase):
+    def test_parallel_add_cart(self):
+        product = create_product()
+        user = create_user('shopper')
+        url = reverse('add_cart', args=[product.id])
+
+        def add(_):
+            client = Client()
+            client.force_login(user)
+            try:
+                client.post(url, {'color': 'red'})
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(add, range(40)))
+
+        cart_item = CartItem.objects.get(user=user)
+        self.assertEqual(cart_item.quantity, 40)
+
+
+class VariationKeyBackfillTest(TransactionTestCase):
+    migrate_from = [('carts', '0001_initial')]
+    migrate_to = [('carts', '0003_cartitem_unique_cart_item')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_existing_items_get_their_key_and_duplicates_are_merged(self):
+        product = create_product()
+        user = create_user('shopper')
+        red, medium = Variation.objects.get(variation_value='red'), Variation.objects.get(variation_value='medium')
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        apps = executor.loader.project_state(self.migrate_from).apps
+        OldCartItem = apps.get_model('carts', 'CartItem')
+        for quantity, variations in ((1, [red, medium]), (2, [medium, red]), (4, [red]), (8, [])):
+            item = OldCartItem.objects.create(user_id=user.id, product_id=product.id, quantity=quantity)
+            item.variations.set([variation.id for variation in variations])
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+
+        quantities = dict(CartItem.objects.values_list('variation_key', 'quantity'))
+        self.assertEqual(quantities, {variation_key([red, medium]): 3, variation_key([red]): 4, '': 8})
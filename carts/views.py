@@ -1,8 +1,9 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from . import views
-from .models import Product, Cart, CartItem
+from .models import Product, Cart, CartItem, variation_key
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
 from django.http import HttpResponse
-from django.core.exceptions import ObjectDoesNotExist
 from store.models import Product, Variation
 from django.contrib.auth.decorators import login_required
 
@@ -10,152 +11,57 @@ from django.contrib.auth.decorators import login_required
 def _cart_id(request):
     cart = request.session.session_key
     if not cart:
-        cart = request.session.create()
+        request.session.create()
+        cart = request.session.session_key
     return cart
 
+def _product_variations(request, product):
+    # resolve all posted variation choices (e.g. color, size) in a single query
+    selection = Q()
+    if request.method == 'POST':
+        for key, value in request.POST.items():
+            selection |= Q(variation_category__iexact=key, variation_value__iexact=value)
+    if not selection:
+        return []
+    return list(Variation.objects.filter(selection, product=product))
+
 def add_cart(request, product_id):
     current_user = request.user
     product = Product.objects.get(id=product_id) # get the product
+    product_variation = _product_variations(request, product)
 
-    # if the user is authenticated
+    # cart items are owned by the user if authenticated, otherwise by the session cart
     if current_user.is_authenticated:
-        product_variation = []
-        if request.method == 'POST':
-            for item in request.POST:
-                key = item
-                value = request.POST[key]
-                
-                try:
-                    variation = Variation.objects.get(product=product, variation_category__iexact=key, variation_value__iexact=value)
-                    product_variation.append(variation)
-                except: 
-                    pass 
-
-
-        is_cart_item_exists = CartItem.objects.filter(product=product, user=current_user).exists()
-        if is_cart_item_exists:
-            cart_item = CartItem.objects.filter(product=product, user=current_user)
-            # existing_variations -> database
-            # current variation -> product_variation
-            # item_id -> database
-            ex_var_list = []
-            id = []
-            for item in cart_item:
-                existing_variation = item.variations.all()
-                ex_var_list.append(list(existing_variation))
-                id.append(item.id)
-
-            if product_variation in ex_var_list:
-                # increase the quantity
-                index = ex_var_list.index(product_variation)
-                item_id = id[index]
-                item = CartItem.objects.get(product=product, id=item_id)
-                item.quantity += 1
-                item.save()
-            
-            else:
-                # add new item
-                item = CartItem.objects.create(product=product, quantity=1, user=current_user)
-                if len(product_variation) > 0:
-                    item.variations.clear()  # clear any existing variations
-                    item.variations.add(*product_variation)
-                item.save()
-
-        else:
-            cart_item = CartItem.objects.create(
-                product = product,
-                quantity = 1,
-                user = current_user
-                )
-            if len(product_variation) > 0:
-                cart_item.variations.clear()  # clear any existing variations
-                cart_item.variations.add(*product_variation)
-            cart_item.save()
-
-        #return HttpResponse(cart_item.product)
-        return redirect('cart')
-    
-    # if user is not authenticated
+        owner = {'user': current_user}
     else:
-        product_variation = []
-        if request.method == 'POST':
-            for item in request.POST:
-                key = item
-                value = request.POST[key]
-                
-                try:
-                    variation = Variation.objects.get(product=product, variation_category__iexact=key, variation_value__iexact=value)
-                    product_variation.append(variation)
-                except: 
-                    pass 
+        # cart_id isn't unique and older sessions may have several carts; use the first one
+        cart_id = _cart_id(request) # get cart ID from session (browser cookie)
+        cart = Cart.objects.filter(cart_id=cart_id).order_by('id').first() or Cart.objects.create(cart_id=cart_id)
+        owner = {'cart': cart, 'user': None}
 
-        try:
-            cart = Cart.objects.get(cart_id=_cart_id(request)) # get cart ID from session (browser cookie)
-        
-        except Cart.DoesNotExist:
-            cart = Cart.objects.create(
-                cart_id = _cart_id(request)
-                )
-            cart.save()
+    lookup = dict(owner, product=product, variation_key=variation_key(product_variation))
 
-        is_cart_item_exists = CartItem.objects.filter(product=product, cart=cart).exists()
-        if is_cart_item_exists:
-            cart_item = CartItem.objects.filter(product=product, cart=cart)
-            # existing_variations -> database
-            # current variation -> product_variation
-            # item_id -> database
-            ex_var_list = []
-            id = []
-            for item in cart_item:
-                existing_variation = item.variations.all()
-                ex_var_list.append(list(existing_variation))
-                id.append(item.id)
-
-            if product_variation in ex_var_list:
-                # increase the quantity
-                index = ex_var_list.index(product_variation)
-                item_id = id[index]
-                item = CartItem.objects.get(product=product, id=item_id)
-                item.quantity += 1
-                item.save()
-            
-            else:
-                # add new item
-                item = CartItem.objects.create(product=product, quantity=1, cart=cart)
+    # increase the quantity of the matching item, or add a new item
+    if not CartItem.objects.filter(**lookup).update(quantity=F('quantity') + 1):
+        try:
+            with transaction.atomic():
+                cart_item = CartItem.objects.create(quantity=1, **lookup)
                 if len(product_variation) > 0:
-                    item.variations.clear()  # clear any existing variations
-                    item.variations.add(*product_variation)
-                item.save()
+                    cart_item.variations.add(*product_variation)
+        except IntegrityError:
+            # a concurrent request created the same item first
+            CartItem.objects.filter(**lookup).update(quantity=F('quantity') + 1)
 
-        else:
-            cart_item = CartItem.objects.create(
-                product = product,
-                quantity = 1,
-                cart = cart
-                )
-            if len(product_variation) > 0:
-                cart_item.variations.clear()  # clear any existing variations
-                cart_item.variations.add(*product_variation)
-            cart_item.save()
-
-        #return HttpResponse(cart_item.product)
-        return redirect('cart')
+    return redirect('cart')
 
 def remove_cart(request, product_id, cart_item_id):
-    product = Product.objects.get(id=product_id)
-    try:
-        if request.user.is_authenticated:
-            cart_item = CartItem.objects.get(product=product, user=request.user, id=cart_item_id)
-        else:
-            cart = Cart.objects.get(cart_id=_cart_id(request)) # get cart ID from session (browser cookie)
-            cart_item = CartItem.objects.get(product=product, cart=cart, id=cart_item_id)
-        if cart_item.quantity > 1:
-            cart_item.quantity -= 1
-            cart_item.save()
-        else:
-            cart_item.delete()
-    except:
-        pass
+    if request.user.is_authenticated:
+        cart_item = CartItem.objects.filter(product_id=product_id, user=request.user, id=cart_item_id)
+    else:
+        cart_item = CartItem.objects.filter(product_id=product_id, cart__cart_id=_cart_id(request), id=cart_item_id) # get cart ID from session (browser cookie)
+    # decrease the quantity in place; the last one removes the item
+    if not cart_item.filter(quantity__gt=1).update(quantity=F('quantity') - 1):
+        cart_item.filter(quantity__lte=1).delete()
     return redirect('cart')
 
 def remove_cart_item(request, product_id, cart_item_id):
@@ -163,63 +69,48 @@ def remove_cart_item(request, product_id, cart_item_id):
     if request.user.is_authenticated:
         cart_item = CartItem.objects.get(product=product, user=request.user, id=cart_item_id)
     else:
-        cart = Cart.objects.get(cart_id=_cart_id(request)) # get cart ID from session (browser cookie)
-        cart_item = CartItem.objects.get(product=product, cart=cart, id=cart_item_id)
+        cart_item = CartItem.objects.get(product=product, cart__cart_id=_cart_id(request), id=cart_item_id) # get cart ID from session (browser cookie)
     
     cart_item.delete()
     return redirect('cart')
 
-#@login_required(login_url='login')
-def cart(request, total=0, quantity=0, cart_items=None):
-    try:
-        tax = 0
-        grand_total = 0
-        if request.user.is_authenticated:
-            cart_items = CartItem.objects.filter(user=request.user, is_active=True)
-        else:
-            cart = Cart.objects.get(cart_id=_cart_id(request))
-            cart_items = CartItem.objects.filter(cart=cart, is_active=True)
-        for cart_item in cart_items: 
-            total += (cart_item.product.price * cart_item.quantity)
-            quantity += cart_item.quantity
-        tax = total * 0.05
-        grand_total = total + tax
-    except ObjectDoesNotExist:
-        pass #ignore 
+def _cart_items(request):
+    # active items of the user's cart, or of the session cart for guests
+    if request.user.is_authenticated:
+        cart_items = CartItem.objects.filter(user=request.user, is_active=True)
+    elif request.session.session_key:
+        cart_items = CartItem.objects.filter(cart__cart_id=request.session.session_key, is_active=True) # get cart ID from session (browser cookie)
+    else:
+        # reading the cart doesn't create a session, a visitor without one has no cart
+        cart_items = CartItem.objects.none()
+    return cart_items.select_related('product__category').prefetch_related('variations')
+
+def _cart_totals(request):
+    # computed once per request and shared by the views and the cart counter
+    if not hasattr(request, '_cart_totals'):
+        request._cart_totals = _cart_items(request).totals()
+    return request._cart_totals
 
+#@login_required(login_url='login')
+def cart(request):
+    totals = _cart_totals(request)
     context = {
-        'total': total,
-        'quantity': quantity,
-        'cart_items': cart_items,
-        'tax': tax,
-        'grand_total': grand_total,
+        'total': totals['total'],
+        'quantity': totals['quantity'],
+        'cart_items': _cart_items(request),
+        'tax': totals['tax'],
+        'grand_total': totals['grand_total'],
     }
-
     return render(request, 'store/cart.html', context)
 
 @login_required(login_url='login')
-def checkout(request, total=0, quantity=0, cart_items=None):
-    try:
-        tax = 0
-        grand_total = 0
-        if request.user.is_authenticated:
-            cart_items = CartItem.objects.filter(user=request.user, is_active=True)
-        else:
-            cart = Cart.objects.get(cart_id=_cart_id(request))
-            cart_items = CartItem.objects.filter(cart=cart, is_active=True)
-        for cart_item in cart_items:
-            total += (cart_item.product.price * cart_item.quantity)
-            quantity += cart_item.quantity
-        tax = total * 0.05
-        grand_total = total + tax
-    except ObjectDoesNotExist:
-        pass #just ignore
-
+def checkout(request):
+    totals = _cart_totals(request)
     context = {
-        'total': total,
-        'quantity': quantity,
-        'cart_items': cart_items,
-        'tax'       : tax,
-        'grand_total': grand_total,
+        'total': totals['total'],
+        'quantity': totals['quantity'],
+        'cart_items': _cart_items(request),
+        'tax': totals['tax'],
+        'grand_total': totals['grand_total'],
     }
-    return render(request, 'store/checkout.html', context)
\ No newline at end of file
+    return render(request, 'store/checkout.html', context)
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from accounts.models import Account
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Benchmark order creation with the generated order number against the old save-twice-and-refetch flow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000, help='number of orders to create per run')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        user = Account.objects.filter(is_active=True).first()
+
+        for name, create in (('save twice + refetch', self.create_legacy), ('numbered insert', self.create_numbered)):
+            # everything is rolled back, the benchmark leaves no orders behind
+            with transaction.atomic():
+                queries = []
+                with connection.execute_wrapper(lambda execute, sql, params, many, context: queries.append(sql) or execute(sql, params, many, context)):
+                    start = time.perf_counter()
+                    for i in range(count):
+                        create(user)
+                    elapsed = time.perf_counter() - start
+                transaction.set_rollback(True)
+
+            self.stdout.write('%-22s %6d orders  %8.1f orders/s  %5.2f queries/order' % (name, count, count / elapsed, len(queries) / count))
+
+    def new_order(self, user):
+        return Order(user=user, first_name='Bench', last_name='Mark', phone='555', email='bench@example.com', address_line_1='1 Main St', country='US', state='WA', city='Seattle', order_total=0, tax=0)
+
+    def create_legacy(self, user):
+        order = self.new_order(user)
+        order.order_number = ''
+        order.save()
+        order.order_number = order.created_at.strftime('%Y%m%d') + str(order.id)
+        order.save()
+        return Order.objects.get(user=user, is_ordered=False, order_number=order.order_number)
+
+    def create_numbered(self, user):
+        order = self.new_order(user)
+        order.save()
+        return order
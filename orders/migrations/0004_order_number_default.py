@@ -0,0 +1,19 @@
+# Generated by Django 4.2.6 on 2026-10-19 13:58
+
+from django.db import migrations, models
+import orders.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_number',
+            field=models.CharField(db_index=True, default=orders.models.generate_order_number, max_length=20),
+        ),
+    ]
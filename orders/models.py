@@ -1,11 +1,20 @@
+import secrets
 from django.db import models
+from django.utils import timezone
 from accounts.models import Account
 from store.models import Product, Variation
 
+def generate_order_number():
+    # date, seconds of the day and 7 random digits, e.g. 20210305 04512 8812937:
+    # sorts by creation time and is assigned before the INSERT, so the order is saved once
+    now = timezone.now()
+    seconds = now.hour * 3600 + now.minute * 60 + now.second
+    return '%s%05d%07d' % (now.strftime('%Y%m%d'), seconds, secrets.randbelow(10 ** 7))
+
 # Create your models here.
 class Payment(models.Model):
     user = models.ForeignKey(Account, on_delete=models.CASCADE)
-    payment_id = models.CharField(max_length=100)
+    payment_id = models.CharField(max_length=100, db_index=True)
     payment_method = models.CharField(max_length=100)
     amount_paid = models.CharField(max_length=100) # this is the total amount paid
     status = models.CharField(max_length=100)
@@ -23,11 +32,13 @@ class Order(models.Model):
         ('Shipped', 'Shipped'),
         ('Completed', 'Completed'),
         ('Cancelled', 'Cancelled'),
+        # paid, but a product sold out before the payment was recorded
+        ('Refund', 'Refund'),
     )
 
     user = models.ForeignKey(Account, on_delete=models.SET_NULL, null=True)
     payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, blank=True, null=True)
-    order_number = models.CharField(max_length=20)
+    order_number = models.CharField(max_length=20, db_index=True, default=generate_order_number)
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
     phone = models.CharField(max_length=15)
@@ -46,6 +57,15 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_ordered', 'created_at'], name='order_history_idx'),
+        ]
+        constraints = [
+            # partial because legacy rows, created before order_number had a default, may be
+            # blank; new orders always get a number
+            models.UniqueConstraint(fields=['order_number'], condition=~models.Q(order_number=''), name='unique_order_number'),
+        ]
 
     def full_name(self):
         return f'{self.first_name} {self.last_name}'
@@ -1,3 +1,151 @@
-from django.test import TestCase
+import json
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from carts.models import CartItem
+from carts.tests import create_product, create_user, fill_cart
+from store.models import Product
+from .models import Order, OrderProduct, Payment, generate_order_number
 
 # Create your tests here.
+def create_order(user, order_number):
+    return Order.objects.create(user=user, order_number=order_number, first_name='Test', last_name='User', phone='555', email=user.email, address_line_1='1 Main St', country='US', state='WA', city='Seattle', order_total=20, tax=0)
+ADDRESS = {'first_name': 'Test', 'last_name': 'User', 'phone': '555', 'email': 'shopper@example.com', 'address_line_1': '1 Main St', 'country': 'US', 'state': 'WA', 'city': 'Seattle'}
+
+def pay(client, order_number, trans_id='T-1'):
+    body = {'orderID': order_number, 'transID': trans_id, 'payment_method': 'PayPal', 'status': 'COMPLETED'}
+    return client.post(reverse('payments'), json.dumps(body), content_type='application/json')
+
+
+class PaymentsTest(TestCase):
+    def setUp(self):
+        self.user = create_user('shopper')
+        self.client.force_login(self.user)
+        self.category = create_product().category
+
+    def test_order_lines_keep_variations(self):
+        fill_cart(self.user, self.category, 3)
+        create_order(self.user, 'ORD-1')
+
+        response = pay(self.client, 'ORD-1')
+
+        self.assertEqual(response.json(), {'order_number': 'ORD-1', 'transID': 'T-1'})
+        self.assertEqual(OrderProduct.objects.filter(variations__variation_value='blue').count(), 3)
+        self.assertEqual(set(Product.objects.filter(product_name__startswith='Product').values_list('stock', flat=True)), {8})
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        fill_cart(self.user, self.category, 1)
+        create_order(self.user, 'ORD-1')
+        with CaptureQueriesContext(connection) as small:
+            pay(self.client, 'ORD-1')
+        small_queries = len(small)
+
+        fill_cart(self.user, self.category, 25)
+        create_order(self.user, 'ORD-2')
+        with self.assertNumQueries(small_queries):
+            pay(self.client, 'ORD-2', 'T-2')
+
+    def test_oversell_is_rejected(self):
+        fill_cart(self.user, self.category, 2)
+        Product.objects.filter(product_name='Product 2').update(stock=1)
+        create_order(self.user, 'ORD-1')
+
+        response = pay(self.client, 'ORD-1')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('refunded', response.json()['error'])
+        # the captured payment is kept and the order flagged for a refund
+        order = Order.objects.get(order_number='ORD-1')
+        self.assertEqual((order.is_ordered, order.status, order.payment), (False, 'Refund', Payment.objects.get()))
+        self.assertFalse(OrderProduct.objects.exists())
+        self.assertEqual(pay(self.client, 'ORD-1', 'T-2').status_code, 404)
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertEqual(Product.objects.get(product_name='Product 1').stock, 10)
+
+    def test_place_order_numbers_order_in_one_insert(self):
+        fill_cart(self.user, self.category, 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('place_order'), ADDRESS)
+        writes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+
+        order = Order.objects.get()
+        self.assertEqual(response.context['order'], order)
+        self.assertRegex(order.order_number, r'^\d{20}$')
+        self.assertEqual(len(writes), 1)
+
+    def test_order_number_collision_is_retried_in_a_transaction(self):
+        fill_cart(self.user, self.category, 1)
+        # the test runs in a transaction, as the view does under ATOMIC_REQUESTS
+        with mock.patch('orders.models.timezone.now', return_value=timezone.now()), \
+                mock.patch('orders.models.secrets.randbelow', return_value=5), \
+                mock.patch('orders.views.generate_order_number', return_value='RETRIED'):
+            taken = create_order(self.user, generate_order_number()).order_number
+            response = self.client.post(reverse('place_order'), ADDRESS)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.exclude(order_number=taken).get().order_number, 'RETRIED')
+
+    def test_payment_and_order_complete_pages_query_count_is_fixed(self):
+        queries = []
+        for lines in (1, 50):
+            fill_cart(self.user, self.category, lines)
+            with CaptureQueriesContext(connection) as payment_page:
+                response = self.client.post(reverse('place_order'), ADDRESS)
+            payment_queries = len(payment_page)
+            order_number = response.context['order'].order_number
+            pay(self.client, order_number, 'T-%s' % order_number)
+            with CaptureQueriesContext(connection) as complete_page:
+                response = self.client.get(reverse('order_complete'), {'order_number': order_number, 'payment_id': 'T-%s' % order_number})
+            self.assertContains(response, 'Large', count=lines)
+            queries.append((payment_queries, len(complete_page)))
+
+        self.assertEqual(queries[0], queries[1])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class PaymentsConcurrencyTest(TransactionTestCase):
+    def setUp(self):
+        self.product = create_product()
+
+    def pay(self, user, order_number, trans_id):
+        client = Client()
+        client.force_login(user)
+        try:
+            body = {'orderID': order_number, 'transID': trans_id, 'payment_method': 'PayPal', 'status': 'COMPLETED'}
+            return client.post(reverse('payments'), json.dumps(body), content_type='application/json').status_code
+        finally:
+            connection.close()
+
+    def test_parallel_checkouts_decrement_stock(self):
+        users = [create_user('shopper%d' % i) for i in range(20)]
+        for user in users:
+            CartItem.objects.create(user=user, product=self.product, quantity=2)
+            create_order(user, 'ORD-%d' % user.id)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            statuses = list(pool.map(lambda user: self.pay(user, 'ORD-%d' % user.id, 'T-%d' % user.id), users))
+
+        self.assertEqual(statuses, [200] * 20)
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 100 - 2 * 20)
+        self.assertEqual(OrderProduct.objects.count(), 20)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_duplicate_payment_is_rejected(self):
+        user = create_user('shopper')
+        CartItem.objects.create(user=user, product=self.product, quantity=3)
+        create_order(user, 'ORD-1')
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            statuses = list(pool.map(lambda i: self.pay(user, 'ORD-1', 'T-%d' % i), range(4)))
+
+        self.assertEqual(sorted(statuses), [200, 404, 404, 404])
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 97)
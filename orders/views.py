@@ -1,9 +1,11 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Value, When
 from django.http import HttpResponse, JsonResponse
 from carts.models import CartItem
+from carts.views import _cart_items, _cart_totals
 from .forms import OrderForm
-import datetime
-from .models import Order, Payment, OrderProduct
+from .models import Order, Payment, OrderProduct, generate_order_number
 import json
 from store.models import Product
 from django.core.mail import EmailMessage
@@ -13,50 +15,70 @@ from django.template.loader import render_to_string
 
 def payments(request):
     body = json.loads(request.body)
-    order = Order.objects.get(user=request.user, is_ordered=False, order_number=body['orderID'])
-
-    # Store transaction details inside Payment model
-    payment = Payment(
-        user = request.user,
-        payment_id = body['transID'],
-        payment_method = body['payment_method'],
-        amount_paid = order.order_total,
-        status = body['status'],
-    )
-    payment.save()
-
-    order.payment = payment
-    order.is_ordered = True
-    order.save()
-
-    # Move the cart items to Order Product table
-    cart_items = CartItem.objects.filter(user=request.user)
-
-    for item in cart_items:
-        orderproduct = OrderProduct()
-        orderproduct.order_id = order.id
-        orderproduct.payment = payment
-        orderproduct.user_id = request.user.id
-        orderproduct.product_id = item.product_id
-        orderproduct.quantity = item.quantity
-        orderproduct.product_price = item.product.price
-        orderproduct.ordered = True
-        orderproduct.save()
-
-        cart_item = CartItem.objects.get(id=item.id)
-        product_variation = cart_item.variations.all()
-        orderproduct = OrderProduct.objects.get(id=orderproduct.id)
-        orderproduct.variations.set(product_variation)
-        orderproduct.save()
-
-
-        # Reduce the quantity of the sold products
-        product = Product.objects.get(id=item.product_id)
-        product.stock -= item.quantity
-        product.save()
-
-    # Clear cart
-    CartItem.objects.filter(user=request.user).delete()
+
+    with transaction.atomic():
+        # lock the order so a replayed or concurrent payment for it is rejected
+        order = get_object_or_404(Order.objects.select_for_update(), user=request.user, is_ordered=False, status='New', order_number=body['orderID'])
+
+        # Store transaction details inside Payment model
+        payment = Payment(
+            user = request.user,
+            payment_id = body['transID'],
+            payment_method = body['payment_method'],
+            amount_paid = order.order_total,
+            status = body['status'],
+        )
+        payment.save()
+
+        order.payment = payment
+        # the order and its lines are rolled back to here when a product sold out, the payment is kept
+        checkout = transaction.savepoint()
+        order.is_ordered = True
+        order.save(update_fields=['payment', 'is_ordered', 'updated_at'])
+
+        # Move the cart items to Order Product table
+        # locked so a concurrent add_cart waits instead of incrementing an item that is being checked out
+        cart_items = list(CartItem.objects.select_for_update(of=('self',)).filter(user=request.user).select_related('product').prefetch_related('variations'))
+
+        orderproducts = OrderProduct.objects.bulk_create([
+            OrderProduct(
+                order = order,
+                payment = payment,
+                user = request.user,
+                product_id = item.product_id,
+                quantity = item.quantity,
+                product_price = item.product.price,
+                ordered = True,
+            )
+            for item in cart_items
+        ])
+
+        OrderProduct.variations.through.objects.bulk_create([
+            OrderProduct.variations.through(orderproduct_id=orderproduct.id, variation_id=variation.id)
+            for orderproduct, item in zip(orderproducts, cart_items)
+            for variation in item.variations.all()
+        ])
+
+        # Reduce the quantity of the sold products in one statement; products without enough stock are not updated
+        sold = {}
+        for item in cart_items:
+            sold[item.product_id] = sold.get(item.product_id, 0) + item.quantity
+        if sold:
+            in_stock = Q()
+            for product_id, quantity in sold.items():
+                in_stock |= Q(id=product_id, stock__gte=quantity)
+            updated = Product.objects.filter(in_stock).update(stock=F('stock') - Case(*[When(id=product_id, then=Value(quantity)) for product_id, quantity in sold.items()]))
+            if updated != len(sold):
+                # PayPal has already captured the payment: keep it and flag the order for a refund,
+                # the customer keeps their cart
+                transaction.savepoint_rollback(checkout)
+                order.is_ordered = False
+                order.status = 'Refund'
+                order.save(update_fields=['payment', 'status', 'updated_at'])
+                return JsonResponse({'error': 'Some products in your cart are out of stock. Your payment will be refunded.'}, status=409)
+
+        # Clear cart (only the items checked out above)
+        CartItem.objects.filter(id__in=[item.id for item in cart_items]).delete()
 
     # Send order recieved email to customer
     # mail_subject = 'Thank you for your order!'
@@ -75,22 +97,18 @@ def payments(request):
     }
     return JsonResponse(data)
 
-def place_order(request, total=0, quantity=0,):
+def place_order(request):
     current_user = request.user
 
     # If the cart count is less than or equal to 0, then redirect back to shop
-    cart_items = CartItem.objects.filter(user=current_user)
-    cart_count = cart_items.count()
-    if cart_count <= 0:
+    totals = _cart_totals(request)
+    if totals['quantity'] <= 0:
         return redirect('store')
 
-    grand_total = 0
-    tax = 0
-    for cart_item in cart_items:
-        total += (cart_item.product.price * cart_item.quantity)
-        quantity += cart_item.quantity
-    tax = (2 * total)/100
-    grand_total = total + tax
+    cart_items = _cart_items(request)
+    total = totals['total']
+    tax = totals['tax']
+    grand_total = totals['grand_total']
 
     if request.method == 'POST':
         form = OrderForm(request.POST)
@@ -111,20 +129,20 @@ def place_order(request, total=0, quantity=0,):
             data.order_total = grand_total
             data.tax = tax
             data.ip = request.META.get('REMOTE_ADDR')
-            data.save()
-            # Generate order number
-            yr = int(datetime.date.today().strftime('%Y'))
-            dt = int(datetime.date.today().strftime('%d'))
-            mt = int(datetime.date.today().strftime('%m'))
-            d = datetime.date(yr,mt,dt)
-            current_date = d.strftime("%Y%m%d") #20210305
-            order_number = current_date + str(data.id)
-            data.order_number = order_number
-            data.save()
-
-            order = Order.objects.get(user=current_user, is_ordered=False, order_number=order_number)
+            # order_number is generated with the row; retry on the rare collision
+            # (each attempt in its own savepoint, so a failed INSERT doesn't break an outer transaction)
+            for attempt in range(3):
+                try:
+                    with transaction.atomic():
+                        data.save()
+                    break
+                except IntegrityError:
+                    if attempt == 2:
+                        raise
+                    data.order_number = generate_order_number()
+
             context = {
-                'order': order,
+                'order': data,
                 'cart_items': cart_items,
                 'total': total,
                 'tax': tax,
@@ -141,7 +159,7 @@ def order_complete(request):
 
     try:
         order = Order.objects.get(order_number=order_number, is_ordered=True)
-        ordered_products = OrderProduct.objects.filter(order_id=order.id)
+        ordered_products = OrderProduct.objects.filter(order_id=order.id).select_related('product').prefetch_related('variations')
 
         subtotal = 0
         for i in ordered_products:
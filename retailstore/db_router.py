@@ -0,0 +1,81 @@
+# Read replica routing
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+REPLICA_DATABASE = 'replica'
+PIN_COOKIE = 'pin_primary'
+
+# apps whose reads may be served by the replica (catalog and order history)
+REPLICA_APPS = {'store', 'category', 'orders'}
+
+# quoted table prefixes of those apps, e.g. "store_product"
+REPLICA_TABLES = tuple('"%s_' % app for app in REPLICA_APPS)
+
+# bookkeeping tables of those apps no page reads back, so writing them doesn't pin a client
+# to the primary: the rate limits every model call takes from (store/ratelimit.py)
+UNPINNED_TABLES = ('"store_modelratelimit"',)
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_configured():
+    return REPLICA_DATABASE in settings.DATABASES
+
+
+def read_from_replica(view):
+    """Serve the catalog and order reads of a view from the replica, unless the
+    client wrote to the primary within the last REPLICA_LAG_SECONDS."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _replica_reads.set(PIN_COOKIE not in request.COOKIES)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and model._meta.app_label in REPLICA_APPS and replica_configured():
+            return REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_DATABASE
+
+
+class PrimaryPinMiddleware:
+    """Sets a short-lived cookie after any request that wrote replica-served tables, so
+    the client's next reads see its own writes instead of possibly lagging replica data."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        writes = []
+
+        def watch_writes(execute, sql, params, many, context):
+            if (sql.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE') and any(table in sql for table in REPLICA_TABLES)
+                    and not any(table in sql for table in UNPINNED_TABLES)):
+                writes.append(sql)
+            return execute(sql, params, many, context)
+
+        with connections['default'].execute_wrapper(watch_writes):
+            response = self.get_response(request)
+
+        if writes:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_LAG_SECONDS, httponly=True, samesite='Lax')
+        return response
@@ -1,6 +1,14 @@
 # AWS S3 Media Files Configuration
 from storages.backends.s3boto3 import S3Boto3Storage
 
+from .media_urls import media_url
+
 class MediaStorage(S3Boto3Storage):
     location = 'media'
-    file_overwrite = False
\ No newline at end of file
+    file_overwrite = False
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        # plain file URLs come from the media URL resolver, without a backend call each
+        if parameters or expire or http_method:
+            return super().url(name, parameters, expire, http_method)
+        return media_url(name)
@@ -0,0 +1,134 @@
+# Media file URLs built by string formatting from a base URL the process keeps,
+# instead of a storage backend call per image.
+#
+# MEDIA_URL_SIGNING chooses how URLs are signed:
+#   ''           public URLs, MEDIA_URL + the file name (the bucket's media is public-read)
+#   's3'         S3 presigned URLs; each file's URL is cached and reused until less
+#                than MEDIA_URL_REFRESH seconds of it are left
+#   'cloudfront' CloudFront signed URLs; one custom policy for everything under MEDIA_URL
+#                is signed per MEDIA_URL_EXPIRE period and appended to every URL
+# MediaStorage.url (and so every FieldFile.url in templates), the responsive_image tag
+# and the views all go through the resolver.
+
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.encoding import filepath_to_uri
+
+# presigned URLs cached per process, beyond which the cache starts over
+MAX_CACHED_URLS = 10000
+
+
+class MediaURLResolver:
+    """URLs of media files named relative to `base_url`. `presign(name, expire)` returns
+    a presigned URL of one file, `cloudfront_signer` is a botocore CloudFrontSigner;
+    without either, URLs are public."""
+    def __init__(self, base_url, presign=None, cloudfront_signer=None, expire=3600, refresh=900, clock=time.time):
+        self.base_url = base_url
+        self.presign = presign
+        self.cloudfront_signer = cloudfront_signer
+        self.expire = expire
+        self.refresh = refresh
+        self.clock = clock
+        self._signed = {}
+        self._policy = (None, 0)
+        self._lock = threading.Lock()
+
+    def url(self, name):
+        return self.urls([name])[0]
+
+    def urls(self, names):
+        """URLs of all `names`; signatures missing from the cache are made in one pass."""
+        if self.cloudfront_signer:
+            query = self._policy_query()
+            return ['%s%s?%s' % (self.base_url, filepath_to_uri(name), query) for name in names]
+        if not self.presign:
+            return [self.base_url + filepath_to_uri(name) for name in names]
+
+        now = self.clock()
+        urls = []
+        for name in names:
+            url, expires = self._signed.get(name, (None, 0))
+            if expires - now < self.refresh:
+                if len(self._signed) >= MAX_CACHED_URLS:
+                    self._signed.clear()
+                url = self.presign(name, self.expire)
+                self._signed[name] = (url, now + self.expire)
+            urls.append(url)
+        return urls
+
+    def _policy_query(self):
+        # a wildcard policy doesn't depend on the file, so its query string fits every URL
+        query, expires = self._policy
+        now = self.clock()
+        if expires - now >= self.refresh:
+            return query
+        with self._lock:
+            query, expires = self._policy
+            if expires - now < self.refresh:
+                expires = now + self.expire
+                policy = self.cloudfront_signer.build_policy(self.base_url + '*', datetime.fromtimestamp(expires, timezone.utc))
+                query = self.cloudfront_signer.generate_presigned_url(self.base_url, policy=policy).split('?', 1)[1]
+                self._policy = (query, expires)
+        return query
+
+    def external(self, url):
+        """URL to show for a stored `url`, which may carry an expired signature: a file
+        under MEDIA_URL gets a URL from the resolver, other URLs lose their query string."""
+        url = url.split('?', 1)[0]
+        if url.startswith(self.base_url):
+            return self.url(url[len(self.base_url):])
+        return url
+
+
+def _from_settings():
+    signing = settings.MEDIA_URL_SIGNING
+    options = {'expire': settings.MEDIA_URL_EXPIRE, 'refresh': settings.MEDIA_URL_REFRESH}
+    if signing == 's3':
+        from utils import backends
+        client = backends.client('s3')
+
+        def presign(name, expire):
+            return client.generate_presigned_url(
+                'get_object', Params={'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Key': 'media/' + name}, ExpiresIn=expire)
+
+        return MediaURLResolver(settings.MEDIA_URL, presign=presign, **options)
+    if signing == 'cloudfront':
+        from .media_store import MediaStorage
+        signer = MediaStorage().cloudfront_signer
+        if signer is None:
+            raise ImproperlyConfigured('MEDIA_URL_SIGNING=cloudfront needs AWS_CLOUDFRONT_KEY and AWS_CLOUDFRONT_KEY_ID')
+        return MediaURLResolver(settings.MEDIA_URL, cloudfront_signer=signer, **options)
+    if signing:
+        raise ImproperlyConfigured('Unknown MEDIA_URL_SIGNING %r, use s3 or cloudfront' % signing)
+    return MediaURLResolver(settings.MEDIA_URL, **options)
+
+
+_resolver = None
+
+
+def resolver():
+    global _resolver
+    if _resolver is None:
+        _resolver = _from_settings()
+    return _resolver
+
+
+@receiver(setting_changed)
+def _reset_resolver(setting, **kwargs):
+    global _resolver
+    if setting.startswith('MEDIA_URL') or setting.startswith('AWS_'):
+        _resolver = None
+
+
+def media_url(name):
+    return resolver().url(name)
+
+
+def media_urls(names):
+    return resolver().urls(names)
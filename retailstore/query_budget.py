@@ -0,0 +1,118 @@
+# Per-request SQL query budget
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('query_budget')
+
+# literals and IN lists that make otherwise identical queries look different
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_shape(sql):
+    """The SQL with literals and parameter lists replaced, so the queries of an N+1
+    loop, which differ only in their parameters, have the same shape."""
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = _IN_LIST.sub('IN (...)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+def view_budget(view_name):
+    """Budget of a view from QUERY_BUDGETS: a number of queries, or a dict with any of
+    'queries', 'duplicates' and 'db_ms'. Views without one get QUERY_BUDGET_DEFAULT."""
+    budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None))
+    if budget is None:
+        return {}
+    if isinstance(budget, int):
+        return {'queries': budget}
+    return budget
+
+
+class QueryStats:
+    """Queries a request ran on any database, their time and their shapes."""
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+            self.shapes[query_shape(sql)] += 1
+
+    @property
+    def duplicates(self):
+        # queries that repeat an earlier query's shape
+        return sum(count - 1 for count in self.shapes.values())
+
+    def repeated(self, limit=3):
+        return [(shape, count) for shape, count in self.shapes.most_common(limit) if count > 1]
+
+
+class QueryBudgetMiddleware:
+    """Counts the queries, database time and duplicate query shapes of each request,
+    reports them in a Server-Timing header and logs the requests over their view's
+    budget (QUERY_BUDGETS). With QUERY_BUDGET_STRICT a request over budget raises
+    QueryBudgetExceeded instead, which fails the test that made it."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        timings = [
+            'db;dur=%.1f;desc="%d queries"' % (stats.seconds * 1000, stats.queries),
+            'db-dup;desc="%d duplicate queries"' % stats.duplicates,
+            'app;dur=%.1f' % (elapsed * 1000),
+        ]
+        if response.has_header('Server-Timing'):
+            timings.insert(0, response['Server-Timing'])
+        response['Server-Timing'] = ', '.join(timings)
+
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        over = self.over_budget(view_name, stats) if view_name else []
+        if over:
+            message = json.dumps({
+                'event': 'query_budget_exceeded',
+                'view': view_name,
+                'path': request.path,
+                'over': over,
+                'queries': stats.queries,
+                'duplicates': stats.duplicates,
+                'db_ms': round(stats.seconds * 1000, 1),
+                'repeated': [{'count': count, 'sql': shape[:500]} for shape, count in stats.repeated()],
+            })
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def over_budget(self, view_name, stats):
+        budget = view_budget(view_name)
+        actual = {'queries': stats.queries, 'duplicates': stats.duplicates, 'db_ms': stats.seconds * 1000}
+        return ['%s %s > %s' % (key, round(actual[key], 1), limit) for key, limit in budget.items() if actual[key] > limit]
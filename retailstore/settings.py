@@ -11,10 +11,11 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
 from pathlib import Path
+from decimal import Decimal
 import os
 from decouple import config
-import boto3
 import json
+from utils import backends
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve(strict=True).parent.parent
@@ -56,14 +57,19 @@ INSTALLED_APPS = [
     'store',
     'carts',
     'orders',
+    'benchmarks',
 ]
 
 MIDDLEWARE = [
+    # first, so the session and authentication queries are traced and counted too
+    'retailstore.tracing.TracingMiddleware',
+    'retailstore.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'retailstore.db_router.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -96,8 +102,11 @@ AUTH_USER_MODEL = 'accounts.Account'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# AWS services, or local stand-ins for running without AWS (see utils/backends.py): aws or local
+AWS_BACKEND = backends.AWS_BACKEND
+
 # Initialize secrets manager
-secrets = boto3.client('secretsmanager')
+secrets = backends.client('secretsmanager')
 response = secrets.get_secret_value(
     SecretId='postgresdb-secret'
 )
@@ -121,6 +130,17 @@ DATABASES = {
         }
     }
 
+# Aurora reader endpoint for catalog, order history and Q&A reads.
+# When it is not configured every read goes to the writer.
+dbreaderhost = config('DB_READER_HOST', default=database_secrets.get('readerHost', ''))
+if dbreaderhost:
+    DATABASES['replica'] = dict(DATABASES['default'], HOST=dbreaderhost, TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['retailstore.db_router.ReplicaRouter']
+
+# Seconds a client keeps reading from the writer after its own writes
+REPLICA_LAG_SECONDS = config('REPLICA_LAG_SECONDS', default=5, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -157,7 +177,10 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
-AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME')
+if AWS_BACKEND == 'local':
+    AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME', default='retailstore-local')
+else:
+    AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME')
 AWS_S3_CUSTOM_DOMAIN = '%s.s3.amazonaws.com' % AWS_STORAGE_BUCKET_NAME
 AWS_S3_OBJECT_PARAMETERS = {
     'CacheControl': 'max-age=86400',
@@ -171,6 +194,27 @@ STATICFILES_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
 
 DEFAULT_FILE_STORAGE = 'retailstore.media_store.MediaStorage'
 
+# Media URLs (retailstore/media_urls.py) are MEDIA_URL + the file name, on the CloudFront
+# distribution MEDIA_CDN_DOMAIN if there is one. MEDIA_URL_SIGNING is '' (public), 's3' (presigned)
+# or 'cloudfront' (signed with AWS_CLOUDFRONT_KEY, a PEM private key, of AWS_CLOUDFRONT_KEY_ID)
+MEDIA_CDN_DOMAIN = config('MEDIA_CDN_DOMAIN', default='')
+MEDIA_URL = 'https://%s/media/' % (MEDIA_CDN_DOMAIN or AWS_S3_CUSTOM_DOMAIN)
+MEDIA_URL_SIGNING = config('MEDIA_URL_SIGNING', default='')
+AWS_CLOUDFRONT_KEY = config('AWS_CLOUDFRONT_KEY', default='').encode('ascii') or None
+AWS_CLOUDFRONT_KEY_ID = config('AWS_CLOUDFRONT_KEY_ID', default='') or None
+# seconds signed URLs are valid, and left when they are signed again
+MEDIA_URL_EXPIRE = config('MEDIA_URL_EXPIRE', default=3600, cast=int)
+MEDIA_URL_REFRESH = config('MEDIA_URL_REFRESH', default=900, cast=int)
+
+if AWS_BACKEND == 'local':
+    # media files live where the local S3 stand-in keeps the bucket's media/ objects
+    STATIC_URL = '/static/'
+    STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+    DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+    MEDIA_URL = '/media/'
+    MEDIA_ROOT = backends.LOCAL_STORAGE_ROOT / AWS_STORAGE_BUCKET_NAME / 'media'
+    MEDIA_URL_SIGNING = ''
+
 from django.contrib.messages import constants as messages
 
 MESSAGE_TAGS = {
@@ -185,3 +229,75 @@ EMAIL_HOST_PASSWORD = 'yyyy'
 EMAIL_USE_TLS = True
 
 DEFAULT_AUTO_FIELD='django.db.models.AutoField'
+
+# Model calls refresh_review_summaries may spend per hour, across all runs
+REVIEW_SUMMARY_CALLS_PER_HOUR = config('REVIEW_SUMMARY_CALLS_PER_HOUR', default=100, cast=int)
+
+# Client-side limits of the Bedrock model calls per model id (utils/ratelimit.py): requests per second,
+# tokens per minute and calls in flight per process, about 90% of Bedrock's default on-demand quotas; set
+# them below your account's. Models not listed are not limited. A call waits at most
+# BEDROCK_RATE_LIMIT_MAX_WAIT seconds for its turn, then fails as throttled. The buckets are shared by the
+# workers through the database, or kept in each process with BEDROCK_RATE_LIMIT_STORE=local.
+BEDROCK_RATE_LIMITS = {
+    'anthropic.claude-instant-v1': {'requests_per_second': 15, 'tokens_per_minute': 270000, 'concurrency': 8},
+    'amazon.titan-tg1-large': {'requests_per_second': 6, 'tokens_per_minute': 270000, 'concurrency': 8},
+    'amazon.titan-embed-g1-text-02': {'requests_per_second': 30, 'tokens_per_minute': 270000, 'concurrency': 8},
+    'stability.stable-diffusion-xl': {'requests_per_second': 1, 'concurrency': 2},
+}
+BEDROCK_RATE_LIMIT_MAX_WAIT = config('BEDROCK_RATE_LIMIT_MAX_WAIT', default=20, cast=float)
+BEDROCK_RATE_LIMIT_STORE = config('BEDROCK_RATE_LIMIT_STORE', default='database')
+# Identical model calls (same model and body) made while one is in flight in the process wait for it
+# and share its response (utils/singleflight.py), for at most this many seconds; 0 turns it off
+BEDROCK_COALESCE_TIMEOUT = config('BEDROCK_COALESCE_TIMEOUT', default=60, cast=float)
+
+# Background uploads and deletes of generated images (store/storage.py): worker threads per
+# process (0 runs them in the request) and attempts per S3 operation
+STORAGE_WORKER_THREADS = config('STORAGE_WORKER_THREADS', default=2, cast=int)
+STORAGE_ATTEMPTS = config('STORAGE_ATTEMPTS', default=4, cast=int)
+
+# Tax applied to the cart subtotal on the cart, checkout and payment pages
+TAX_RATE = Decimal(config('TAX_RATE', default='0.02'))
+
+# Bearer token Prometheus sends to scrape /metrics; the endpoint is disabled when empty
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Most queries a request to each view may run (retailstore/query_budget.py); either a number of
+# queries or a dict with any of 'queries', 'duplicates' (queries repeating an earlier query's
+# shape) and 'db_ms'. Requests over budget are logged, or fail with QUERY_BUDGET_STRICT.
+QUERY_BUDGETS = {
+    'home': {'queries': 6, 'duplicates': 0},
+    'store': {'queries': 8, 'duplicates': 0},
+    'products_by_category': {'queries': 8, 'duplicates': 0},
+    'search': {'queries': 6, 'duplicates': 0},
+    'product_detail': {'queries': 16, 'duplicates': 2},
+    'cart': 8,
+    'add_cart': 20,
+    'checkout': 8,
+    'place_order': 12,
+    'payments': 20,
+}
+# budget in queries of the views not listed; 0 for none
+QUERY_BUDGET_DEFAULT = config('QUERY_BUDGET_DEFAULT', default=0, cast=int) or None
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=False, cast=bool)
+
+# Request tracing (retailstore/tracing.py): '' (off), 'memory' (kept in the process, for tests and
+# the shell) or 'file' (OTLP/JSON lines appended to TRACING_FILE); see the trace_report command
+TRACING_EXPORTER = config('TRACING_EXPORTER', default='')
+TRACING_FILE = config('TRACING_FILE', default=str(BASE_DIR / 'traces.jsonl'))
+# share of requests traced
+TRACING_SAMPLE_RATE = config('TRACING_SAMPLE_RATE', default=1.0, cast=float)
+
+# Bedrock calls are logged as one JSON object per line by the "bedrock" logger (utils/instrumentation.py),
+# requests over their query budget by the "query_budget" logger, the GenAI features by the "store" loggers
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'bedrock': {'handlers': ['console'], 'level': config('BEDROCK_LOG_LEVEL', default='INFO'), 'propagate': False},
+        'query_budget': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+        'store': {'handlers': ['console'], 'level': config('STORE_LOG_LEVEL', default='INFO'), 'propagate': False},
+    },
+}
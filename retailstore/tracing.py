@@ -0,0 +1,90 @@
+# Request tracing (see utils/tracing.py)
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from utils import tracing
+
+TRACE_HEADER = 'X-Trace-Id'
+
+
+def configure_from_settings():
+    """Set up the exporter chosen by TRACING_EXPORTER; returns False when tracing is off."""
+    name = settings.TRACING_EXPORTER
+    if name == 'memory':
+        exporter = tracing.InMemoryExporter()
+    elif name == 'file':
+        exporter = tracing.FileExporter(settings.TRACING_FILE)
+    elif not name:
+        tracing.configure(None)
+        return False
+    else:
+        raise ValueError('Unknown TRACING_EXPORTER %r, use memory or file' % name)
+    tracing.configure(exporter, settings.TRACING_SAMPLE_RATE)
+    tracing.instrument()
+    _instrument_templates()
+    return True
+
+
+def _trace_queries(execute, sql, params, many, context):
+    connection = context['connection']
+    with tracing.db_span(sql, connection.vendor, connection.settings_dict.get('NAME'), **{'db.django.alias': connection.alias}):
+        token = tracing.orm_query.set(True)
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            tracing.orm_query.reset(token)
+
+
+_templates_instrumented = False
+
+
+def _instrument_templates():
+    # every template, including the ones {% include %} renders, gets a span
+    global _templates_instrumented
+    if _templates_instrumented:
+        return
+    _templates_instrumented = True
+    from django.template.base import Template
+
+    render = Template.render
+
+    def traced_render(self, context):
+        with tracing.span('render %s' % (self.origin.template_name or self.name or 'template'), {'component': 'render'}):
+            return render(self, context)
+
+    Template.render = traced_render
+
+
+class TracingMiddleware:
+    """Records a trace of each request with TRACING_EXPORTER set: a span for the request
+    with the ORM queries, template rendering and the botocore, requests and psycopg2 calls
+    made for it underneath. The trace id is returned in the X-Trace-Id header."""
+    def __init__(self, get_response):
+        if not configure_from_settings():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        attributes = {'http.method': request.method, 'http.target': request.path}
+        with tracing.span('%s %s' % (request.method, request.path), attributes, kind=tracing.SERVER, root=True,
+                          parent=request.headers.get('traceparent')) as root:
+            if not isinstance(root, tracing.Span):
+                # not sampled
+                return self.get_response(request)
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_trace_queries))
+                response = self.get_response(request)
+            match = request.resolver_match
+            if match:
+                # named by route, so requests to the same view are aggregated together
+                route = '/' + match.route
+                root.name = '%s %s' % (request.method, route)
+                root.set_attribute('http.route', route)
+                root.set_attribute('django.view', match.view_name)
+            root.set_attribute('http.status_code', response.status_code)
+            response[TRACE_HEADER] = root.trace_id
+        return response
@@ -1,11 +1,19 @@
+import os
+import secrets
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
 from store.models import Product, ReviewRating
+from .db_router import read_from_replica
 
 
 
 
+@read_from_replica
 def home(request):
-    products = Product.objects.all().filter(is_available=True).order_by('created_date')
+    products = Product.objects.all().filter(is_available=True).select_related('category').with_ratings().order_by('created_date')
 
     # Get the reviews
     reviews = None
@@ -16,4 +24,18 @@ def home(request):
         'products': products,
         'reviews': reviews,
     }
-    return render(request, 'home.html', context)
\ No newline at end of file
+    return render(request, 'home.html', context)
+
+
+def metrics(request):
+    # Prometheus scrape endpoint, only for requests with the METRICS_TOKEN bearer token
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not settings.METRICS_TOKEN or not secrets.compare_digest(token, settings.METRICS_TOKEN):
+        raise Http404
+
+    # with several worker processes, each writes its metrics to PROMETHEUS_MULTIPROC_DIR
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
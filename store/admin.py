@@ -1,7 +1,9 @@
 from django.contrib import admin
+from django.db import transaction
 from .models import Product
 from .models import Variation
-from .models import Product, ReviewRating, ProductGallery
+from .models import Product, ReviewRating, ProductGallery, Draft
+from . import storage
 import admin_thumbnails
 
 # Register your models here.
@@ -10,18 +12,43 @@ import admin_thumbnails
 class ProductGalleryInline(admin.TabularInline):
     model = ProductGallery
     extra = 1
+    readonly_fields = ('derivatives',)
+
+# the derivatives of uploaded images are generated in the background (store/storage.py)
+def _generate_derivatives(instance, field):
+    transaction.on_commit(lambda: storage.worker().submit(storage.refresh_derivatives, instance, field))
 
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('product_name','price','stock','category','modified_date','is_available')
     prepopulated_fields = {'slug':('product_name',)}
+    readonly_fields = ('derivatives',)
     inlines = [ProductGalleryInline]
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'images' in form.changed_data:
+            _generate_derivatives(obj, 'images')
+
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        if formset.model is ProductGallery:
+            changed = [gallery for gallery, fields in formset.changed_objects if 'image' in fields]
+            for gallery in formset.new_objects + changed:
+                _generate_derivatives(gallery, 'image')
+
 class VariationAdmin(admin.ModelAdmin):
     list_display = ('product','variation_category','variation_value','is_active')
     list_editable = ('is_active',)
     list_filter = ('product','variation_category','variation_value')
 
+class DraftAdmin(admin.ModelAdmin):
+    list_display = ('product','kind','user','created_date','modified_date')
+    list_filter = ('kind',)
+    list_select_related = ('product','user')
+    search_fields = ('product__product_name',)
+
 admin.site.register(Product, ProductAdmin)
 admin.site.register(Variation, VariationAdmin)
 admin.site.register(ReviewRating)
 admin.site.register(ProductGallery)
+admin.site.register(Draft, DraftAdmin)
@@ -0,0 +1,95 @@
+# Materialized views used by the question answering feature (ask_question).
+# They precompute the aggregates customers and managers ask about most, so the
+# generated SQL can read a few small tables instead of joining the live ones.
+# Migrations create the views with their own copy of the SQL: a change to a view
+# here needs a new migration dropping and creating it.
+
+ANALYTICS_VIEWS = [
+    {
+        'name': 'analytics_sales_by_product_day',
+        'description': 'Units sold, revenue and number of orders per product per day (UTC) for completed orders.',
+        'columns': 'product_id, product_name, product_brand, category_name, sale_date, units_sold, revenue, order_count',
+        'unique': ['product_id', 'sale_date'],
+        'query': """
+            SELECT op.product_id, p.product_name, p.product_brand, c.category_name,
+                   (o.created_at AT TIME ZONE 'UTC')::date AS sale_date,
+                   SUM(op.quantity) AS units_sold,
+                   SUM(op.quantity * op.product_price) AS revenue,
+                   COUNT(DISTINCT op.order_id) AS order_count
+            FROM orders_orderproduct op
+            JOIN orders_order o ON o.id = op.order_id
+            JOIN store_product p ON p.id = op.product_id
+            JOIN category_category c ON c.id = p.category_id
+            WHERE o.is_ordered
+            GROUP BY op.product_id, p.product_name, p.product_brand, c.category_name, sale_date
+        """,
+    },
+    {
+        'name': 'analytics_inventory_status',
+        'description': "Current stock per product with a stock_status of 'in stock', 'low stock' (under 10) or 'out of stock', and units sold in the last 30 days.",
+        'columns': 'product_id, product_name, product_brand, category_name, price, stock, is_available, stock_status, units_sold_last_30_days',
+        'unique': ['product_id'],
+        'query': """
+            SELECT p.id AS product_id, p.product_name, p.product_brand, c.category_name,
+                   p.price, p.stock, p.is_available,
+                   CASE WHEN p.stock <= 0 THEN 'out of stock'
+                        WHEN p.stock < 10 THEN 'low stock'
+                        ELSE 'in stock' END AS stock_status,
+                   COALESCE(recent.units_sold, 0) AS units_sold_last_30_days
+            FROM store_product p
+            JOIN category_category c ON c.id = p.category_id
+            LEFT JOIN (
+                SELECT op.product_id, SUM(op.quantity) AS units_sold
+                FROM orders_orderproduct op
+                JOIN orders_order o ON o.id = op.order_id
+                WHERE o.is_ordered AND o.created_at >= now() - interval '30 days'
+                GROUP BY op.product_id
+            ) recent ON recent.product_id = p.id
+        """,
+    },
+    {
+        'name': 'analytics_product_rating_stats',
+        'description': 'Approved review statistics per product: number of reviews, average, lowest and highest rating, positive (4 and above) and negative (2 and below) review counts.',
+        'columns': 'product_id, product_name, category_name, review_count, average_rating, lowest_rating, highest_rating, positive_reviews, negative_reviews',
+        'unique': ['product_id'],
+        'query': """
+            SELECT p.id AS product_id, p.product_name, c.category_name,
+                   COUNT(r.id) AS review_count,
+                   ROUND(AVG(r.rating)::numeric, 2) AS average_rating,
+                   MIN(r.rating) AS lowest_rating,
+                   MAX(r.rating) AS highest_rating,
+                   COUNT(r.id) FILTER (WHERE r.rating >= 4) AS positive_reviews,
+                   COUNT(r.id) FILTER (WHERE r.rating <= 2) AS negative_reviews
+            FROM store_product p
+            JOIN category_category c ON c.id = p.category_id
+            LEFT JOIN store_reviewrating r ON r.product_id = p.id AND r.status
+            GROUP BY p.id, p.product_name, c.category_name
+        """,
+    },
+]
+
+
+def create_views(cursor):
+    for view in ANALYTICS_VIEWS:
+        cursor.execute('CREATE MATERIALIZED VIEW IF NOT EXISTS %s AS %s' % (view['name'], view['query']))
+        # a unique index is required to refresh the view concurrently
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS %s_key ON %s (%s)' % (view['name'], view['name'], ', '.join(view['unique'])))
+
+
+def drop_views(cursor):
+    for view in ANALYTICS_VIEWS:
+        cursor.execute('DROP MATERIALIZED VIEW IF EXISTS %s' % view['name'])
+
+
+def refresh_views(cursor, concurrently=True):
+    # CONCURRENTLY keeps the views readable while they are rebuilt
+    for view in ANALYTICS_VIEWS:
+        cursor.execute('REFRESH MATERIALIZED VIEW %s%s' % ('CONCURRENTLY ' if concurrently else '', view['name']))
+
+
+def describe_views():
+    # schema context appended to the prompt of ask_question
+    lines = ['Precomputed analytics views (refreshed periodically, prefer them for totals, rankings, stock and rating questions):']
+    for view in ANALYTICS_VIEWS:
+        lines.append('- %s(%s): %s' % (view['name'], view['columns'], view['description']))
+    return '\n'.join(lines)
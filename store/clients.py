@@ -0,0 +1,43 @@
+# AWS clients of the GenAI features, created on first use instead of when the views are
+# imported, so that starting a worker doesn't build (or, with an assumed role, call STS for)
+# clients the requests it serves may never need.
+import os
+import threading
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _client(name, create):
+    # boto3 clients can't be created from several threads at once
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = create()
+    return client
+
+
+def bedrock():
+    """The instrumented Bedrock runtime client (utils/instrumentation.py), rate limited
+    per model (store/ratelimit.py), on which identical concurrent calls are made once"""
+    def create():
+        from django.conf import settings
+        from utils.bedrock import get_bedrock_client
+        from utils.singleflight import SingleFlight
+        from .ratelimit import limiter
+        timeout = settings.BEDROCK_COALESCE_TIMEOUT
+        return get_bedrock_client(assumed_role=os.environ.get("BEDROCK_ASSUME_ROLE", None), region=os.environ.get("AWS_DEFAULT_REGION", None),
+                                  limiter=limiter(), coalescer=SingleFlight(timeout) if timeout else None)
+    return _client('bedrock', create)
+
+
+def s3():
+    from utils import backends
+    return _client('s3', lambda: backends.client('s3'))
+
+
+def secrets():
+    from utils import backends
+    return _client('secretsmanager', lambda: backends.client('secretsmanager'))
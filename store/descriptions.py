@@ -0,0 +1,171 @@
+# Product description generation, shared by the generate_description page and the
+# generate_product_descriptions command that drafts descriptions for many products.
+#
+# The command selects products, looks up their colors in one query per batch, sends
+# the prompts to the model from a bounded thread pool (backing off when Bedrock
+# throttles) and stores the results as description drafts, one INSERT per batch.
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from botocore.exceptions import ClientError
+from langchain import PromptTemplate
+
+from utils.instrumentation import THROTTLING_CODES
+from .models import Draft, Product, Variation
+from .ratelimit import closing_connections
+from .summarizer import estimate_tokens
+
+# longest pause between two attempts, in seconds
+MAX_BACKOFF = 30
+
+# Create a prompt template that has 6 input variables:
+# product name
+# product brand
+# product color
+# product category (shirt, jeans etc.)
+# product details, and max length of the description requested from LLM.
+DESCRIPTION_PROMPT = PromptTemplate(
+    input_variables=["brand", "colors", "category", "length", "name","details"],
+    template="""
+            Human: Create a catchy product description for a {category} from the brand {brand}.
+            Product name is {name}.
+            The number of words should be less than {length}.
+
+            Following are the product details:
+
+            <product_details>
+            {details}
+            </product_details>
+
+            Briefly mention about all the available colors of the product.
+
+            Example: Available colors are Blue, Purple and Orange.
+
+            If the <available_colors> is empty, don't mention anything about the color of the product.
+
+            <available_colors>
+            {colors}
+            </available_colors>
+
+            Assistant:
+
+            """
+)
+
+
+def extract_description(response):
+    """The model answers with an introduction line followed by the description;
+    keep only the description."""
+    response = response.strip()
+    if '\n' not in response:
+        return response
+    return response[response.index('\n')+1:].strip()
+
+
+def select_products(categories=None, ids=None, empty=False, include_drafted=False):
+    products = Product.objects.select_related('category').order_by('id')
+    if categories:
+        products = products.filter(category__slug__in=categories)
+    if ids:
+        products = products.filter(id__in=ids)
+    if empty:
+        products = products.filter(description='')
+    if not include_drafted:
+        # lets an interrupted run pick up where it stopped
+        products = products.exclude(draft__kind='description')
+    return products
+
+
+def product_colors(products):
+    """Active colors of each product, keyed by product id, in one query."""
+    colors = {product.id: [] for product in products}
+    variations = (Variation.objects.colors()
+                  .filter(product_id__in=colors)
+                  .order_by('id')
+                  .values_list('product_id', 'variation_value'))
+    for product_id, color in variations:
+        colors[product_id].append(color)
+    return colors
+
+
+def build_prompt(product, colors, length):
+    return DESCRIPTION_PROMPT.format(brand=product.product_brand,
+                                     colors=', '.join(colors),
+                                     category=product.category,
+                                     length=length,
+                                     name=product.product_name,
+                                     details=product.description)
+
+
+def is_throttled(exc):
+    # langchain re-raises Bedrock errors as ValueError, the ClientError is its context
+    while exc is not None:
+        if isinstance(exc, ClientError) and exc.response.get('Error', {}).get('Code') in THROTTLING_CODES:
+            return True
+        if any(code in str(exc) for code in THROTTLING_CODES):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def call_with_retries(llm, prompt, retries=5, backoff=1.0, sleep=time.sleep):
+    """Call `llm`, retrying throttled calls with exponential backoff and full jitter.
+    Returns (response, retries used); other errors are raised straight away."""
+    attempt = 0
+    while True:
+        try:
+            return llm(prompt), attempt
+        except Exception as e:
+            if attempt >= retries or not is_throttled(e):
+                raise
+            sleep(random.uniform(0, min(MAX_BACKOFF, backoff * 2 ** attempt)))
+            attempt += 1
+
+
+def generate_descriptions(llm, products, length=100, workers=4, batch_size=50, retries=5, backoff=1.0, on_error=None):
+    """Draft descriptions of `products` with at most `workers` concurrent model calls,
+    saving a description draft per product every `batch_size` products.
+    Returns counters for reporting throughput and cost."""
+    stats = dict(products=0, drafted=0, failed=0, retries=0, input_tokens=0, output_tokens=0)
+
+    @closing_connections
+    def describe(product, colors):
+        prompt = build_prompt(product, colors, length)
+        response, attempts = call_with_retries(llm, prompt, retries, backoff)
+        return prompt, response, attempts
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in batches(products, batch_size):
+            colors = product_colors(batch)
+            futures = {pool.submit(describe, product, colors[product.id]): product for product in batch}
+            drafts = []
+            for future in as_completed(futures):
+                product = futures[future]
+                stats['products'] += 1
+                try:
+                    prompt, response, attempts = future.result()
+                except Exception as e:
+                    stats['failed'] += 1
+                    if on_error:
+                        on_error(product, e)
+                    continue
+                stats['retries'] += attempts
+                stats['input_tokens'] += estimate_tokens(prompt)
+                stats['output_tokens'] += estimate_tokens(response)
+                drafts.append(Draft(kind='description', product=product, prompt=prompt, text=extract_description(response)))
+            Draft.objects.bulk_create(drafts)
+            stats['drafted'] += len(drafts)
+    return stats
+
+
+def batches(queryset, size):
+    # keyset over ids, so rows drafted by earlier batches don't shift the next ones
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
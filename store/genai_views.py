@@ -0,0 +1,848 @@
+# The GenAI features of the store: product descriptions, review responses, design ideas,
+# review summaries, question answering and vector search.
+#
+# urls.py imports this module when one of its pages is first requested, so workers don't
+# load langchain, PIL, numpy and psycopg2 at startup, and the AWS clients are created
+# on first use (store/clients.py).
+from django.shortcuts import render, redirect
+from .models import Draft, Product, ReviewRating, ReviewResponseBatch, ProductGallery, Variation
+from django.shortcuts import get_object_or_404
+from django.core.paginator import Paginator
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from retailstore.db_router import REPLICA_DATABASE
+from retailstore.media_urls import resolver as media_resolver
+from . import clients
+from .analytics import describe_views
+from .descriptions import DESCRIPTION_PROMPT, extract_description
+from .storage import delete_gallery_images, save_gallery_image
+from .responses import REVIEW_RESPONSE_PROMPT, draft_queue, pending_reviews, queue_review_responses
+from .summarizer import save_review_summary, summarize_reviews
+from django.conf import settings
+import os
+from utils import tracing
+from langchain.llms.bedrock import Bedrock
+from langchain.embeddings import BedrockEmbeddings
+from langchain import PromptTemplate
+from PIL import Image
+import base64
+import io
+import json
+import logging
+import random
+import string
+import numpy as np
+import psycopg2
+from pgvector.psycopg2 import register_vector
+
+logger = logging.getLogger(__name__)
+
+####################### START SECTION - HANDLER FUNCTIONS GENAI FEATURES ##########################
+
+## Functions in this section will be used to: 
+
+# 1. Render HTML pages needed for the GenAI features we are going to implement
+# 2. Save LLM response to web application database
+# 3. Any andler functions used for manipulating input fed to the LLM 
+
+## This section can be safely ignored
+## Please don't modify anything in this section
+
+#### HANDLER FUNCTIONS FOR GENAI DRAFTS ####
+
+# Output of the GenAI features is stored as a Draft until it is saved or discarded.
+# The session only keeps the id of the current draft of each kind, so it is written when a draft changes and not on every page view.
+
+# This function returns the current draft of a kind for the product (and review), if any
+def _current_draft(request, kind, product, review=None):
+    draft_id = request.session.get('drafts', {}).get(kind)
+    if draft_id is None:
+        return None
+    return Draft.objects.filter(id=draft_id, kind=kind, product=product, review=review).first()
+
+# This function makes a new draft the current one of its kind, replacing the previous draft
+def _set_draft(request, draft):
+    drafts = request.session.get('drafts', {})
+    previous = drafts.get(draft.kind)
+    if previous is not None:
+        Draft.objects.filter(id=previous).delete()
+    drafts[draft.kind] = draft.id
+    request.session['drafts'] = drafts
+
+# This function deletes the current draft of a kind once it was saved or thrown away
+def _discard_draft(request, kind):
+    drafts = request.session.get('drafts', {})
+    draft_id = drafts.pop(kind, None)
+    if draft_id is not None:
+        Draft.objects.filter(id=draft_id).delete()
+        request.session['drafts'] = drafts
+
+# This function clears the generated text of a draft, keeping the form input it was generated from
+def _clear_draft(request, kind):
+    draft_id = request.session.get('drafts', {}).get(kind)
+    if draft_id is not None:
+        Draft.objects.filter(id=draft_id).update(prompt='', text='')
+
+def _draft_user(request):
+    return request.user if request.user.is_authenticated else None
+
+#### HANDLER FUNCTIONS FOR GENERATING PRODUCT DESCRIPTION FEATURE ####
+
+# This function is used to just render HTML page for generate product description functionality
+def generate_description(request, product_id):
+   try:
+        # get product from product ID 
+        single_product = Product.objects.get(id=product_id)
+
+   except Exception as e:
+        raise e
+   
+   # pass product object and current draft to context (to be used in generate_description.html)
+   context = {
+        'single_product': single_product,
+        'draft': _current_draft(request, 'description', single_product),
+    }
+   
+   # render HTML page generate_description.html
+   return render(request, 'store/generate_description.html', context)
+
+#This function is used for saving product description to database
+def save_product_description(request, product_id):
+    single_product = get_object_or_404(Product, id=product_id)
+
+    # If user input is to save description
+    if 'save_description' in request.POST:
+        single_product.description = request.POST.get('generated_description')
+        single_product.save()
+        _discard_draft(request, 'description')
+        success_message = "The product description for " + single_product.product_name + " has been updated successfully. "
+        messages.success(request, success_message)
+        return redirect('product_detail', single_product.category.slug, single_product.slug)
+    # If user input is to regenerate
+    elif 'regenerate' in request.POST:
+        _clear_draft(request, 'description')
+    # otherwise go back to the description page
+    return redirect('generate_description', single_product.id)
+
+#### HANDLER FUNCTIONS FOR DRAFTING RESPONSE TO CUSTOMER REVIEW FEATURE ####
+
+# This function is used to just render HTML page for create response to customer review functionality
+def create_response(request, product_id, review_id):
+    try:
+        # get product from product ID
+        single_product = Product.objects.get(id=product_id)
+        # get single customer review using product ID, review ID
+        review = ReviewRating.objects.get(product=single_product, id=review_id)
+
+    except Exception as e:
+            raise e
+    
+    # pass objects and current draft to context (to be used in create_response.html)
+    context = {
+            'single_product': single_product,
+            'review': review,
+            'draft': _current_draft(request, 'response', single_product, review),
+        }
+    # render HTML page create_response.html
+    return render(request, 'store/create_response.html', context)
+
+# This function is used for saving customer review response to database
+def save_review_response(request, product_id, review_id):
+    # get single product review using product ID and review ID 
+    single_product = get_object_or_404(Product, id=product_id)
+    review = get_object_or_404(ReviewRating, product=single_product, id=review_id)
+    draft = _current_draft(request, 'response', single_product, review)
+
+    # If user input is to save response
+    if 'save_response' in request.POST:
+        review.generated_response = request.POST.get('generated_response')
+        review.prompt = draft.prompt if draft else ''
+        review.response_approved = True
+        review.save()
+        _discard_draft(request, 'response')
+        success_message = "The response for the review of " + single_product.product_name + " has been updated successfully. "
+        messages.success(request, success_message)
+        return redirect('product_detail', single_product.category.slug, single_product.slug)
+    
+    # If user input is to regenerate review response
+    elif 'regenerate' in request.POST:
+        _clear_draft(request, 'response')
+    # otherwise go back to the response page
+    return redirect('create_response', single_product.id, review.id)
+
+# Number of drafted responses shown per page of the review response queue
+RESPONSES_PER_PAGE = 20
+# Largest number of responses drafted by one click on the queue page
+MAX_DRAFTS_PER_REQUEST = 100
+# Drafting batches whose status is shown on the queue page
+RECENT_BATCHES = 5
+
+# This function renders the queue of drafted responses to customer reviews.
+# Managers draft responses for many reviews in one pass, edit them and approve or discard them in bulk.
+@login_required(login_url='login')
+def review_responses(request):
+    if request.user.role != 'Manager':
+        raise PermissionDenied
+
+    if request.method == 'POST':
+        # draft responses for the reviews without one, lowest ratings first, in the background
+        if 'draft_responses' in request.POST:
+            try:
+                count = int(request.POST.get('count') or 25)
+            except ValueError:
+                messages.error(request, "Enter the number of responses to draft.")
+                return redirect('review_responses')
+            count = max(1, min(count, MAX_DRAFTS_PER_REQUEST))
+            queue_review_responses(request.user, count)
+            messages.success(request, "Drafting %d responses, they appear below when they are ready." % count)
+        else:
+            selected = ReviewRating.objects.filter(id__in=request.POST.getlist('selected'), response_approved=False)
+            reviews = list(selected.exclude(generated_response=''))
+            if 'approve' in request.POST:
+                # approve the responses as edited on the page
+                for review in reviews:
+                    review.generated_response = request.POST.get('response_%d' % review.id, review.generated_response)
+                    review.response_approved = True
+                ReviewRating.objects.bulk_update(reviews, ['generated_response', 'response_approved'])
+                messages.success(request, "Approved %d responses." % len(reviews))
+            elif 'discard' in request.POST:
+                # discarded reviews go back to the reviews waiting for a draft
+                for review in reviews:
+                    review.generated_response = ''
+                    review.prompt = ''
+                ReviewRating.objects.bulk_update(reviews, ['generated_response', 'prompt'])
+                messages.success(request, "Discarded %d responses." % len(reviews))
+        return redirect('review_responses')
+
+    paginator = Paginator(draft_queue(), RESPONSES_PER_PAGE)
+    batches = list(ReviewResponseBatch.objects.select_related('manager').order_by('-id')[:RECENT_BATCHES])
+    context = {
+        'reviews': paginator.get_page(request.GET.get('page')),
+        'pending_count': pending_reviews().count(),
+        'max_drafts': MAX_DRAFTS_PER_REQUEST,
+        'batches': batches,
+        # the page reloads until the batches being drafted are done
+        'drafting': any(batch.status in ('queued', 'running') for batch in batches),
+    }
+    return render(request, 'store/review_responses.html', context)
+
+#### HANDLER FUNCTIONS FOR SUMMARIZING CUSTOMER REVIEWS FEATURE ####
+
+# This function is used to just render HTML page for summarize customer reviews functionality
+def generate_summary(request, product_id): 
+    try:
+        # get product from product ID
+        single_product = Product.objects.get(id=product_id)
+        # get all customer reviews for this product
+        product_reviews = ReviewRating.objects.filter(product=single_product, status=True)
+
+    except Exception as e:
+            raise e
+    
+    # pass objects and current draft to context (to be used in generate_summary.html)
+    context = {
+            'single_product': single_product,
+            'reviews': product_reviews,
+            'draft': _current_draft(request, 'summary', single_product),
+        }
+    
+    # render HTML page generate_summary.html
+    return render(request, 'store/generate_summary.html', context)
+
+# This function is used for saving summarized customer reviews to database
+def save_summary(request, product_id):
+    # get single product and its current summary draft
+    single_product = get_object_or_404(Product, id=product_id)
+    draft = _current_draft(request, 'summary', single_product)
+
+    # If user input is to save review summary
+    if 'save_summary' in request.POST and draft:
+        save_review_summary(single_product, draft.text)
+        _discard_draft(request, 'summary')
+        success_message = "The summary for the review of " + single_product.product_name + " has been updated successfully. "
+        messages.success(request, success_message)
+        return redirect('product_detail', single_product.category.slug, single_product.slug)
+    # If user input is to regenerate review summary
+    elif 'regenerate' in request.POST:
+        _clear_draft(request, 'summary')
+    # otherwise go back to the summary page
+    return redirect('generate_summary', single_product.id)
+
+#### HANDLER FUNCTIONS FOR CREATING NEW DESIGN IDEAS FEATURE ####
+
+# This function is used to just render the HTML page studio.html
+def design_studio(request, product_id):
+    single_product = Product.objects.get(id=product_id)
+    draft = _current_draft(request, 'image', single_product)
+    # the generated image is uploaded in the background (store/storage.py); it is shown once stored
+    image_status = None
+    if draft and draft.image:
+        gallery = ProductGallery.objects.filter(product=single_product, image=draft.image.name).only('status').first()
+        image_status = gallery.status if gallery else None
+    context = {
+        'single_product': single_product,
+        'draft': draft,
+        'image_status': image_status,
+    }
+    return render(request, 'store/studio.html', context)
+
+# Handy function to convert an image to base64 string
+# Stabile Diffusion LLM expects the input image to be in base64 string format
+def image_to_base64(img) -> str:
+    """Convert a PIL Image or local image file path to a base64 string for Amazon Bedrock"""
+    if isinstance(img, str):
+        if os.path.isfile(img):
+            with open(img, "rb") as f:
+                return base64.b64encode(f.read()).decode("utf-8")
+        else:
+            raise FileNotFoundError(f"File {img} does not exist")
+    elif isinstance(img, Image.Image):
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+    else:
+        raise ValueError(f"Expected str (filename) or PIL Image. Got {type(img)}")
+
+#### HANDLER FUNCTIONS FOR QUESTION ANSWERING FEATURE ####
+
+# This function is used for extracting string within a tag. For example, get string embedded within <query></query>
+def extract_strings_recursive(test_str, tag):
+    # finding the index of the first occurrence of the opening tag
+    start_idx = test_str.find("<" + tag + ">")
+ 
+    # base case
+    if start_idx == -1:
+        return []
+ 
+    # extracting the string between the opening and closing tags
+    end_idx = test_str.find("</" + tag + ">", start_idx)
+    res = [test_str[start_idx+len(tag)+2:end_idx]]
+ 
+    # recursive call to extract strings after the current tag
+    res += extract_strings_recursive(test_str[end_idx+len(tag)+3:], tag)
+ 
+    return res
+
+####################### END SECTION - HANDLER FUNCTIONS GENAI FEATURES ##########################
+
+####################### START SECTION - IMPLEMENT GENAI FEATURES FOR WORKSHOP ##########################
+
+#### This is the only section where you will add functions needed for implementing GenAI features into your retail application
+#### Please don't edit any sections other than this one. 
+
+#### FEATURE 1 - GENERATE PRODUCT DESCRIPTION ####
+
+# This function is used for generating product description using LLM from Bedrock
+def generate_product_description(request, product_id):
+    
+    # get current URL for redirecting
+    url = request.META.get('HTTP_REFERER')
+    # get product from product ID
+    single_product = Product.objects.get(id=product_id)
+    product_colors = []
+    # get product colors
+    product_vars = Variation.objects.filter(product=single_product, variation_category="color")
+    for variation in product_vars:
+        product_colors.append(variation.variation_value)
+    try:
+        # get product name, brand, category, color
+        # get product details from user input from the web application form
+        # these data will be used to construct the prompt which will be passed to the LLM to generate product description. 
+        product_brand = single_product.product_brand
+        product_category = single_product.category
+        product_name = single_product.product_name
+        product_details = request.GET.get('product_details')
+        max_length = request.GET.get('wordrange')
+
+        # get inference parameters from form for Claude Anthropic
+        inference_modifier = {}
+        inference_modifier['max_tokens_to_sample'] = int(request.GET.get('max_tokens_to_sample') or 200)
+        inference_modifier['temperature'] = float(request.GET.get('temperature') or 0.5)
+        inference_modifier['top_k'] = int(request.GET.get('top_k') or 250)
+        inference_modifier['top_p'] = float(request.GET.get('top_p') or 1)
+        inference_modifier['stop_sequences'] = ["\n\nHuman"]
+
+        # Initialize LLM
+        textgen_llm = Bedrock(
+            model_id="anthropic.claude-instant-v1",
+            client=clients.bedrock().for_feature('product_description'),
+            model_kwargs=inference_modifier,
+        )
+        
+        # pass in the variables to the prompt template
+        prompt = DESCRIPTION_PROMPT.format(brand=product_brand, 
+                                           colors=product_colors,
+                                           category=product_category,
+                                           length=max_length,
+                                           name=product_name,
+                                           details=product_details)
+        
+        # generate product description from Bedrock with the constructed prompt
+        response = textgen_llm(prompt)
+
+        # get the second paragraph i.e, only the product description 
+        generated_description = extract_description(response)
+
+    except Exception as e:
+        raise e
+    
+    # save the draft to show in HTML template
+    draft = Draft.objects.create(kind='description', product=single_product, user=_draft_user(request),
+                                 inputs={'details': product_details}, prompt=prompt, text=generated_description)
+    _set_draft(request, draft)
+
+    # redirect to the previous URL (i.e., generate_description.html). 
+    # From there, user can either save description or regenerate it. 
+    return redirect(url)
+
+#### FEATURE 2 - DRAFTING RESPONSE TO CUSTOMER REVIEWS ####
+
+# This function is used for drafting response to customer reviews using LLM from Bedrock
+def create_review_response(request, product_id, review_id):
+    # get current URL for redirecting
+    url = request.META.get('HTTP_REFERER')
+    # get product from product ID
+    product = Product.objects.get(id=product_id)
+    # get single customer review using product ID, review ID
+    review = ReviewRating.objects.get(product=product, id=review_id)
+    try:
+        # Get product name, customer review 
+        # and number of words to generate as a response to customer review
+        # these data will be used to construct the prompt which will be passed to the LLM to create response to customer review. 
+        product_name = product.product_name
+        review_text = review.review
+        max_length = request.GET.get('wordrange')
+
+        #Inference parameters for Claude Anthropic
+        inference_modifier = {}
+        inference_modifier['max_tokens_to_sample'] = int(request.GET.get('max_tokens_to_sample') or 200)
+        inference_modifier['temperature'] = float(request.GET.get('temperature') or 0.5)
+        inference_modifier['top_k'] = int(request.GET.get('top_k') or 250)
+        inference_modifier['top_p'] = float(request.GET.get('top_p') or 1)
+        inference_modifier['stop_sequences'] = ["\n\nHuman"]
+
+        # Initialize LLM
+        textgen_llm = Bedrock(
+            model_id="anthropic.claude-instant-v1",
+            client=clients.bedrock().for_feature('review_response'),
+            model_kwargs=inference_modifier,
+        )
+        
+        # Pass in form values to the prompt template
+        prompt = REVIEW_RESPONSE_PROMPT.format(product_name=product_name,
+                                               customer_name=review.first_name,
+                                               manager_name=request.user.full_name(),
+                                               email=request.user.email,
+                                               phone=request.user.phone_number,
+                                               length=max_length,
+                                               review=review_text)
+        
+        # Generate response to customer review using prompt constructed above
+        response = textgen_llm(prompt)
+
+        # Get the second paragraph i.e, only the response to customer review
+        generated_response = extract_description(response)
+
+    except Exception as e:
+        raise e
+
+    # save the draft to show in HTML template
+    draft = Draft.objects.create(kind='response', product=product, review=review, user=_draft_user(request),
+                                 prompt=prompt, text=generated_response)
+    _set_draft(request, draft)
+
+    # redirect to the previous URL (i.e., create_response.html). 
+    # From there, user can either save review response or regenerate it.
+    return redirect(url)
+
+#### FEATURE 3 - CREATE NEW DESIGN IDEAS FROM PRODUCT ####
+
+# This function is used for creating design ideas (images) for a product
+def create_design_ideas(request, product_id):
+    # get current URL for redirecting
+    url = request.META.get('HTTP_REFERER')
+    # get product from product ID
+    single_product = Product.objects.get(id=product_id)
+    
+    try:
+        # if user chose to delete previously generated image from Stable Diffusion model
+        if 'delete_previous' in request.GET:
+            # delete previously generated image  
+            draft = _current_draft(request, 'image', single_product)
+            if draft:
+                # the image is deleted from S3 after responding
+                delete_gallery_images(ProductGallery.objects.filter(product=single_product, image=draft.image.name))
+                _discard_draft(request, 'image')
+            return redirect('create_design_ideas', single_product.id)
+        
+        # IF user chose to delete all generated images from Stable Diffusion model
+        if 'delete_all' in request.GET:
+            # delete existing image gallery 
+            _discard_draft(request, 'image')
+            delete_gallery_images(ProductGallery.objects.filter(product=single_product))
+            return redirect('create_design_ideas', single_product.id)
+        
+        with tracing.span('prepare product image', {'component': 'image'}):
+            # Open product image
+            image = Image.open(single_product.images)
+            # Resize product image to 512x512 for Stable Diffusion
+            resize = image.resize((512,512))
+
+        # Get inference parameters from web application form
+
+        # This prompt is used to generate new ideas from the existing image
+        change_prompt = request.GET.get('change_prompt')
+
+        # Negative prompts that will be given -1.0 weight while generating new image
+        negprompts = request.GET.get('negative_prompt')
+        negative_prompts = []
+        for negprompt in negprompts.split('\n'):
+            negative_prompts.append(negprompt.replace('\r',''))
+        
+        # Other Stable Diffusion parameters
+        start_schedule = float(request.GET.get('start_schedule')) or 0.5
+        steps = int(request.GET.get('steps')) or 30
+        cfg_scale = int(request.GET.get('cfg_scale')) or 10
+        image_strength = float(request.GET.get('image_strength')) or 0.5
+        denoising_strength = float(request.GET.get('denoising_strength')) or 0.5
+        seed = int(request.GET.get('seed')) or random.randint(1, 1000000)
+        style_preset = request.GET.get('style_preset') or "photographic"
+
+        # Convert image to base64 string
+        with tracing.span('encode product image', {'component': 'image'}):
+            init_image_b64 = image_to_base64(resize)
+
+        # Construct request body for Stable Diffusion model
+        sd_request = json.dumps({
+                    "text_prompts": (
+                        [{"text": change_prompt, "weight": 1.0}]
+                        + [{"text": negprompt, "weight": -1.0} for negprompt in negative_prompts]
+                    ),
+                    "cfg_scale": cfg_scale,
+                    "init_image": init_image_b64,
+                    "seed": seed,
+                    "start_schedule": start_schedule,
+                    "steps": steps,
+                    "style_preset": style_preset,
+                    "image_strength":image_strength,
+                    "denoising_strength": denoising_strength
+                })
+        
+        # Invoke Stable Diffusion model
+        response = clients.bedrock().for_feature('design_ideas').invoke_model(body=sd_request, modelId="stability.stable-diffusion-xl")
+
+        # Extract image from response body
+        response_body = json.loads(response.get("body").read())
+        genimage_b64_str = response_body["artifacts"][0].get("base64")
+        with tracing.span('decode generated image', {'component': 'image'}):
+            genimage = Image.open(io.BytesIO(base64.decodebytes(bytes(genimage_b64_str, "utf-8"))))
+
+            # Save the image to an in-memory file
+            in_mem_file = io.BytesIO()
+            genimage.save(in_mem_file, format="PNG")
+
+        # Save generated image to database; it is uploaded to the static s3 path after responding
+        image_file_path = single_product.slug + "_generated" + ''.join(random.choices(string.ascii_lowercase, k=5)) + ".png"
+        product_gallery = save_gallery_image(single_product, 'store/products/' + image_file_path, in_mem_file.getvalue())
+
+        # Save the draft to show in HTML template
+        draft = Draft.objects.create(kind='image', product=single_product, user=_draft_user(request),
+                                     inputs={'change_prompt': change_prompt, 'negative_prompt': negprompts},
+                                     image=product_gallery.image.name)
+        _set_draft(request, draft)
+
+        # the studio page tells the user once the image is stored
+        messages.info(request, "Design idea created, saving it...")
+            
+    except Exception:
+        logger.exception("Creating a design idea for product %s failed", product_id)
+        messages.error(request, "The design idea could not be created, please try again.")
+        
+    # redirect to the previous URL (i.e., studio.html).
+    return redirect(url)
+
+
+#### FEATURE 4 - SUMMARIZE CUSTOMER REVIEWS FOR A PRODUCT ####
+
+# This function is used for summarizing customer reviews using LLM from Bedrock
+def generate_review_summary(request, product_id):
+    # get current URL for redirecting
+    url = request.META.get('HTTP_REFERER')
+    # get product from product ID
+    single_product = Product.objects.get(id=product_id)
+    # get all customer reviews for this product, oldest first so earlier review chunks stay stable
+    product_reviews = ReviewRating.objects.filter(product=single_product).order_by('id')
+
+    try:
+        # If user chose Claude
+        if 'Claude' in request.GET.get('llm'):
+            #Inference parameters for Claude Anthropic
+            inference_modifier = {}
+            inference_modifier['max_tokens_to_sample'] = int(request.GET.get('claude_max_tokens_to_sample') or 200)
+            inference_modifier['temperature'] = float(request.GET.get('claude_temperature') or 0.5)
+            inference_modifier['top_k'] = int(request.GET.get('claude_top_k') or 250)
+            inference_modifier['top_p'] = float(request.GET.get('claude_top_p') or 1)
+            inference_modifier['stop_sequences'] = ["\n\nHuman"]
+
+            # Initialize Claude LLM
+            textgen_llm = Bedrock(
+                model_id="anthropic.claude-instant-v1",
+                client=clients.bedrock().for_feature('review_summary'),
+                model_kwargs=inference_modifier,
+            )
+        
+         # If user chose Titan
+        elif 'Titan' in request.GET.get('llm'):
+            #Inference parameters for Titan
+            inference_modifier = {}
+            inference_modifier['maxTokenCount'] = int(request.GET.get('titan_max_tokens_to_sample') or 200)
+            inference_modifier['temperature'] = float(request.GET.get('titan_temperature') or 0.5)
+            inference_modifier['topP'] = int(request.GET.get('titan_top_p') or 250)
+
+            # Initialize Titan LLM
+            textgen_llm = Bedrock(
+                model_id="amazon.titan-tg1-large",
+                client=clients.bedrock().for_feature('review_summary'),
+                model_kwargs=inference_modifier,
+                )
+            
+        else:
+            pass
+
+        # Generate review summary with the prompt in summarizer.py. Reviews are enclosed in <review></review> tags, which helps the LLM understand our instruction better.
+        # Products with many reviews are summarized chunk by chunk and the partial summaries merged.
+        response, prompt = summarize_reviews(textgen_llm, textgen_llm.model_id, single_product, product_reviews)
+
+        # Save the draft to show in HTML template
+        draft = Draft.objects.create(kind='summary', product=single_product, user=_draft_user(request),
+                                     prompt=prompt, text=response)
+        _set_draft(request, draft)
+
+    except Exception:
+        logger.exception("Generating the review summary of product %s failed", product_id)
+        messages.error(request, "The review summary could not be generated, please try again.")
+
+    # redirect to the previous URL (i.e., generate_summary.html).
+    return redirect(url)
+
+
+#### FEATURE 5 - QUESTION ANSWERING WITH SQL GENERATION ####
+
+# This function is used for answering user questions in natural language using SQL generation and result interpretation by LLM
+def ask_question(request):
+    # initialize variables
+    context={}
+    is_query_generated = False
+    describe_query_result = ''
+
+    if 'question' in request.GET:
+        # get user question from web application 
+        question = request.GET.get('question')
+
+        # read Postgres schema file stored in S3
+        resp = clients.s3().get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key="data/schema-postgres.sql")
+        schema = resp['Body'].read().decode("utf-8")
+
+        # describe the precomputed analytics views alongside the tables
+        schema = schema + "\n" + describe_views()
+
+        # Prompt template for LLM
+        # This prompt template will generate an SQL query based on the schema passed above. 
+        # We are passing PostgresQL documentation to help with the SQL generation. 
+        # Generated query will be embedded in <query></query> tags
+        prompt_template = """
+            Human: Create an Postgres SQL query for a retail website to answer the question keeping the following rules in mind: 
+            
+            1. Database is implemented in Postgres SQL.
+            2. Postgres syntax details can be found here: https://www.postgresql.org/files/documentation/pdf/15/postgresql-15-US.pdf
+            3. Enclose the query in <query></query>. 
+            4. Use "like" and upper() for string comparison on both left hand side and right hand side of the expression. For example, if the query contains "jackets", use "where upper(product_name) like upper('%jacket%')". 
+            5. If the question is generic, like "where is mount everest" or "who went to the moon first", then do not generate any query in <query></query> and do not answer the question in any form. Instead, mention that the answer is not found in context.
+            6. If the question is not related to the schema, then do not generate any query in <query></query> and do not answer the question in any form. Instead, mention that the answer is not found in context.  
+            7. For sales totals, best sellers, stock levels and rating statistics, query the analytics_* views instead of aggregating the orders, products and reviews tables.
+
+            <schema>
+                {schema}
+            </schema>
+
+            Question: {question}
+
+            Assistant:
+            
+            """
+
+        # Prompt template variables
+        prompt_vars = PromptTemplate(template=prompt_template, input_variables=["question","schema"])
+            
+        # Initialize LLM
+        llm = Bedrock(model_id="anthropic.claude-instant-v1", client=clients.bedrock().for_feature('ask_question'))
+        
+        # Pass question and postgres schema of the web application
+        prompt = prompt_vars.format(question=question, schema=schema)
+
+        try: 
+            # Invoke LLM and get response
+            llm_response = llm(prompt)
+
+            # Check if query is generated under <query></query> tags as instructed in our prompt
+            if "<query>".upper() not in llm_response.upper():
+                logger.info("No query generated for the question")
+                is_query_generated  = False
+                describe_query_result = llm_response
+                resultset=''
+                query=''
+            
+            else: 
+                is_query_generated = True
+                # Extract the query from the response
+                query = extract_strings_recursive(llm_response, "query")[0]
+                logger.info("Query generated by LLM: %s", query)
+
+                # Connect to the read replica (or the writer when no replica is configured)
+                # in a read-only session, so generated queries can never modify or load the writer
+                database = settings.DATABASES.get(REPLICA_DATABASE, settings.DATABASES['default'])
+                dbconn = psycopg2.connect(host=database['HOST'], user=database['USER'], password=database['PASSWORD'], port=database['PORT'], database=database['NAME'], connect_timeout=10)
+                dbconn.set_session(readonly=True, autocommit=True)
+                cursor = dbconn.cursor()
+
+                # Execute the extracted query
+                cursor.execute(query)
+                query_result = cursor.fetchall()
+
+                # Close database connection
+                cursor.close()
+                dbconn.close()
+                
+                # get query result
+                resultset = ''
+                if len(query_result) > 0:
+                    for x in query_result:
+                        resultset = resultset + ''.join(str(x)) + "\n"
+
+                # the result may hold customer data, only logged when debugging
+                logger.debug("Query result:\n%s", resultset)
+
+                # Prompt template for LLM
+                # This prompt template defines rules while describing query result. 
+                # This is the final result that will be seen by the user as an answer to their question. 
+                # Idea is to derive natural language answer for a natural language question. 
+                prompt_template = """
+
+                Human: This is a Q&A application. We need to answer questions asked by the customer at an e-commerce store. 
+                The question asked by the customer is {question}
+                We ran an SQL query in our database to get the following result. 
+
+                <resultset>
+                {resultset}
+                </resultset>
+
+                Summarize the above result and answer the question asked by the customer keeping the following rules in mind: 
+                1. Don't make up answers if <resultset></resultset> is empty or none. Instead, answer that the item is not available based on the question.
+                2. Mask the PIIs phone, email and address if found the answer with "<PII masked>"
+                3. Don't say "based on the output" or "based on the query" or "based on the question" or something similar.  
+                4. Keep the answer concise. 
+                5. Don't give an impression to the customer that a query was run. Instead, answer naturally. 
+
+                Assistant:
+
+                """
+
+                # Pass user question and query result to prompt template
+                prompt_vars = PromptTemplate(template=prompt_template, input_variables=["question","resultset"])
+
+                prompt = prompt_vars.format(question=question, resultset=resultset)
+
+                # Invoke LLM and get response
+                describe_query_result = llm(prompt)
+                logger.debug("describe_query_result %s", describe_query_result)
+
+                # If length of response is 0, then set response to "Sorry, I could not answer that question."
+                if len(describe_query_result) == 0:
+                    describe_query_result = "Sorry, I could not answer that question."
+
+        except Exception:
+            logger.exception("Answering a question failed")
+            query = "Sorry, I could not answer that question."
+
+        # Set context variables for HTML template
+        context = {
+            "question": question,
+            "query": query,
+            "is_query_generated": is_query_generated,
+            "describe_query_result": describe_query_result,
+        }
+
+    # Render HTML template
+    return render(request, 'store/question.html', context)
+
+#### FEATURE 6 - VECTOR SEARCH ####
+
+# This function is used for searching similar products using vector embeddings
+def vector_search(request):
+    if 'keyword' in request.GET:
+        # Get search keyword from user 
+        keyword = request.GET['keyword']
+        if keyword:
+            # Initialize Titan embeddings model
+            bedrock_embeddings = BedrockEmbeddings(model_id="amazon.titan-embed-g1-text-02", client=clients.bedrock().for_feature('vector_search'))
+
+            # Generate vector embeddings for the search keyword
+            search_embedding = list(bedrock_embeddings.embed_query(keyword))
+
+            # Get database connection details from Secrets Manager
+            response = clients.secrets().get_secret_value(SecretId='postgresdb-secret')
+            database_secrets = json.loads(response['SecretString'])
+
+            # Connect to PostgreSQL database
+            dbhost = database_secrets['host']
+            dbport = database_secrets['port']
+            dbuser = database_secrets['username']
+            dbpass = database_secrets['password']
+            dbname = database_secrets['vectorDbIdentifier']
+
+            dbconn = psycopg2.connect(host=dbhost, user=dbuser, password=dbpass, port=dbport, database=dbname, connect_timeout=10)
+            dbconn.set_session(autocommit=True)
+
+            # Register vector db
+            register_vector(dbconn)
+            cur = dbconn.cursor()
+
+            # Search similar products using vector embeddings
+            # Please note that in order to save time, all the 8500+ vector embeddings are pre-populated into your Amazon RDS database instance 
+            # using pgvector extension
+            cur.execute("""SELECT id, url, description, descriptions_embeddings 
+                        FROM vector_products
+                        ORDER BY descriptions_embeddings <-> %s limit 10;""", 
+                        (np.array(search_embedding),))
+
+            # Get search results
+            r = cur.fetchall()
+            product_count = len(r)
+
+            # Print similarity search results to web application
+            # the browser loads the images from their URLs; stored URLs may carry an expired signature
+            urls = media_resolver().external
+            combined = []
+            for x in r:
+                c = {}
+                c['url'] = urls(x[1])
+                c['desc'] = x[2]
+                c['product_item_id'] = x[0]
+                combined.append(c)
+
+            # Close database connection
+            cur.close()
+            dbconn.close()
+
+            # Set context variables for HTML template
+            context = {
+                'keyword': keyword,
+                'combined': combined,
+                'product_count': product_count,
+            }
+    
+    # Render HTML template
+    return render(request, 'store/vector.html', context)
+
+####################### END SECTION - IMPLEMENT GENAI FEATURES FOR WORKSHOP ##########################
\ No newline at end of file
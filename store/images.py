@@ -0,0 +1,68 @@
+# Smaller copies (derivatives) of product and gallery images, for the srcset of the
+# responsive_image template tag.
+#
+# Each image gets a WebP and a JPEG at every width of DERIVATIVE_WIDTHS up to its own,
+# stored next to it: photos/products/shirt.jpg has photos/products/shirt.320w.webp,
+# photos/products/shirt.320w.jpg... Uploaded images are never overwritten (a new upload
+# gets a new name), so the derivatives are cached for a year. What was generated is
+# recorded in the model's `derivatives` field, and only derivatives recorded for the
+# current image are used, so pages never point at missing or outdated files.
+
+import io
+import os
+
+# widths, in pixels, of the derivatives of each image
+DERIVATIVE_WIDTHS = (160, 320, 640, 1024)
+# format: (Pillow format, content type, extension, save options)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def derivative_name(name, width, format):
+    base, _ = os.path.splitext(name)
+    return '%s.%dw.%s' % (base, width, FORMATS[format][2])
+
+
+def _flatten(image):
+    from PIL import Image
+
+    # JPEG has no transparency; transparent pixels become white
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_derivatives(data, widths=DERIVATIVE_WIDTHS):
+    """The source width and the derivatives of the image `data`, as a list of
+    (width, format, content type, bytes). Images are not enlarged: an image narrower than
+    the largest width gets a derivative at its own width instead of the larger ones."""
+    # imported on first use rather than when the admin imports store.storage
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    source_width = image.width
+    rgb = _flatten(image)
+    widths = sorted({min(width, source_width) for width in widths})
+    derivatives = []
+    for width in widths:
+        height = max(1, round(image.height * width / source_width))
+        resized = rgb.resize((width, height), Image.LANCZOS)
+        for format, (pil_format, content_type, _, options) in FORMATS.items():
+            out = io.BytesIO()
+            resized.save(out, format=pil_format, **options)
+            derivatives.append((width, format, content_type, out.getvalue()))
+    return source_width, derivatives
+
+
+def current_widths(name, derivatives):
+    """Widths of the derivatives recorded for the image `name`, [] for none."""
+    if not name or not derivatives or derivatives.get('source') != name:
+        return []
+    return derivatives.get('widths', [])
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from store.models import ProductGallery
+from store.storage import purge_gallery_images
+
+
+class Command(BaseCommand):
+    help = ('Delete the gallery images whose upload failed or was lost and retry the deletes that failed, '
+            'removing their S3 objects in batches')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pending-minutes', type=int, default=60,
+                            help='uploads pending for longer were lost with the process that accepted them')
+        parser.add_argument('--batch-size', type=int, default=1000, help='images deleted per delete_objects call')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options['pending_minutes'])
+        leftovers = ProductGallery.objects.filter(
+            Q(status__in=['failed', 'deleting']) | Q(status='pending', created_date__lt=cutoff))
+        ids = list(leftovers.values_list('id', flat=True))
+        ProductGallery.objects.filter(id__in=ids).update(status='deleting')
+
+        deleted = 0
+        for start in range(0, len(ids), options['batch_size']):
+            deleted += purge_gallery_images(ids[start:start + options['batch_size']])
+        self.stdout.write('Deleted %d of %d gallery images' % (deleted, len(ids)))
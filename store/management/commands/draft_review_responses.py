@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Account
+from store.models import ReviewResponseBatch
+from store.responses import bulk_llm, run_batch
+
+
+class Command(BaseCommand):
+    help = 'Draft responses to customer reviews in bulk; the drafts wait in the review response queue for approval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--manager', help='email of the manager who signs the responses')
+        parser.add_argument('--queued', action='store_true', help='draft the batches queued on the review response page instead')
+        parser.add_argument('--limit', type=int, default=500, help='most reviews to draft responses for')
+        parser.add_argument('--max-rating', type=float, help='only reviews with at most this rating')
+        parser.add_argument('--words', type=int, default=100, help='maximum length of a response')
+        parser.add_argument('--workers', type=int, default=4, help='concurrent model calls')
+
+    def handle(self, *args, **options):
+        if options['queued']:
+            ids = list(ReviewResponseBatch.objects.filter(status='queued').order_by('id').values_list('id', flat=True))
+            for batch_id in ids:
+                run_batch(batch_id)
+            self.stdout.write(self.style.SUCCESS('Ran %d queued batches' % len(ids)))
+            return
+        if not options['manager']:
+            raise CommandError('Give the --manager signing the responses, or --queued.')
+        try:
+            manager = Account.objects.get(email=options['manager'], role='Manager')
+        except Account.DoesNotExist:
+            raise CommandError('No manager with email %s.' % options['manager'])
+
+        textgen_llm = bulk_llm()
+
+        def on_error(review, e):
+            self.stderr.write('Review %d failed: %s' % (review.id, e))
+
+        start = time.perf_counter()
+        # a batch of its own, so it doesn't draft the reviews of batches running elsewhere
+        batch = ReviewResponseBatch.objects.create(manager=manager, size=options['limit'])
+        run_batch(batch.id, textgen_llm, options['max_rating'], length=options['words'], workers=options['workers'], on_error=on_error)
+        batch.refresh_from_db()
+        if batch.status == 'failed':
+            raise CommandError('Drafting the responses failed, see the log.')
+        self.stdout.write(self.style.SUCCESS('Drafted %d responses (%d failed) in %.1fs' % (batch.drafted, batch.failed, time.perf_counter() - start)))
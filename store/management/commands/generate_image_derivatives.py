@@ -0,0 +1,43 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from store.models import Product, ProductGallery
+from store.storage import store_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Generate the WebP and JPEG derivatives of product and gallery images that have none for their current image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='also images whose derivatives were generated')
+        parser.add_argument('--workers', type=int, default=4, help='images processed at the same time')
+
+    def handle(self, *args, **options):
+        images = [(Product, product.id, product.images.name, product.derivatives)
+                  for product in Product.objects.only('id', 'images', 'derivatives').iterator()]
+        images += [(ProductGallery, gallery.id, gallery.image.name, gallery.derivatives)
+                   for gallery in ProductGallery.objects.filter(status='stored').only('id', 'image', 'derivatives').iterator()]
+        todo = [(model, pk, name) for model, pk, name, derivatives in images
+                if name and (options['force'] or derivatives.get('source') != name)]
+
+        def generate(image):
+            model, pk, name = image
+            try:
+                return model, pk, store_derivatives(name)
+            except Exception as e:
+                self.stderr.write('%s %d (%s) failed: %s' % (model.__name__, pk, name, e))
+                return model, pk, None
+
+        start = time.perf_counter()
+        generated = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            # the uploads run in the pool, the rows are saved here
+            for model, pk, record in pool.map(generate, todo):
+                if record:
+                    model.objects.filter(pk=pk).update(derivatives=record)
+                    generated += 1
+        elapsed = time.perf_counter() - start
+        self.stdout.write('Images: %d, up to date: %d, generated: %d, failed: %d in %.1fs' % (
+            len(images), len(images) - len(todo), generated, len(todo) - generated, elapsed))
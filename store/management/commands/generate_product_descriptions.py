@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from langchain.llms.bedrock import Bedrock
+
+from store import clients
+from store.descriptions import generate_descriptions, select_products
+from utils.instrumentation import MODEL_PRICES
+
+DESCRIPTION_MODEL_ID = 'anthropic.claude-instant-v1'
+
+
+class Command(BaseCommand):
+    help = 'Draft product descriptions in bulk; the drafts are saved for review in the admin'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', action='append', default=[], help='category slug, can be repeated')
+        parser.add_argument('--ids', type=int, nargs='+', default=[], help='product ids')
+        parser.add_argument('--empty', action='store_true', help='only products without a description')
+        parser.add_argument('--include-drafted', action='store_true', help='also products that already have a draft')
+        parser.add_argument('--words', type=int, default=100, help='maximum length of a description')
+        parser.add_argument('--workers', type=int, default=4, help='concurrent model calls')
+        parser.add_argument('--batch-size', type=int, default=50, help='products fetched and saved at a time')
+        parser.add_argument('--retries', type=int, default=5, help='retries of a throttled model call')
+
+    def handle(self, *args, **options):
+        if not (options['category'] or options['ids'] or options['empty']):
+            raise CommandError('Select products with --category, --ids or --empty.')
+
+        textgen_llm = Bedrock(
+            model_id=DESCRIPTION_MODEL_ID,
+            client=clients.bedrock().for_feature('product_description_bulk'),
+            model_kwargs={'max_tokens_to_sample': 200, 'temperature': 0.5, 'top_k': 250, 'top_p': 1, 'stop_sequences': ["\n\nHuman"]},
+        )
+
+        products = select_products(options['category'], options['ids'], options['empty'], options['include_drafted'])
+
+        def on_error(product, e):
+            self.stderr.write('Product %d (%s) failed: %s' % (product.id, product.product_name, e))
+
+        start = time.perf_counter()
+        stats = generate_descriptions(textgen_llm, products, options['words'], options['workers'],
+                                      options['batch_size'], options['retries'], on_error=on_error)
+        elapsed = time.perf_counter() - start
+
+        input_price, output_price = MODEL_PRICES[DESCRIPTION_MODEL_ID]
+        cost = stats['input_tokens'] / 1000 * input_price + stats['output_tokens'] / 1000 * output_price
+        self.stdout.write('Products: %(products)d, drafted: %(drafted)d, failed: %(failed)d, throttled retries: %(retries)d' % stats)
+        self.stdout.write('Throughput: %.1f products/min in %.1fs' % (stats['products'] / elapsed * 60 if elapsed else 0, elapsed))
+        self.stdout.write('Tokens (estimated): %d in, %d out, cost about $%.4f' % (stats['input_tokens'], stats['output_tokens'], cost))
+        self.stdout.write(self.style.SUCCESS('Drafts are saved for review in the admin.'))
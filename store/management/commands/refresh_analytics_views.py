@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from store.analytics import ANALYTICS_VIEWS, refresh_views
+
+# any constant works, it only has to be the same for every instance running the command
+REFRESH_LOCK_ID = 7342001
+
+
+class Command(BaseCommand):
+    help = 'Refresh the analytics materialized views used by the question answering feature'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blocking', action='store_true', help='refresh without CONCURRENTLY (faster, but locks readers out)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Analytics views require PostgreSQL.')
+
+        with connection.cursor() as cursor:
+            # the command is scheduled on every instance; only one of them refreshes at a time
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [REFRESH_LOCK_ID])
+            if not cursor.fetchone()[0]:
+                self.stdout.write('Another refresh is running, skipping.')
+                return
+            try:
+                start = time.perf_counter()
+                refresh_views(cursor, concurrently=not options['blocking'])
+                elapsed = time.perf_counter() - start
+            finally:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [REFRESH_LOCK_ID])
+
+        self.stdout.write(self.style.SUCCESS('Refreshed %d analytics views in %.2fs' % (len(ANALYTICS_VIEWS), elapsed)))
@@ -0,0 +1,65 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+from langchain.llms.bedrock import Bedrock
+
+from store import clients
+from store.models import ReviewSummaryRun
+from store.summarizer import CountingLLM, refresh_stale_summaries
+
+SUMMARY_MODEL_ID = 'anthropic.claude-instant-v1'
+# any constant works, it only has to be the same for every instance running the command
+REFRESH_LOCK_ID = 7342002
+
+
+class Command(BaseCommand):
+    help = 'Regenerate review summaries of products with new or changed approved reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls-per-hour', type=int, default=settings.REVIEW_SUMMARY_CALLS_PER_HOUR,
+                            help='model call budget shared by all runs within an hour')
+        parser.add_argument('--batch-size', type=int, default=20, help='stale products fetched per query')
+
+    def handle(self, *args, **options):
+        textgen_llm = Bedrock(
+            model_id=SUMMARY_MODEL_ID,
+            client=clients.bedrock().for_feature('review_summary_refresh'),
+            model_kwargs={'max_tokens_to_sample': 300, 'temperature': 0.5, 'top_k': 250, 'top_p': 1, 'stop_sequences': ["\n\nHuman"]},
+        )
+
+        # the command is scheduled on every instance; only one of them spends the budget
+        if connection.vendor != 'postgresql':
+            self._refresh(textgen_llm, options)
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [REFRESH_LOCK_ID])
+            if not cursor.fetchone()[0]:
+                self.stdout.write('Another refresh is running, skipping.')
+                return
+            try:
+                self._refresh(textgen_llm, options)
+            finally:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [REFRESH_LOCK_ID])
+
+    def _refresh(self, textgen_llm, options):
+        hour_ago = timezone.now() - timedelta(hours=1)
+        spent = ReviewSummaryRun.objects.filter(created_date__gte=hour_ago).aggregate(calls=Sum('model_calls'))['calls'] or 0
+        budget = options['calls_per_hour'] - spent
+        if budget <= 0:
+            self.stdout.write('Hourly model call budget is used up, skipping.')
+            return
+
+        start = time.perf_counter()
+        # counted here too, so the calls of a run that fails still count against the budget
+        counter = CountingLLM(textgen_llm)
+        refreshed = 0
+        try:
+            refreshed, calls = refresh_stale_summaries(counter, SUMMARY_MODEL_ID, budget, options['batch_size'])
+        finally:
+            ReviewSummaryRun.objects.create(products=refreshed, model_calls=counter.calls)
+        self.stdout.write(self.style.SUCCESS('Refreshed %d review summaries with %d model calls in %.1fs' % (refreshed, calls, time.perf_counter() - start)))
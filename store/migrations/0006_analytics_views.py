@@ -0,0 +1,85 @@
+# Generated by Django 4.2.6 on 2026-10-19 14:05
+
+from django.db import migrations
+
+# the views as they were when this migration was written; changes to store/analytics.py
+# need a new migration dropping and creating the changed views
+CREATE_VIEWS = [
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS analytics_sales_by_product_day AS
+        SELECT op.product_id, p.product_name, p.product_brand, c.category_name,
+               (o.created_at AT TIME ZONE 'UTC')::date AS sale_date,
+               SUM(op.quantity) AS units_sold,
+               SUM(op.quantity * op.product_price) AS revenue,
+               COUNT(DISTINCT op.order_id) AS order_count
+        FROM orders_orderproduct op
+        JOIN orders_order o ON o.id = op.order_id
+        JOIN store_product p ON p.id = op.product_id
+        JOIN category_category c ON c.id = p.category_id
+        WHERE o.is_ordered
+        GROUP BY op.product_id, p.product_name, p.product_brand, c.category_name, sale_date
+    """,
+    'CREATE UNIQUE INDEX IF NOT EXISTS analytics_sales_by_product_day_key ON analytics_sales_by_product_day (product_id, sale_date)',
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS analytics_inventory_status AS
+        SELECT p.id AS product_id, p.product_name, p.product_brand, c.category_name,
+               p.price, p.stock, p.is_available,
+               CASE WHEN p.stock <= 0 THEN 'out of stock'
+                    WHEN p.stock < 10 THEN 'low stock'
+                    ELSE 'in stock' END AS stock_status,
+               COALESCE(recent.units_sold, 0) AS units_sold_last_30_days
+        FROM store_product p
+        JOIN category_category c ON c.id = p.category_id
+        LEFT JOIN (
+            SELECT op.product_id, SUM(op.quantity) AS units_sold
+            FROM orders_orderproduct op
+            JOIN orders_order o ON o.id = op.order_id
+            WHERE o.is_ordered AND o.created_at >= now() - interval '30 days'
+            GROUP BY op.product_id
+        ) recent ON recent.product_id = p.id
+    """,
+    'CREATE UNIQUE INDEX IF NOT EXISTS analytics_inventory_status_key ON analytics_inventory_status (product_id)',
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS analytics_product_rating_stats AS
+        SELECT p.id AS product_id, p.product_name, c.category_name,
+               COUNT(r.id) AS review_count,
+               ROUND(AVG(r.rating)::numeric, 2) AS average_rating,
+               MIN(r.rating) AS lowest_rating,
+               MAX(r.rating) AS highest_rating,
+               COUNT(r.id) FILTER (WHERE r.rating >= 4) AS positive_reviews,
+               COUNT(r.id) FILTER (WHERE r.rating <= 2) AS negative_reviews
+        FROM store_product p
+        JOIN category_category c ON c.id = p.category_id
+        LEFT JOIN store_reviewrating r ON r.product_id = p.id AND r.status
+        GROUP BY p.id, p.product_name, c.category_name
+    """,
+    'CREATE UNIQUE INDEX IF NOT EXISTS analytics_product_rating_stats_key ON analytics_product_rating_stats (product_id)',
+]
+
+DROP_VIEWS = [
+    'DROP MATERIALIZED VIEW IF EXISTS analytics_sales_by_product_day',
+    'DROP MATERIALIZED VIEW IF EXISTS analytics_inventory_status',
+    'DROP MATERIALIZED VIEW IF EXISTS analytics_product_rating_stats',
+]
+
+
+def run(statements):
+    def run_statements(apps, schema_editor):
+        # materialized views are PostgreSQL only
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run_statements
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_remove_reviewrating_user_reviewrating_first_name_and_more'),
+        ('orders', '0004_order_number_default'),
+        ('category', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_VIEWS), run(DROP_VIEWS)),
+    ]
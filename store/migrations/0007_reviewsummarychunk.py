@@ -0,0 +1,24 @@
+# Generated by Django 4.2.6 on 2026-10-19 14:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_analytics_views'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewSummaryChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chunk_hash', models.CharField(max_length=64, unique=True)),
+                ('summary', models.TextField(max_length=10000)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.product')),
+            ],
+        ),
+    ]
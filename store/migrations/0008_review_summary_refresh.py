@@ -0,0 +1,37 @@
+# Generated by Django 4.2.6 on 2026-10-19 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_reviewsummarychunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewSummaryRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('products', models.PositiveIntegerField(default=0)),
+                ('model_calls', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_summary_updated',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_summary_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_summary_watermark',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
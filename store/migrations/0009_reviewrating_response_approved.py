@@ -0,0 +1,25 @@
+# Generated by Django 4.2.6 on 2026-10-19 15:12
+
+from django.db import migrations, models
+
+
+def approve_saved_responses(apps, schema_editor):
+    # responses saved before the approval queue existed were saved by a manager
+    ReviewRating = apps.get_model('store', 'ReviewRating')
+    ReviewRating.objects.exclude(generated_response='').update(response_approved=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_review_summary_refresh'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewrating',
+            name='response_approved',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(approve_saved_responses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.6 on 2026-10-19 16:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0009_reviewrating_response_approved'),
+    ]
+
+    operations = [
+        migrations.RenameModel(
+            old_name='GenerateDescription',
+            new_name='Draft',
+        ),
+        migrations.AlterModelOptions(
+            name='draft',
+            options={'verbose_name': 'draft', 'verbose_name_plural': 'drafts'},
+        ),
+        migrations.RenameField(
+            model_name='draft',
+            old_name='description',
+            new_name='text',
+        ),
+        migrations.AlterField(
+            model_name='draft',
+            name='text',
+            field=models.TextField(blank=True, max_length=10000),
+        ),
+        migrations.AddField(
+            model_name='draft',
+            name='kind',
+            field=models.CharField(choices=[('description', 'description'), ('response', 'response'), ('summary', 'summary'), ('image', 'image')], default='description', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='draft',
+            name='review',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='store.reviewrating'),
+        ),
+        migrations.AddField(
+            model_name='draft',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='draft',
+            name='inputs',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='draft',
+            name='prompt',
+            field=models.TextField(blank=True, max_length=10000),
+        ),
+        migrations.AddField(
+            model_name='draft',
+            name='image',
+            field=models.ImageField(blank=True, max_length=255, upload_to='store/products'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.6 on 2026-10-19 18:40
+
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Concat
+import django.utils.timezone
+
+
+def record_keys(apps, schema_editor):
+    # media files are stored under media/ in the bucket (retailstore.media_store.MediaStorage)
+    ProductGallery = apps.get_model('store', 'ProductGallery')
+    ProductGallery.objects.filter(key='').update(key=Concat(Value('media/'), 'image'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_draft'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productgallery',
+            name='key',
+            field=models.CharField(blank=True, max_length=1024),
+        ),
+        migrations.AddField(
+            model_name='productgallery',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('stored', 'stored'), ('failed', 'failed'), ('deleting', 'deleting')], db_index=True, default='stored', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='productgallery',
+            name='created_date',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(record_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-19 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_productgallery_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='productgallery',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
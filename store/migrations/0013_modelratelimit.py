@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-19 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelRateLimit',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_id', models.CharField(max_length=100, unique=True)),
+                ('requests_left', models.FloatField()),
+                ('tokens_left', models.FloatField()),
+                ('counted', models.FloatField()),
+            ],
+        ),
+    ]
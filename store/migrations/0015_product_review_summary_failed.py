@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-19 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_reviewresponsebatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='review_summary_failed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
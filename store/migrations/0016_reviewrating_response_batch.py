@@ -0,0 +1,19 @@
+# Generated by Django 4.2.6 on 2026-10-19 15:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_product_review_summary_failed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewrating',
+            name='response_batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reviews', to='store.reviewresponsebatch'),
+        ),
+    ]
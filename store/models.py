@@ -2,9 +2,16 @@ from django.db import models
 from category.models import Category
 from django.urls import reverse
 from accounts.models import Account
-from django.db.models import Avg, Count
+from django.db.models import Avg, Count, Q
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_ratings(self):
+        # average rating and number of approved reviews in the product query, for pages listing many products
+        approved = Q(reviewrating__status=True)
+        return self.annotate(average_rating=Avg('reviewrating__rating', filter=approved),
+                             review_count=Count('reviewrating', filter=approved))
+
 # Create your models here.
 class Product(models.Model):
     product_name = models.CharField(max_length=200, unique=True)
@@ -19,23 +26,30 @@ class Product(models.Model):
     created_date = models.DateTimeField(auto_now_add=True)
     modified_date = models.DateTimeField(auto_now=True)
     review_summary = models.TextField(max_length=10000, blank=True)
+    review_summary_version = models.PositiveIntegerField(default=0)
+    review_summary_updated = models.DateTimeField(null=True, blank=True)
+    # updated_at of the newest approved review the current summary covers
+    review_summary_watermark = models.DateTimeField(null=True, blank=True)
+    # when summarizing the reviews last failed; the refresh leaves the product alone for a while
+    review_summary_failed = models.DateTimeField(null=True, blank=True)
+    # smaller copies of `images` for srcset (store/images.py), e.g. {"source": "photos/products/shirt.jpg", "width": 1200, "widths": [160, 320, 640, 1024]}
+    derivatives = models.JSONField(default=dict, blank=True)
+
+    objects = ProductQuerySet.as_manager()
 
     def get_url(self):
         return reverse('product_detail', args=[self.category.slug, self.slug])
     
+    # templates call these once per star; the value comes from with_ratings() or is queried once
     def averageReview(self):
-        reviews = ReviewRating.objects.filter(product=self, status=True).aggregate(average=Avg('rating'))
-        avg = 0
-        if reviews['average'] is not None:
-            avg = float(reviews['average'])
-        return avg
+        if not hasattr(self, 'average_rating'):
+            self.average_rating = ReviewRating.objects.filter(product=self, status=True).aggregate(average=Avg('rating'))['average']
+        return float(self.average_rating or 0)
 
     def countReview(self):
-        reviews = ReviewRating.objects.filter(product=self, status=True).aggregate(count=Count('id'))
-        count = 0
-        if reviews['count'] is not None:
-            count = int(reviews['count'])
-        return count
+        if not hasattr(self, 'review_count'):
+            self.review_count = ReviewRating.objects.filter(product=self, status=True).aggregate(count=Count('id'))['count']
+        return int(self.review_count or 0)
 
     def __str__(self):
         return self.product_name
@@ -77,15 +91,84 @@ class ReviewRating(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     generated_response = models.TextField(max_length=10000, blank=True)
     prompt = models.TextField(max_length=10000, blank=True)
+    # drafted responses are shown on the product page once a manager approves them
+    response_approved = models.BooleanField(default=False)
+    # batch drafting the response, so concurrent batches don't draft the same review
+    response_batch = models.ForeignKey('ReviewResponseBatch', null=True, blank=True, on_delete=models.SET_NULL, related_name='reviews')
     first_name = models.CharField(max_length=100, blank=False, default="John")
     last_name = models.CharField(max_length=100, blank=False, default="Doe")
 
     def __str__(self):
         return self.subject
 
+class ReviewSummaryChunk(models.Model):
+    # summary of one chunk of reviews, keyed by a hash of the model id, the product and the chunk text
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    chunk_hash = models.CharField(max_length=64, unique=True)
+    summary = models.TextField(max_length=10000)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.chunk_hash
+
+class ReviewSummaryRun(models.Model):
+    # one background refresh of review summaries, used to keep model calls within the hourly budget
+    created_date = models.DateTimeField(auto_now_add=True, db_index=True)
+    products = models.PositiveIntegerField(default=0)
+    model_calls = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.created_date)
+
+batch_status_choice = (
+    ('queued', 'queued'),
+    ('running', 'running'),
+    ('done', 'done'),
+    ('failed', 'failed'),
+)
+
+class ReviewResponseBatch(models.Model):
+    # responses a manager asked for on the review response queue, drafted in the background (store/responses.py)
+    manager = models.ForeignKey(Account, null=True, on_delete=models.SET_NULL)
+    size = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=batch_status_choice, default='queued', db_index=True)
+    drafted = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    created_date = models.DateTimeField(auto_now_add=True)
+    finished_date = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return str(self.created_date)
+
+class ModelRateLimit(models.Model):
+    # token buckets of the client-side rate limits of a Bedrock model, shared by the workers (store/ratelimit.py)
+    model_id = models.CharField(max_length=100, unique=True)
+    requests_left = models.FloatField()
+    tokens_left = models.FloatField()
+    # time.time() the levels were counted at
+    counted = models.FloatField()
+
+    def __str__(self):
+        return self.model_id
+
+gallery_status_choice = (
+    ('pending', 'pending'),
+    ('stored', 'stored'),
+    ('failed', 'failed'),
+    ('deleting', 'deleting'),
+)
+
+# Generated images are uploaded and deleted in the background (store/storage.py);
+# only stored images are shown.
 class ProductGallery(models.Model):
     product = models.ForeignKey(Product, default=None, on_delete=models.CASCADE)
     image = models.ImageField(upload_to='store/products', max_length=255)
+    # S3 key of the image, e.g. media/store/products/shirt_generatedabcde.png
+    key = models.CharField(max_length=1024, blank=True)
+    status = models.CharField(max_length=10, choices=gallery_status_choice, default='stored', db_index=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    # smaller copies of `image`, like Product.derivatives
+    derivatives = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return self.product.product_name
@@ -95,15 +178,31 @@ class ProductGallery(models.Model):
         verbose_name_plural = 'product gallery'
 
 # Create your models here.
-class GenerateDescription(models.Model):
+draft_kind_choice = (
+    ('description', 'description'),
+    ('response', 'response'),
+    ('summary', 'summary'),
+    ('image', 'image'),
+)
+
+# Output of the GenAI features waiting to be saved or discarded.
+# Pages keep only the id of the current draft of each kind in the session.
+class Draft(models.Model):
+    kind = models.CharField(max_length=20, choices=draft_kind_choice, default='description')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    description = models.TextField(max_length=500, blank=True)
+    review = models.ForeignKey(ReviewRating, null=True, blank=True, on_delete=models.CASCADE)
+    user = models.ForeignKey(Account, null=True, blank=True, on_delete=models.SET_NULL)
+    # form input the draft was generated from, shown again with the draft
+    inputs = models.JSONField(default=dict, blank=True)
+    prompt = models.TextField(max_length=10000, blank=True)
+    text = models.TextField(max_length=10000, blank=True)
+    image = models.ImageField(upload_to='store/products', max_length=255, blank=True)
     created_date = models.DateTimeField(auto_now_add=True)
     modified_date = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.product.product_name
-    
+
     class Meta:
-        verbose_name = 'generatedescription'
-        verbose_name_plural = 'generatedescriptions'
+        verbose_name = 'draft'
+        verbose_name_plural = 'drafts'
@@ -0,0 +1,71 @@
+# Client-side rate limits of the Bedrock model calls (utils/ratelimit.py), with the token
+# buckets in the database so that every worker draws from the same ones.
+#
+# Taking from a model's buckets locks its ModelRateLimit row for one short transaction,
+# which is why model calls must not be made inside a transaction.atomic() block: the row
+# would stay locked until the block ends. The concurrency limit is per process.
+#
+# Model calls made from a thread pool open a connection in each pool thread; wrap the
+# pool's tasks in closing_connections so that the connections are closed again.
+
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Least
+
+from utils import ratelimit
+from .models import ModelRateLimit
+
+
+class DatabaseBuckets:
+    """Buckets in ModelRateLimit rows, one per model."""
+    def take(self, model, limit, tokens, now):
+        with transaction.atomic():
+            requests_left, tokens_left, counted = ratelimit.full(limit, now)
+            bucket, _ = ModelRateLimit.objects.select_for_update().get_or_create(
+                model_id=model, defaults={'requests_left': requests_left, 'tokens_left': tokens_left, 'counted': counted})
+            (requests_left, tokens_left, counted), wait = ratelimit.take(
+                (bucket.requests_left, bucket.tokens_left, bucket.counted), limit, tokens, now)
+            ModelRateLimit.objects.filter(pk=bucket.pk).update(requests_left=requests_left, tokens_left=tokens_left, counted=counted)
+        return wait
+
+    def give(self, model, limit, tokens):
+        if limit.tokens_per_minute:
+            ModelRateLimit.objects.filter(model_id=model).update(
+                tokens_left=Least(F('tokens_left') + tokens, Value(float(limit.tokens_per_minute))))
+
+
+def closing_connections(function):
+    """`function` closing the database connections of its thread when it returns."""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            connections.close_all()
+    return wrapper
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def limiter():
+    """The process's rate limiter, set up from the BEDROCK_RATE_LIMIT* settings on first use."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            store = settings.BEDROCK_RATE_LIMIT_STORE
+            if store == 'database':
+                buckets = DatabaseBuckets()
+            elif store == 'local':
+                buckets = ratelimit.LocalBuckets()
+            else:
+                raise ImproperlyConfigured('Unknown BEDROCK_RATE_LIMIT_STORE %r, use database or local' % store)
+            limits = {model: ratelimit.Limit(**limit) for model, limit in settings.BEDROCK_RATE_LIMITS.items()}
+            _limiter = ratelimit.RateLimiter(limits, buckets, max_wait=settings.BEDROCK_RATE_LIMIT_MAX_WAIT)
+        return _limiter
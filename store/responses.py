@@ -0,0 +1,197 @@
+# Drafting responses to customer reviews, one at a time from the create_response page
+# or in bulk for the review response queue.
+#
+# Bulk drafting takes the reviews without a response, lowest ratings first, sends the
+# prompts to the model from a bounded thread pool and saves the drafts with their
+# prompts in one UPDATE per batch. Drafts wait in the queue until a manager approves them.
+#
+# Batches asked for on the queue page are drafted by a background thread, one batch at
+# a time per process, so the request only records a queued ReviewResponseBatch. Batches
+# a worker restart left queued are drafted by `draft_review_responses --queued`. A batch
+# claims its reviews before drafting them, so batches running in other processes (or the
+# command) skip them instead of paying for the same drafts twice.
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from langchain import PromptTemplate
+from langchain.llms.bedrock import Bedrock
+
+from . import clients
+from .descriptions import call_with_retries, extract_description
+from .models import ReviewRating, ReviewResponseBatch
+from .ratelimit import closing_connections
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_MODEL_ID = 'anthropic.claude-instant-v1'
+
+REVIEW_RESPONSE_PROMPT = PromptTemplate(
+    input_variables=["product_name","customer_name","manager_name","email","phone","length","review"],
+    template="""
+            Human:
+
+            I'm the manager of re:Invent retails.
+
+            Draft a response for the review of the product {product_name} from our customer {customer_name}.
+            The number of words should be less than {length}.
+
+            My contact information is email: {email}, phone: {phone}.
+
+            <customer_review>
+                {review}
+            <customer_review>
+
+            <example_response_pattern>
+
+                Dear <customer_name>,
+                <content_body>
+
+                <if negative review>
+                    Don't hesitate to reach out to me at {phone}.
+                <end if>
+
+                Sincerely,
+                {manager_name}
+                <signature>
+                {email}
+
+            </example_response_pattern>
+
+            Assistant:
+
+            """
+)
+
+
+def build_prompt(review, manager, length):
+    return REVIEW_RESPONSE_PROMPT.format(product_name=review.product.product_name,
+                                         customer_name=review.first_name,
+                                         manager_name=manager.full_name(),
+                                         email=manager.email,
+                                         phone=manager.phone_number,
+                                         length=length,
+                                         review=review.review)
+
+
+def pending_reviews(max_rating=None):
+    """Visible reviews nobody has answered yet, the lowest ratings and oldest first."""
+    reviews = (ReviewRating.objects.select_related('product')
+               .filter(status=True, generated_response='')
+               .order_by('rating', 'created_at', 'id'))
+    if max_rating is not None:
+        reviews = reviews.filter(rating__lte=max_rating)
+    return reviews
+
+
+def draft_queue():
+    """Drafted responses waiting for approval, in the order they were drafted for."""
+    return (ReviewRating.objects.select_related('product')
+            .filter(response_approved=False)
+            .exclude(generated_response='')
+            .order_by('rating', 'created_at', 'id'))
+
+
+def draft_review_responses(llm, reviews, manager, length=100, workers=4, batch_size=50, retries=5, on_error=None):
+    """Draft responses to `reviews` signed by `manager`, with at most `workers`
+    concurrent model calls. Returns (drafted, failed)."""
+    drafted = failed = 0
+
+    @closing_connections
+    def draft(review):
+        prompt = build_prompt(review, manager, length)
+        response, attempts = call_with_retries(llm, prompt, retries)
+        return prompt, response
+
+    reviews = list(reviews)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(reviews), batch_size):
+            batch = reviews[start:start + batch_size]
+            futures = [pool.submit(draft, review) for review in batch]
+            done = []
+            for review, future in zip(batch, futures):
+                try:
+                    prompt, response = future.result()
+                except Exception as e:
+                    failed += 1
+                    if on_error:
+                        on_error(review, e)
+                    continue
+                review.prompt = prompt
+                review.generated_response = extract_description(response)
+                done.append(review)
+            # only these fields, so a review edited meanwhile keeps its other changes
+            ReviewRating.objects.bulk_update(done, ['generated_response', 'prompt'])
+            drafted += len(done)
+    return drafted, failed
+
+
+def bulk_llm():
+    """The model bulk drafts are written with."""
+    return Bedrock(
+        model_id=RESPONSE_MODEL_ID,
+        client=clients.bedrock().for_feature('review_response_bulk'),
+        model_kwargs={'max_tokens_to_sample': 200, 'temperature': 0.5, 'top_k': 250, 'top_p': 1, 'stop_sequences': ["\n\nHuman"]},
+    )
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _batch_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='review-responses')
+        return _executor
+
+
+def _run_in_background(batch_id):
+    try:
+        run_batch(batch_id)
+    finally:
+        close_old_connections()
+
+
+def queue_review_responses(manager, size):
+    """Draft `size` responses signed by `manager` in the background, after the current
+    transaction commits; returns the queued batch."""
+    batch = ReviewResponseBatch.objects.create(manager=manager, size=size)
+    transaction.on_commit(lambda: _batch_executor().submit(_run_in_background, batch.id))
+    return batch
+
+
+def claim_reviews(batch, max_rating=None):
+    """Up to `batch.size` pending reviews, claimed for `batch`: reviews another queued or
+    running batch claimed, or is claiming right now, are skipped."""
+    with transaction.atomic():
+        ids = list(pending_reviews(max_rating)
+                   .exclude(response_batch__status__in=('queued', 'running'))
+                   .select_for_update(skip_locked=True, of=('self',))
+                   .values_list('id', flat=True)[:batch.size])
+        ReviewRating.objects.filter(id__in=ids).update(response_batch=batch)
+    return pending_reviews().filter(id__in=ids)
+
+
+def run_batch(batch_id, llm=None, max_rating=None, **options):
+    """Draft the responses of a queued batch; False if it isn't queued (any more).
+    `options` are passed on to draft_review_responses."""
+    if not ReviewResponseBatch.objects.filter(id=batch_id, status='queued').update(status='running'):
+        return False
+    batch = ReviewResponseBatch.objects.select_related('manager').get(id=batch_id)
+    drafted = failed = 0
+    status = 'failed'
+    try:
+        if batch.manager is not None:
+            reviews = claim_reviews(batch, max_rating)
+            drafted, failed = draft_review_responses(llm or bulk_llm(), reviews, batch.manager, **options)
+            status = 'done'
+    except Exception:
+        logger.exception('Drafting the review responses of batch %d failed', batch_id)
+    finally:
+        ReviewResponseBatch.objects.filter(id=batch_id).update(status=status, drafted=drafted, failed=failed, finished_date=timezone.now())
+    return True
@@ -0,0 +1,229 @@
+# Uploads and deletes of generated images in the background, so that neither creating
+# a design idea nor clearing a product's gallery makes the request wait for S3.
+#
+# A generated image gets its ProductGallery row, pending, in the request; a worker
+# thread uploads it once the response is on its way and marks the row stored, or
+# failed when its attempts are used up. Deleting images marks their rows deleting in
+# one UPDATE; the worker removes the objects with delete_objects, up to 1000 keys per
+# call, and then the rows. Rows a crash or an S3 outage left behind are cleaned up by
+# the clean_gallery_storage command.
+#
+# The worker also generates the derivatives of each uploaded image (store/images.py).
+
+import atexit
+import io
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from utils import backends
+from . import images
+from .models import ProductGallery
+
+logger = logging.getLogger(__name__)
+
+# prefix of the keys of media files in the bucket (retailstore.media_store.MediaStorage)
+MEDIA_PREFIX = 'media/'
+# most keys S3 deletes in one delete_objects call
+DELETE_BATCH_SIZE = 1000
+# seconds a process shutting down waits for the queued operations
+SHUTDOWN_TIMEOUT = 30
+
+
+def media_key(name):
+    return MEDIA_PREFIX + name
+
+
+class StorageWorker:
+    """Runs storage operations on `threads` background threads. Uploads and deletes are
+    tried `attempts` times, waiting retry_delay, 2 * retry_delay... seconds in between.
+    With threads=0 the operations run in the caller's thread."""
+    def __init__(self, client, bucket, threads=2, attempts=4, retry_delay=0.5):
+        self.client = client
+        self.bucket = bucket
+        self.threads = threads
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue()
+        self._started = []
+        self._lock = threading.Lock()
+
+    def submit(self, function, *args):
+        if not self.threads:
+            self._run_one(function, args)
+            return
+        self._start()
+        self._queue.put((function, args))
+
+    def _start(self):
+        with self._lock:
+            while len(self._started) < self.threads:
+                thread = threading.Thread(target=self._run, name='storage-worker-%d' % len(self._started), daemon=True)
+                thread.start()
+                self._started.append(thread)
+
+    def _run(self):
+        while True:
+            function, args = self._queue.get()
+            try:
+                self._run_one(function, args)
+            finally:
+                self._queue.task_done()
+
+    def _run_one(self, function, args):
+        try:
+            function(*args)
+        except Exception:
+            logger.exception('Storage operation %s failed', function.__name__)
+        finally:
+            if self.threads:
+                close_old_connections()
+
+    def flush(self, timeout=None):
+        """Wait until the queued operations are done; False if `timeout` passed first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _backoff(self, attempt, operation, error):
+        logger.warning('%s failed, attempt %d of %d: %s', operation, attempt, self.attempts, error)
+        time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    def upload(self, key, data, content_type='image/png', cache_control=None):
+        """Upload `data` as a public object, raising the last error if every attempt fails."""
+        extra_args = {'ACL': 'public-read', 'ContentType': content_type}
+        if cache_control:
+            extra_args['CacheControl'] = cache_control
+        for attempt in range(1, self.attempts + 1):
+            try:
+                self.client.upload_fileobj(io.BytesIO(data), self.bucket, key, ExtraArgs=extra_args)
+                return
+            except Exception as e:
+                if attempt == self.attempts:
+                    raise
+                self._backoff(attempt, 'Uploading %s' % key, e)
+
+    def delete(self, keys):
+        """Delete the objects, DELETE_BATCH_SIZE keys per call, retrying the keys S3
+        reported errors for; returns the keys that could not be deleted."""
+        failed = []
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[start:start + DELETE_BATCH_SIZE]
+            for attempt in range(1, self.attempts + 1):
+                try:
+                    response = self.client.delete_objects(
+                        Bucket=self.bucket, Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+                    errors = response.get('Errors', [])
+                    batch = [error['Key'] for error in errors]
+                    error = errors[0].get('Code') if errors else None
+                except Exception as e:
+                    error = e
+                if not batch:
+                    break
+                if attempt < self.attempts:
+                    self._backoff(attempt, 'Deleting %d objects' % len(batch), error)
+            failed.extend(batch)
+        return failed
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def worker():
+    """The process's storage worker, set up from the STORAGE_* settings on first use."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = StorageWorker(backends.client('s3'), settings.AWS_STORAGE_BUCKET_NAME,
+                                    threads=settings.STORAGE_WORKER_THREADS, attempts=settings.STORAGE_ATTEMPTS)
+            # let a process shutting down finish the uploads it accepted
+            atexit.register(_worker.flush, SHUTDOWN_TIMEOUT)
+        return _worker
+
+
+def save_gallery_image(product, image_name, data):
+    """Add the PNG `data` to the product's gallery as `image_name`; the image is uploaded
+    after the current transaction commits."""
+    gallery = ProductGallery.objects.create(product=product, image=image_name, key=media_key(image_name), status='pending')
+    transaction.on_commit(lambda: worker().submit(_upload_gallery_image, gallery.id, gallery.key, data))
+    return gallery
+
+
+def _upload_gallery_image(gallery_id, key, data):
+    try:
+        worker().upload(key, data)
+    except Exception:
+        logger.exception('Uploading gallery image %s failed', key)
+        ProductGallery.objects.filter(id=gallery_id, status='pending').update(status='failed')
+        return
+    if not ProductGallery.objects.filter(id=gallery_id, status='pending').update(status='stored'):
+        # the image was deleted while it was being uploaded
+        worker().delete([key])
+        return
+    name = key[len(MEDIA_PREFIX):]
+    ProductGallery.objects.filter(id=gallery_id).update(derivatives=store_derivatives(name, data))
+
+
+def delete_gallery_images(galleries):
+    """Hide the images of the `galleries` queryset at once and delete their objects and
+    rows in the background; returns the number of images."""
+    ids = list(galleries.exclude(status='deleting').values_list('id', flat=True))
+    if ids:
+        ProductGallery.objects.filter(id__in=ids).update(status='deleting')
+        transaction.on_commit(lambda: worker().submit(purge_gallery_images, ids))
+    return len(ids)
+
+
+def purge_gallery_images(ids):
+    """Delete the objects of the deleting gallery rows among `ids`, then the rows whose
+    objects are gone; returns the number of rows deleted."""
+    galleries = {}
+    for gallery in ProductGallery.objects.filter(id__in=ids, status='deleting').only('id', 'image', 'key', 'derivatives'):
+        # images added in the admin are stored by the storage backend, without a key
+        galleries[gallery.id] = [gallery.key or media_key(gallery.image.name)] + derivative_keys(gallery.image.name, gallery.derivatives)
+    failed = set(worker().delete([key for keys in galleries.values() for key in keys]))
+    if failed:
+        logger.error('Could not delete %d gallery objects, e.g. %s', len(failed), sorted(failed)[0])
+    deleted = [gallery_id for gallery_id, keys in galleries.items() if failed.isdisjoint(keys)]
+    ProductGallery.objects.filter(id__in=deleted).delete()
+    return len(deleted)
+
+
+def derivative_keys(name, derivatives):
+    return [media_key(images.derivative_name(name, width, format))
+            for width in images.current_widths(name, derivatives) for format in images.FORMATS]
+
+
+def store_derivatives(name, data=None):
+    """Generate and upload the derivatives of the media file `name`, read from the default
+    storage unless its `data` is given; returns the record for the `derivatives` field."""
+    if data is None:
+        with default_storage.open(name) as f:
+            data = f.read()
+    width, derivatives = images.render_derivatives(data)
+    for derivative_width, format, content_type, content in derivatives:
+        worker().upload(media_key(images.derivative_name(name, derivative_width, format)), content, content_type,
+                        cache_control=images.CACHE_CONTROL)
+    return {'source': name, 'width': width, 'widths': sorted({d[0] for d in derivatives})}
+
+
+def refresh_derivatives(instance, field, force=False):
+    """Generate the derivatives of the image in `field` of a Product or ProductGallery
+    unless they were generated for it already; True if they were generated."""
+    image = getattr(instance, field)
+    if not image or (instance.derivatives.get('source') == image.name and not force):
+        return False
+    instance.derivatives = store_derivatives(image.name)
+    type(instance).objects.filter(pk=instance.pk).update(derivatives=instance.derivatives)
+    return True
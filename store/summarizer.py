@@ -0,0 +1,213 @@
+# Map-reduce summarization of customer reviews.
+#
+# Reviews are packed in id order into chunks that fit a token budget, each chunk is
+# summarized on its own (concurrently), and the partial summaries are merged into the
+# final summary. Chunk summaries are stored by content hash, so when new reviews arrive
+# only the chunks that changed (normally the last one) are sent to the model again.
+
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db.models import F, Max, Q
+from django.utils import timezone
+from langchain import PromptTemplate
+
+from .models import Product, ReviewRating, ReviewSummaryChunk
+from .ratelimit import closing_connections
+
+# rough size of a token in characters, good enough for budgeting prompts
+CHARS_PER_TOKEN = 4
+# budget for the reviews (or partial summaries) placed in one prompt
+CHUNK_TOKENS = 3000
+# concurrent model calls per summary
+MAX_WORKERS = 4
+# a product whose summary failed is not refreshed again for this long
+FAILURE_BACKOFF = timedelta(hours=6)
+
+logger = logging.getLogger(__name__)
+
+# single-pass prompt, used when all reviews fit in one chunk
+SUMMARY_PROMPT = PromptTemplate(
+    input_variables=["product_name","reviews"],
+    template="""
+
+        Human: Provide a review summary including pros and cons based on the customer reviews for the product {product_name}. This summary will be updated in the product webpage. Customer reviews are enclosed in <customer_reviews> tag. 
+
+        <customer_reviews>
+            {reviews}
+        <customer_reviews>
+        
+        Assistant:
+
+        """
+)
+
+CHUNK_PROMPT = PromptTemplate(
+    input_variables=["product_name", "reviews"],
+    template="""
+
+    Human: Summarize the pros and cons mentioned in the following customer reviews for the product {product_name}. Keep every distinct point, they will be merged with summaries of other reviews. Customer reviews are enclosed in <customer_reviews> tag.
+
+    <customer_reviews>
+        {reviews}
+    <customer_reviews>
+
+    Assistant:
+
+    """
+)
+
+MERGE_PROMPT = PromptTemplate(
+    input_variables=["product_name", "summaries"],
+    template="""
+
+    Human: Provide a review summary including pros and cons for the product {product_name}, based on the following summaries of its customer reviews. This summary will be updated in the product webpage. Summaries are enclosed in <review_summaries> tag.
+
+    <review_summaries>
+        {summaries}
+    <review_summaries>
+
+    Assistant:
+
+    """
+)
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_texts(texts, budget=CHUNK_TOKENS):
+    """Greedily pack texts, in order, into chunks of at most `budget` tokens.
+    A single text larger than the budget gets a chunk of its own."""
+    chunks, current, used = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and used + tokens > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def format_reviews(reviews):
+    return ''.join("<review>\n%s\n</review>\n\n" % review.review for review in reviews)
+
+
+def summarize_reviews(llm, model_id, product, reviews, prompt_template=SUMMARY_PROMPT):
+    """Summarize `reviews` of `product` with `llm`, returning (summary, final prompt).
+
+    `prompt_template` is the single-pass prompt (product_name, reviews) used when all
+    reviews fit in one chunk, so small products keep getting exactly one model call."""
+    review_texts = [format_reviews([review]) for review in reviews]
+    chunks = chunk_texts(review_texts)
+
+    if len(chunks) <= 1:
+        prompt = prompt_template.format(product_name=product.product_name, reviews=''.join(review_texts))
+        return llm(prompt), prompt
+
+    # map: summarize each chunk, reusing summaries of chunks seen before
+    partials = summarize_chunks(llm, model_id, product, [''.join(chunk) for chunk in chunks])
+
+    # reduce: merge partial summaries until they fit in one prompt
+    while True:
+        groups = chunk_texts(partials)
+        if len(groups) == 1:
+            prompt = MERGE_PROMPT.format(product_name=product.product_name, summaries='\n\n'.join(groups[0]))
+            return llm(prompt), prompt
+        partials = run_concurrently(llm, [MERGE_PROMPT.format(product_name=product.product_name, summaries='\n\n'.join(group)) for group in groups])
+
+
+def summarize_chunks(llm, model_id, product, chunks):
+    # the prompt names the product, so a summary is only reused for the same product and name
+    key = '%s\n%d\n%s\n' % (model_id, product.id, product.product_name)
+    hashes = [hashlib.sha256((key + chunk).encode('utf-8')).hexdigest() for chunk in chunks]
+    cached = dict(ReviewSummaryChunk.objects.filter(chunk_hash__in=hashes).values_list('chunk_hash', 'summary'))
+
+    missing = [i for i, chunk_hash in enumerate(hashes) if chunk_hash not in cached]
+    summaries = run_concurrently(llm, [CHUNK_PROMPT.format(product_name=product.product_name, reviews=chunks[i]) for i in missing])
+
+    ReviewSummaryChunk.objects.bulk_create([
+        ReviewSummaryChunk(product=product, chunk_hash=hashes[i], summary=summary)
+        for i, summary in zip(missing, summaries)
+    ], ignore_conflicts=True)
+    cached.update((hashes[i], summary) for i, summary in zip(missing, summaries))
+
+    return [cached[chunk_hash] for chunk_hash in hashes]
+
+
+def run_concurrently(llm, prompts):
+    if not prompts:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(prompts))) as pool:
+        return list(pool.map(closing_connections(llm), prompts))
+
+
+def save_review_summary(product, summary, watermark=None):
+    """Store a new summary version. `watermark` is the updated_at of the newest review
+    the summary covers; by default the newest approved review at the time of saving."""
+    if watermark is None:
+        watermark = ReviewRating.objects.filter(product=product, status=True).aggregate(latest=Max('updated_at'))['latest']
+    Product.objects.filter(id=product.id).update(
+        review_summary=summary,
+        review_summary_version=F('review_summary_version') + 1,
+        review_summary_updated=timezone.now(),
+        review_summary_watermark=watermark,
+        review_summary_failed=None,
+    )
+
+
+def stale_products():
+    """Products with approved reviews added or changed since their summary was generated,
+    the longest outdated first."""
+    return (Product.objects
+            .annotate(latest_review=Max('reviewrating__updated_at', filter=Q(reviewrating__status=True)))
+            .filter(latest_review__isnull=False)
+            .filter(Q(review_summary_watermark__isnull=True) | Q(latest_review__gt=F('review_summary_watermark')))
+            .order_by(F('review_summary_updated').asc(nulls_first=True), 'id'))
+
+
+class CountingLLM:
+    """Wraps an LLM callable and counts the calls made through it."""
+    def __init__(self, llm):
+        self.llm = llm
+        self.calls = 0
+
+    def __call__(self, prompt):
+        self.calls += 1
+        return self.llm(prompt)
+
+
+def refresh_stale_summaries(llm, model_id, max_calls, batch_size=20):
+    """Regenerate summaries of stale products until `max_calls` model calls are used.
+    A product that is started is always finished, so the budget can be exceeded by
+    the calls of one product. A product whose summary fails is skipped and left alone
+    for FAILURE_BACKOFF. Returns (products refreshed, model calls made)."""
+    counter = CountingLLM(llm)
+    refreshed = 0
+    skipped = []
+    while counter.calls < max_calls:
+        batch = list(stale_products()
+                     .exclude(review_summary_failed__gte=timezone.now() - FAILURE_BACKOFF)
+                     .exclude(id__in=skipped)[:batch_size])
+        if not batch:
+            break
+        for product in batch:
+            if counter.calls >= max_calls:
+                break
+            reviews = list(ReviewRating.objects.filter(product=product, status=True).order_by('id'))
+            try:
+                summary, prompt = summarize_reviews(counter, model_id, product, reviews)
+            except Exception:
+                logger.exception('Summarizing the reviews of product %d failed', product.id)
+                Product.objects.filter(id=product.id).update(review_summary_failed=timezone.now())
+                skipped.append(product.id)
+                continue
+            save_review_summary(product, summary, watermark=product.latest_review)
+            refreshed += 1
+    return refreshed, counter.calls
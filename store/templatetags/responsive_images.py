@@ -0,0 +1,33 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from retailstore.media_urls import media_urls
+from store.images import FORMATS, current_widths, derivative_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, derivatives, sizes='100vw', **attributes):
+    """<picture> of a product or gallery image, with WebP and JPEG srcsets of its derivatives
+    so browsers download the smallest copy that fills `sizes`; before the derivatives are
+    generated, the picture has the original only. Other arguments (alt, class...) become
+    attributes of the <img>, which is lazily loaded unless loading is given.
+
+    {% responsive_image product.images product.derivatives sizes="(max-width: 768px) 50vw, 300px" alt=product.product_name %}
+    """
+    if not image:
+        return ''
+    attributes.setdefault('loading', 'lazy')
+    extra = format_html_join('', ' {}="{}"', sorted(attributes.items()))
+    widths = current_widths(image.name, derivatives)
+    # the URLs of the image and all its derivatives in one call
+    candidates = [(width, format) for format in ('webp', 'jpeg') for width in widths]
+    urls = media_urls([image.name] + [derivative_name(image.name, width, format) for width, format in candidates])
+    if not widths:
+        return format_html('<picture><img src="{}"{}></picture>', urls[0], extra)
+    srcset = {format: ', '.join('%s %dw' % (url, width) for (width, f), url in zip(candidates, urls[1:]) if f == format)
+              for format in ('webp', 'jpeg')}
+    return format_html(
+        '<picture><source type="{}" srcset="{}" sizes="{}"><img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        FORMATS['webp'][1], srcset['webp'], sizes, urls[0], srcset['jpeg'], sizes, extra)
@@ -1,3 +1,1004 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from botocore.signers import CloudFrontSigner
+import requests
+from langchain import PromptTemplate
+from langchain.embeddings import BedrockEmbeddings
+from langchain.llms.bedrock import Bedrock
+from PIL import Image
+from prometheus_client import REGISTRY
+
+from accounts.models import Account
+from carts.tests import create_product, create_user
+from utils.backends import LocalObjectStore, LocalSecrets
+from utils.fake_bedrock import FakeBedrockClient as LocalBedrockClient
+from utils.instrumentation import InstrumentedBedrockClient
+from utils.ratelimit import Limit, RateLimiter, RateLimitExceeded, estimate_tokens
+from utils.singleflight import SingleFlight
+from retailstore.db_router import PIN_COOKIE, PrimaryPinMiddleware, ReplicaRouter, read_from_replica
+from retailstore.media_urls import MediaURLResolver
+from retailstore.query_budget import QueryBudgetExceeded, query_shape
+from retailstore.tracing import TRACE_HEADER
+from utils import tracing
+from orders.models import OrderProduct
+from orders.tests import create_order
+from . import descriptions, images, responses, storage, summarizer
+from .analytics import describe_views
+from .genai_views import MAX_DRAFTS_PER_REQUEST
+from .models import Draft, ModelRateLimit, Product, ProductGallery, ReviewRating, ReviewResponseBatch, ReviewSummaryRun, Variation
+from .ratelimit import DatabaseBuckets, closing_connections
 
 # Create your tests here.
+@mock.patch('retailstore.db_router.replica_configured', return_value=True)
+class ReplicaRouterTest(TestCase):
+    def route(self, model, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        view = read_from_replica(lambda request: ReplicaRouter().db_for_read(model))
+        return view(request)
+
+    def test_catalog_reads_go_to_replica(self, replica_configured):
+        self.assertEqual(self.route(Product), 'replica')
+
+    def test_other_apps_and_undecorated_code_stay_on_primary(self, replica_configured):
+        self.assertIsNone(self.route(Account))
+        self.assertIsNone(ReplicaRouter().db_for_read(Product))
+
+    def test_recent_writer_is_pinned_to_primary(self, replica_configured):
+        self.assertIsNone(self.route(Product, {PIN_COOKIE: '1'}))
+
+    def test_catalog_write_sets_pin_cookie(self, replica_configured):
+        product = create_product()
+
+        self.assertNotIn(PIN_COOKIE, self.client.get(reverse('cart')).cookies)
+        self.assertNotIn(PIN_COOKIE, self.client.post(reverse('add_cart', args=[product.id]), {'color': 'red'}).cookies)
+        response = self.client.post(reverse('submit_review', args=[product.id]), {'first_name': 'Jane', 'last_name': 'Doe', 'subject': 'Nice', 'review': 'Fits well', 'rating': 5}, HTTP_REFERER='/')
+
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_LAG_SECONDS)
+
+    def test_rate_limit_bookkeeping_does_not_pin(self, replica_configured):
+        def view(request):
+            DatabaseBuckets().take('model', Limit(requests_per_second=1), 0, 1000.0)
+            DatabaseBuckets().take('model', Limit(requests_per_second=1), 0, 1001.0)
+            return HttpResponse()
+
+        response = PrimaryPinMiddleware(view)(RequestFactory().get('/'))
+
+        self.assertTrue(ModelRateLimit.objects.exists())
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'materialized views require PostgreSQL')
+class AnalyticsViewsTest(TestCase):
+    def fetch(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchall()
+
+    def test_refresh_aggregates_orders_stock_and_reviews(self):
+        product = create_product()
+        user = create_user('shopper')
+        for order_number, quantity in (('1', 2), ('2', 3)):
+            order = create_order(user, order_number)
+            order.is_ordered = True
+            order.save()
+            OrderProduct.objects.create(order=order, user=user, product=product, quantity=quantity, product_price=10)
+        ReviewRating.objects.create(product=product, review='Great', rating=5)
+        ReviewRating.objects.create(product=product, review='Poor', rating=2)
+
+        call_command('refresh_analytics_views', stdout=mock.Mock())
+
+        self.assertEqual(self.fetch('SELECT units_sold, revenue, order_count FROM analytics_sales_by_product_day'), [(5, 50.0, 2)])
+        self.assertEqual(self.fetch('SELECT stock_status, units_sold_last_30_days FROM analytics_inventory_status'), [('in stock', 5)])
+        self.assertEqual(self.fetch('SELECT review_count, positive_reviews, negative_reviews FROM analytics_product_rating_stats'), [(2, 1, 1)])
+
+    def test_views_are_described_for_the_prompt(self):
+        for name in ('analytics_sales_by_product_day', 'analytics_inventory_status', 'analytics_product_rating_stats'):
+            self.assertIn(name, describe_views())
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        return 'summary %d' % len(self.prompts)
+
+
+class ReviewSummarizerTest(TestCase):
+    def setUp(self):
+        self.product = create_product()
+        self.template = PromptTemplate(input_variables=['product_name', 'reviews'], template='Summarize {product_name}: {reviews}')
+
+    def add_reviews(self, count):
+        ReviewRating.objects.bulk_create([ReviewRating(product=self.product, review='x' * 4000, rating=4) for i in range(count)])
+        return ReviewRating.objects.filter(product=self.product).order_by('id')
+
+    def test_few_reviews_use_a_single_prompt(self):
+        llm = FakeLLM()
+        summary, prompt = summarizer.summarize_reviews(llm, 'model', self.product, self.add_reviews(2), self.template)
+
+        self.assertEqual(llm.prompts, [prompt])
+        self.assertTrue(prompt.startswith('Summarize Shirt: <review>'))
+
+    def test_only_changed_chunks_are_summarized_again(self):
+        llm = FakeLLM()
+        summarizer.summarize_reviews(llm, 'model', self.product, self.add_reviews(10), self.template)
+        # 3000 token chunks hold two 1000 token reviews: 5 chunk summaries and one merge
+        self.assertEqual(len(llm.prompts), 6)
+
+        llm = FakeLLM()
+        summary, prompt = summarizer.summarize_reviews(llm, 'model', self.product, self.add_reviews(1), self.template)
+        self.assertEqual(len(llm.prompts), 2)
+        self.assertEqual(summary, 'summary 2')
+        self.assertIn('<review_summaries>', prompt)
+
+    def test_chunk_summaries_are_not_shared_between_products(self):
+        self.add_reviews(10)
+        other = Product.objects.create(product_name='Hat', slug='hat', price=5, images='p.jpg', stock=10, category=self.product.category)
+        ReviewRating.objects.bulk_create([ReviewRating(product=other, review='x' * 4000, rating=4) for i in range(10)])
+
+        for product in (self.product, other):
+            llm = FakeLLM()
+            summarizer.summarize_reviews(llm, 'model', product, ReviewRating.objects.filter(product=product).order_by('id'), self.template)
+            self.assertEqual(len(llm.prompts), 6)
+            self.assertIn(product.product_name, llm.prompts[0])
+
+
+class ReviewSummaryRefreshTest(TestCase):
+    def setUp(self):
+        category = create_product().category
+        self.products = [Product.objects.create(product_name='Product %d' % i, slug='product-%d' % i, price=5, images='p.jpg', stock=10, category=category) for i in range(3)]
+        for product in self.products:
+            ReviewRating.objects.create(product=product, review='Good', rating=4)
+
+    def test_only_products_with_new_approved_reviews_are_refreshed(self):
+        refreshed, calls = summarizer.refresh_stale_summaries(FakeLLM(), 'model', max_calls=10)
+        self.assertEqual((refreshed, calls), (3, 3))
+        self.assertEqual(list(summarizer.stale_products()), [])
+
+        ReviewRating.objects.create(product=self.products[1], review='Bad', rating=1)
+        ReviewRating.objects.create(product=self.products[2], review='Hidden', rating=1, status=False)
+        self.assertEqual(list(summarizer.stale_products()), [self.products[1]])
+
+        summarizer.refresh_stale_summaries(FakeLLM(), 'model', max_calls=10)
+        product = Product.objects.get(id=self.products[1].id)
+        self.assertEqual(product.review_summary_version, 2)
+        self.assertIsNotNone(product.review_summary_updated)
+
+    def test_budget_limits_model_calls(self):
+        refreshed, calls = summarizer.refresh_stale_summaries(FakeLLM(), 'model', max_calls=2)
+
+        self.assertEqual((refreshed, calls), (2, 2))
+        self.assertEqual(len(summarizer.stale_products()), 1)
+
+    def test_failing_product_is_skipped_and_backed_off(self):
+        class FailingLLM(FakeLLM):
+            def __call__(self, prompt):
+                if 'Product 0' in prompt:
+                    raise ValueError('Error raised by bedrock service')
+                return super().__call__(prompt)
+
+        with self.assertLogs('store.summarizer', 'ERROR'):
+            refreshed, calls = summarizer.refresh_stale_summaries(FailingLLM(), 'model', max_calls=10)
+
+        self.assertEqual((refreshed, calls), (2, 3))
+        self.assertIsNotNone(Product.objects.get(id=self.products[0].id).review_summary_failed)
+        # the next run leaves it alone instead of spending calls on it again
+        self.assertEqual(summarizer.refresh_stale_summaries(FailingLLM(), 'model', max_calls=10), (0, 0))
+
+    @mock.patch('store.management.commands.refresh_review_summaries.clients')
+    @mock.patch('store.management.commands.refresh_review_summaries.Bedrock', return_value=FakeLLM())
+    def test_failed_refresh_counts_its_calls(self, bedrock, clients):
+        def refresh(llm, *args):
+            llm('prompt')
+            raise ConnectionError()
+
+        with mock.patch('store.management.commands.refresh_review_summaries.refresh_stale_summaries', refresh):
+            with self.assertRaises(ConnectionError):
+                call_command('refresh_review_summaries', stdout=mock.Mock())
+
+        self.assertEqual(ReviewSummaryRun.objects.get().model_calls, 1)
+
+    @skipUnless(connection.vendor == 'postgresql', 'advisory locks require PostgreSQL')
+    @mock.patch('store.management.commands.refresh_review_summaries.clients')
+    @mock.patch('store.management.commands.refresh_review_summaries.Bedrock', return_value=FakeLLM())
+    def test_refresh_command_releases_its_lock(self, bedrock, clients):
+        call_command('refresh_review_summaries', stdout=mock.Mock())
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(ReviewSummaryRun.objects.get().products, 3)
+
+
+class ThrottledLLM(FakeLLM):
+    """Fails the first `throttles` calls the way langchain reports Bedrock throttling."""
+    def __init__(self, throttles):
+        super().__init__()
+        self.throttles = throttles
+
+    def __call__(self, prompt):
+        if self.throttles:
+            self.throttles -= 1
+            raise ValueError('Error raised by bedrock service: An error occurred (ThrottlingException) when calling the InvokeModel operation')
+        return 'Here is a description:\n' + super().__call__(prompt)
+
+
+class ProductDescriptionTest(TestCase):
+    def setUp(self):
+        self.category = create_product().category
+        self.products = [Product.objects.create(product_name='Product %d' % i, slug='product-%d' % i, price=5, images='p.jpg', stock=10, category=self.category) for i in range(5)]
+        Variation.objects.create(product=self.products[0], variation_category='color', variation_value='Blue')
+        Variation.objects.create(product=self.products[0], variation_category='size', variation_value='small')
+
+    def test_drafts_are_saved_in_batches(self):
+        products = descriptions.select_products(ids=[product.id for product in self.products])
+        llm = ThrottledLLM(0)
+        # per batch of 2: products, colors, one INSERT; plus the empty last batch
+        with self.assertNumQueries(10):
+            stats = descriptions.generate_descriptions(llm, products, workers=2, batch_size=2)
+
+        self.assertEqual((stats['products'], stats['drafted'], stats['failed']), (5, 5, 0))
+        self.assertEqual(Draft.objects.filter(kind='description').count(), 5)
+        self.assertTrue(Draft.objects.get(product=self.products[1]).text.startswith('summary'))
+        self.assertEqual(sum('<available_colors>\n            Blue\n' in prompt for prompt in llm.prompts), 1)
+        # drafted products are skipped next time
+        self.assertEqual(descriptions.select_products(ids=[product.id for product in self.products]).count(), 0)
+
+    def test_throttled_calls_are_retried(self):
+        sleeps = []
+        response, retries = descriptions.call_with_retries(ThrottledLLM(2), 'prompt', sleep=sleeps.append)
+        self.assertEqual((response, retries), ('Here is a description:\nsummary 1', 2))
+        self.assertEqual(len(sleeps), 2)
+
+        with self.assertRaises(ValueError):
+            descriptions.call_with_retries(ThrottledLLM(3), 'prompt', retries=2, sleep=sleeps.append)
+
+    def test_command_requires_a_selection(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_product_descriptions')
+
+
+class ReviewResponseQueueTest(TestCase):
+    def setUp(self):
+        self.product = create_product()
+        self.manager = create_user('manager')
+        self.manager.role = 'Manager'
+        self.manager.save()
+        self.reviews = [ReviewRating.objects.create(product=self.product, review='Review %d' % rating, rating=rating) for rating in (4, 1, 3)]
+
+    def test_low_ratings_are_drafted_first(self):
+        llm = FakeLLM()
+        drafted, failed = responses.draft_review_responses(llm, responses.pending_reviews()[:2], self.manager, workers=2)
+
+        self.assertEqual((drafted, failed), (2, 0))
+        self.assertEqual(list(responses.draft_queue()), [self.reviews[1], self.reviews[2]])
+        self.assertEqual(list(responses.pending_reviews()), [self.reviews[0]])
+        review = ReviewRating.objects.get(id=self.reviews[1].id)
+        self.assertIn('Review 1', review.prompt)
+        self.assertFalse(review.response_approved)
+
+    def test_manager_approves_and_discards_drafts(self):
+        responses.draft_review_responses(FakeLLM(), responses.pending_reviews(), self.manager)
+        self.client.force_login(self.manager)
+        url = reverse('review_responses')
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['reviews']), 3)
+
+        approved, discarded = self.reviews[1], self.reviews[2]
+        self.client.post(url, {'approve': '', 'selected': [approved.id], 'response_%d' % approved.id: 'Sorry!'})
+        self.client.post(url, {'discard': '', 'selected': [discarded.id]})
+
+        self.assertEqual(list(responses.draft_queue()), [self.reviews[0]])
+        self.assertEqual(list(responses.pending_reviews()), [discarded])
+        self.assertEqual(ReviewRating.objects.get(id=approved.id).generated_response, 'Sorry!')
+        self.assertContains(self.client.get(self.product.get_url()), 'Sorry!')
+
+    def test_drafts_are_queued_and_drafted_in_the_background(self):
+        self.client.force_login(self.manager)
+        url = reverse('review_responses')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(url, {'draft_responses': '', 'count': '2'})
+        batch = ReviewResponseBatch.objects.get()
+        self.assertEqual((batch.size, batch.status, batch.manager), (2, 'queued', self.manager))
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(list(responses.draft_queue()), [])
+        self.assertContains(self.client.get(url), 'window.location.reload')
+
+        self.assertTrue(responses.run_batch(batch.id, FakeLLM()))
+        self.assertFalse(responses.run_batch(batch.id, FakeLLM()))
+        batch.refresh_from_db()
+        self.assertEqual((batch.status, batch.drafted, batch.failed), ('done', 2, 0))
+        self.assertEqual(list(responses.draft_queue()), [self.reviews[1], self.reviews[2]])
+        self.assertContains(self.client.get(url), '2 drafted')
+
+    def test_draft_counts_are_checked(self):
+        self.client.force_login(self.manager)
+        url = reverse('review_responses')
+
+        for count in ('abc', '-5', '1000'):
+            self.client.post(url, {'draft_responses': '', 'count': count})
+        self.assertEqual(list(ReviewResponseBatch.objects.order_by('id').values_list('size', flat=True)), [1, MAX_DRAFTS_PER_REQUEST])
+
+    def test_command_drafts_the_queued_batches(self):
+        ReviewResponseBatch.objects.create(manager=self.manager, size=5)
+
+        with mock.patch('store.responses.bulk_llm', return_value=FakeLLM()):
+            call_command('draft_review_responses', queued=True, stdout=io.StringIO())
+
+        self.assertEqual(ReviewResponseBatch.objects.get().status, 'done')
+        self.assertEqual(list(responses.pending_reviews()), [])
+
+    def test_batches_claim_their_reviews(self):
+        first, second, third = [ReviewResponseBatch.objects.create(manager=self.manager, size=2, status='running') for i in range(3)]
+
+        self.assertEqual(list(responses.claim_reviews(first)), [self.reviews[1], self.reviews[2]])
+        self.assertEqual(list(responses.claim_reviews(second)), [self.reviews[0]])
+        # the reviews of a finished batch that are still pending (their drafts failed) are claimed again
+        ReviewResponseBatch.objects.filter(id=first.id).update(status='done')
+        self.assertEqual(list(responses.claim_reviews(third)), [self.reviews[1], self.reviews[2]])
+
+    def test_command_drafts_in_a_batch_of_its_own(self):
+        with mock.patch('store.management.commands.draft_review_responses.bulk_llm', return_value=FakeLLM()):
+            call_command('draft_review_responses', manager=self.manager.email, limit=2, stdout=io.StringIO())
+
+        batch = ReviewResponseBatch.objects.get()
+        self.assertEqual((batch.status, batch.drafted), ('done', 2))
+        self.assertEqual(list(responses.pending_reviews()), [self.reviews[0]])
+
+    def test_queue_is_for_managers_only(self):
+        self.client.force_login(create_user('customer'))
+        self.assertEqual(self.client.get(reverse('review_responses')).status_code, 403)
+
+
+class DraftTest(TestCase):
+    def setUp(self):
+        self.product = create_product()
+        ReviewRating.objects.create(product=self.product, review='Good', rating=4)
+
+    def test_product_page_does_not_write_the_session(self):
+        response = self.client.get(self.product.get_url())
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+        self.client.force_login(create_user('customer'))
+        response = self.client.get(self.product.get_url())
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    @mock.patch('store.genai_views.summarize_reviews', return_value=('Great shirt', 'Summarize'))
+    def test_summary_draft_is_kept_until_saved(self, summarize_reviews):
+        page = reverse('generate_summary', args=[self.product.id])
+        self.client.get(reverse('generate_review_summary', args=[self.product.id]), {'llm': 'Claude'}, HTTP_REFERER=page)
+
+        draft = Draft.objects.get(kind='summary')
+        self.assertEqual(self.client.session['drafts'], {'summary': draft.id})
+        self.assertContains(self.client.get(page), 'Great shirt')
+
+        # a new generation replaces the draft
+        self.client.get(reverse('generate_review_summary', args=[self.product.id]), {'llm': 'Claude'}, HTTP_REFERER=page)
+        self.assertEqual(Draft.objects.filter(kind='summary').count(), 1)
+
+        self.client.post(reverse('save_summary', args=[self.product.id]), {'save_summary': ''})
+        self.assertEqual(Product.objects.get(id=self.product.id).review_summary, 'Great shirt')
+        self.assertFalse(Draft.objects.exists())
+        self.assertEqual(self.client.session['drafts'], {})
+
+
+class FakeBedrockClient:
+    def __init__(self, error=None):
+        self.error = error
+        self.meta = 'meta'
+
+    def invoke_model(self, **kwargs):
+        if self.error:
+            raise self.error
+        headers = {'x-amzn-bedrock-input-token-count': '1000', 'x-amzn-bedrock-output-token-count': '500'}
+        return {'ResponseMetadata': {'HTTPHeaders': headers}, 'body': None}
+
+
+class BedrockInstrumentationTest(TestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_calls_are_recorded_per_feature(self):
+        client = InstrumentedBedrockClient(FakeBedrockClient()).for_feature('test_feature')
+        labels = dict(model='anthropic.claude-instant-v1', feature='test_feature')
+        calls = self.sample('bedrock_request_duration_seconds_count', outcome='success', **labels)
+        cost = self.sample('bedrock_cost_dollars_total', **labels)
+
+        with self.assertLogs('bedrock', 'INFO') as logs:
+            client.invoke_model(body='{}', modelId='anthropic.claude-instant-v1')
+
+        self.assertEqual(self.sample('bedrock_request_duration_seconds_count', outcome='success', **labels), calls + 1)
+        self.assertGreater(self.sample('bedrock_tokens_total', direction='output', **labels), 0)
+        self.assertAlmostEqual(self.sample('bedrock_cost_dollars_total', **labels) - cost, 0.002)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['feature'], record['outcome'], record['input_tokens']), ('test_feature', 'success', 1000))
+        # other attributes come from the wrapped client
+        self.assertEqual(client.meta, 'meta')
+
+    def test_throttled_calls_are_labelled(self):
+        error = ClientError({'Error': {'Code': 'ThrottlingException'}}, 'InvokeModel')
+        client = InstrumentedBedrockClient(FakeBedrockClient(error), 'test_feature')
+        labels = dict(model='model', feature='test_feature', outcome='throttled')
+        throttled = self.sample('bedrock_request_duration_seconds_count', **labels)
+
+        with self.assertLogs('bedrock', 'INFO'), self.assertRaises(ClientError):
+            client.invoke_model(body='{}', modelId='model')
+        self.assertEqual(self.sample('bedrock_request_duration_seconds_count', **labels), throttled + 1)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint_requires_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(response, 'bedrock_request_duration_seconds')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+
+class RateLimiterTest(TestCase):
+    MODEL = 'anthropic.claude-instant-v1'
+
+    def limiter(self, clock, buckets=None, max_wait=20, **limit):
+        return RateLimiter({self.MODEL: Limit(**limit)}, buckets, max_wait=max_wait, clock=clock, sleep=clock.sleep)
+
+    def test_calls_wait_for_the_request_and_token_buckets(self):
+        clock = FakeClock()
+        limiter = self.limiter(clock, requests_per_second=2, tokens_per_minute=600)
+
+        for _ in range(2):
+            limiter.acquire(self.MODEL, 100).release()
+        self.assertEqual(clock.sleeps, [])
+        # the request bucket refills at 2 a second
+        limiter.acquire(self.MODEL, 100).release()
+        self.assertEqual(clock.sleeps, [0.5])
+        # 300 of the 600 tokens are left, plus 5 refilled
+        limiter.acquire(self.MODEL, 400).release()
+        self.assertEqual(clock.sleeps, [0.5, 9.5])
+        # other models are not limited
+        limiter.acquire('amazon.titan-tg1-large', 10 ** 6).release()
+        self.assertEqual(len(clock.sleeps), 2)
+
+    def test_the_estimate_is_corrected_with_the_tokens_used(self):
+        clock = FakeClock()
+        limiter = self.limiter(clock, tokens_per_minute=600)
+
+        with limiter.acquire(self.MODEL, 500) as permit:
+            permit.used(50)
+        limiter.acquire(self.MODEL, 550).release()
+        self.assertEqual(clock.sleeps, [])
+
+    def test_calls_over_the_max_wait_are_throttled(self):
+        clock = FakeClock()
+        limiter = self.limiter(clock, max_wait=0.5, requests_per_second=1)
+        limiter.acquire(self.MODEL).release()
+
+        with self.assertRaises(RateLimitExceeded) as error:
+            limiter.acquire(self.MODEL)
+        self.assertEqual(clock.sleeps, [])
+        # the bulk commands back off and retry it
+        self.assertTrue(descriptions.is_throttled(error.exception))
+
+    def test_concurrency_is_capped(self):
+        limiter = self.limiter(FakeClock(), max_wait=0.01, concurrency=1)
+
+        with limiter.acquire(self.MODEL):
+            with self.assertRaises(RateLimitExceeded):
+                limiter.acquire(self.MODEL)
+        limiter.acquire(self.MODEL).release()
+
+    def test_workers_share_the_database_buckets(self):
+        clock = FakeClock()
+        workers = [self.limiter(clock, DatabaseBuckets(), requests_per_second=1, tokens_per_minute=600) for _ in range(2)]
+
+        with workers[0].acquire(self.MODEL, 300) as permit:
+            permit.used(200)
+        workers[1].acquire(self.MODEL, 100).release()
+
+        self.assertEqual(clock.sleeps, [1.0])
+        bucket = ModelRateLimit.objects.get(model_id=self.MODEL)
+        self.assertEqual((bucket.requests_left, bucket.tokens_left, bucket.counted), (0, 310, 1001))
+
+    def test_pool_tasks_close_their_connections(self):
+        with mock.patch('store.ratelimit.connections') as connections:
+            with ThreadPoolExecutor(1) as pool:
+                self.assertEqual(pool.submit(closing_connections(lambda x: x * 2), 21).result(), 42)
+        connections.close_all.assert_called_once_with()
+
+    def test_instrumented_calls_take_the_tokens_they_used(self):
+        clock = FakeClock()
+        limiter = self.limiter(clock, tokens_per_minute=6000)
+        client = InstrumentedBedrockClient(FakeBedrockClient(), 'test_feature', limiter)
+        body = json.dumps({'prompt': 'x' * 400, 'max_tokens_to_sample': 200})
+        self.assertEqual(estimate_tokens(body), 301)
+
+        with self.assertLogs('bedrock', 'INFO'):
+            client.for_feature('other').invoke_model(body=body, modelId=self.MODEL)
+
+        # 1000 input and 500 output tokens
+        self.assertEqual(limiter.buckets._states[self.MODEL][1], 4500)
+
+
+class BlockingBedrockClient:
+    """Answers each body with its reverse once `release` is set."""
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def invoke_model(self, body, modelId, **kwargs):
+        self.calls.append(body)
+        self.release.wait(5)
+        if body == 'fail':
+            raise ClientError({'Error': {'Code': 'ValidationException'}}, 'InvokeModel')
+        data = body[::-1].encode()
+        return {'ResponseMetadata': {'HTTPHeaders': {}}, 'body': StreamingBody(io.BytesIO(data), len(data))}
+
+
+class CoalescingTest(TestCase):
+    def sample(self, outcome):
+        return REGISTRY.get_sample_value('bedrock_coalesced_calls_total', {'model': 'model', 'feature': 'test_feature', 'outcome': outcome}) or 0
+
+    def invoke_concurrently(self, client, bedrock, bodies):
+        ready = threading.Barrier(len(bodies) + 1)
+
+        def invoke(body):
+            ready.wait(5)
+            try:
+                return client.invoke_model(body=body, modelId='model')['body'].read().decode()
+            except ClientError as e:
+                return e.response['Error']['Code']
+
+        with ThreadPoolExecutor(len(bodies)) as pool:
+            futures = [pool.submit(invoke, body) for body in bodies]
+            ready.wait(5)
+            # let the identical calls join the ones in flight
+            threading.Event().wait(0.1)
+            bedrock.release.set()
+            return [future.result() for future in futures]
+
+    def test_identical_calls_in_flight_are_made_once(self):
+        bedrock = BlockingBedrockClient()
+        client = InstrumentedBedrockClient(bedrock, 'test_feature', coalescer=SingleFlight(timeout=5))
+        shared = self.sample('shared')
+
+        with self.assertLogs('bedrock', 'INFO'):
+            results = self.invoke_concurrently(client, bedrock, ['abc'] * 4 + ['xyz', 'fail', 'fail'])
+
+        self.assertEqual(results, ['cba'] * 4 + ['zyx'] + ['ValidationException'] * 2)
+        self.assertEqual(sorted(bedrock.calls), ['abc', 'fail', 'xyz'])
+        self.assertEqual(self.sample('shared') - shared, 4)
+        # once the call is done, the next identical call is made again
+        with self.assertLogs('bedrock', 'INFO'):
+            self.assertEqual(client.invoke_model(body='abc', modelId='model')['body'].read(), b'cba')
+        self.assertEqual(len(bedrock.calls), 4)
+
+    def test_waiting_callers_time_out_and_call_themselves(self):
+        flight = SingleFlight(timeout=0.01)
+        release = threading.Event()
+        with ThreadPoolExecutor(1) as pool:
+            leader = pool.submit(flight.do, 'key', lambda: release.wait(5) and 'leader')
+            while not flight._calls:
+                threading.Event().wait(0.001)
+
+            self.assertEqual(flight.do('key', lambda: 'own'), ('own', 'timeout'))
+            release.set()
+            self.assertEqual(leader.result(), ('leader', 'leader'))
+
+
+class LocalBackendTest(TestCase):
+    def setUp(self):
+        self.bedrock = LocalBedrockClient(latency_ms=0, tokens_per_second=0, output_tokens=20)
+
+    def test_fake_bedrock_answers_like_the_models(self):
+        claude = Bedrock(model_id='anthropic.claude-instant-v1', client=self.bedrock)
+        self.assertTrue(claude('Human: Describe a shirt\n\nAssistant:').startswith('Here is the text you asked for:\n'))
+        self.assertIn('<query>', claude('Human: Enclose the query in <query></query>.\n\nAssistant:'))
+
+        titan = Bedrock(model_id='amazon.titan-tg1-large', client=self.bedrock, model_kwargs={'maxTokenCount': 10})
+        self.assertGreater(len(titan('Describe a shirt')), 0)
+
+        embeddings = BedrockEmbeddings(model_id='amazon.titan-embed-g1-text-02', client=self.bedrock)
+        vector = embeddings.embed_query('red shirt')
+        self.assertEqual(len(vector), 1536)
+        self.assertEqual(vector, embeddings.embed_query('red shirt'))
+
+        response = self.bedrock.invoke_model(body=json.dumps({'text_prompts': [{'text': 'red', 'weight': 1.0}]}), modelId='stability.stable-diffusion-xl')
+        self.assertEqual(json.loads(response['body'].read())['artifacts'][0]['finishReason'], 'SUCCESS')
+
+        stream = self.bedrock.invoke_model_with_response_stream(body=json.dumps({'prompt': 'Human: Hi\n\nAssistant:'}), modelId='anthropic.claude-instant-v1')
+        text = ''.join(json.loads(event['chunk']['bytes'])['completion'] for event in stream['body'])
+        self.assertTrue(text.startswith('Here is the text'))
+
+    def test_fake_bedrock_throttles_over_its_concurrency(self):
+        bedrock = LocalBedrockClient(latency_ms=0, tokens_per_second=0, max_concurrency=1)
+        with bedrock._slot('InvokeModel'):
+            with self.assertRaises(ClientError):
+                bedrock.invoke_model(body=json.dumps({'prompt': 'Hi'}), modelId='anthropic.claude-instant-v1')
+        bedrock.invoke_model(body=json.dumps({'prompt': 'Hi'}), modelId='anthropic.claude-instant-v1')
+
+    def test_local_object_store_and_secrets(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = LocalObjectStore(root)
+            store.upload_fileobj(io.BytesIO(b'png'), 'bucket', 'media/store/products/a.png')
+            self.assertEqual(store.get_object(Bucket='bucket', Key='media/store/products/a.png')['Body'].read(), b'png')
+            store.delete_object(Bucket='bucket', Key='media/store/products/a.png')
+            with self.assertRaises(ClientError):
+                store.get_object(Bucket='bucket', Key='media/store/products/a.png')
+            with self.assertRaises(ValueError):
+                store.put_object(Bucket='bucket', Key='../../etc/passwd', Body='x')
+
+            path = root + '/secrets.json'
+            with open(path, 'w') as f:
+                json.dump({'postgresdb-secret': {'host': 'db'}}, f)
+            secret = LocalSecrets(path).get_secret_value(SecretId='postgresdb-secret')
+            self.assertEqual(json.loads(secret['SecretString']), {'host': 'db'})
+
+
+class FlakyObjectStore(LocalObjectStore):
+    """Fails the first `failures` calls of each operation and counts the calls."""
+    def __init__(self, root, failures=0, undeletable=()):
+        super().__init__(root)
+        self.failures = failures
+        self.undeletable = set(undeletable)
+        self.calls = []
+
+    def _call(self, operation):
+        self.calls.append(operation)
+        if self.calls.count(operation) <= self.failures:
+            raise ClientError({'Error': {'Code': 'SlowDown'}}, operation)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self._call('PutObject')
+        super().upload_fileobj(Fileobj, Bucket, Key, **kwargs)
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self._call('DeleteObjects')
+        errors = [{'Key': o['Key'], 'Code': 'AccessDenied'} for o in Delete['Objects'] if o['Key'] in self.undeletable]
+        super().delete_objects(Bucket, {'Objects': [o for o in Delete['Objects'] if o['Key'] not in self.undeletable]})
+        return {'Errors': errors} if errors else {}
+
+
+def png(width, height, mode='RGBA'):
+    out = io.BytesIO()
+    Image.new(mode, (width, height), (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(out, format='PNG')
+    return out.getvalue()
+
+
+class StorageTestCase(TestCase):
+    def setUp(self):
+        self.product = create_product()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+        # media files are read from where the worker stores them, as with AWS_BACKEND=local
+        media = override_settings(MEDIA_ROOT=os.path.join(self.root, 'bucket', 'media'))
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def use_worker(self, **kwargs):
+        worker = storage.StorageWorker(FlakyObjectStore(self.root, **kwargs), 'bucket', threads=0, retry_delay=0)
+        patcher = mock.patch.object(storage, '_worker', worker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return worker
+
+    def stored(self, key):
+        return os.path.isfile(os.path.join(self.root, 'bucket', key))
+
+
+class GalleryStorageTest(StorageTestCase):
+    def test_image_is_uploaded_after_commit_and_retried(self):
+        worker = self.use_worker(failures=2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            gallery = storage.save_gallery_image(self.product, 'store/products/shirt_generated.png', png(20, 20))
+        self.assertEqual((gallery.key, gallery.status), ('media/store/products/shirt_generated.png', 'pending'))
+        self.assertEqual(worker.client.calls, [])
+
+        with self.assertLogs('store.storage', 'WARNING'):
+            callbacks[0]()
+
+        # two failed attempts, the image, then its WebP and JPEG derivative
+        self.assertEqual(worker.client.calls, ['PutObject'] * 5)
+        self.assertTrue(self.stored('media/store/products/shirt_generated.png'))
+        self.assertEqual(ProductGallery.objects.get().status, 'stored')
+
+    def test_failed_upload_is_not_shown(self):
+        self.use_worker(failures=4)
+        with self.assertLogs('store.storage', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            storage.save_gallery_image(self.product, 'store/products/shirt_generated.png', png(20, 20))
+
+        self.assertEqual(ProductGallery.objects.get().status, 'failed')
+        self.assertEqual(list(self.client.get(self.product.get_url()).context['product_gallery']), [])
+
+    def test_studio_shows_the_design_idea_once_stored(self):
+        self.use_worker(failures=4)
+        name = 'store/products/shirt_generated.png'
+        with self.captureOnCommitCallbacks() as callbacks:
+            storage.save_gallery_image(self.product, name, png(20, 20))
+        draft = Draft.objects.create(kind='image', product=self.product, image=name)
+        session = self.client.session
+        session['drafts'] = {'image': draft.id}
+        session.save()
+        url = reverse('design_studio', args=[self.product.id])
+
+        response = self.client.get(url)
+        self.assertContains(response, 'Saving the generated image')
+        self.assertNotContains(response, 'Design idea saved!')
+
+        with self.assertLogs('store.storage', 'WARNING'):
+            callbacks[0]()
+        response = self.client.get(url)
+        self.assertContains(response, 'could not be saved')
+        self.assertNotContains(response, draft.image.url)
+
+        ProductGallery.objects.update(status='stored')
+        response = self.client.get(url)
+        self.assertContains(response, 'Design idea saved!')
+        self.assertContains(response, draft.image.url)
+
+    def test_delete_all_deletes_the_objects_in_one_call(self):
+        worker = self.use_worker()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                storage.save_gallery_image(self.product, 'store/products/shirt_%d.png' % i, png(20, 20))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('create_design_ideas', args=[self.product.id]), {'delete_all': ''})
+
+        # each image and its two derivatives are deleted in the same call
+        self.assertEqual(worker.client.calls, ['PutObject'] * 9 + ['DeleteObjects'])
+        self.assertFalse(ProductGallery.objects.exists())
+        self.assertFalse(any(self.stored('media/store/products/shirt_%d.png' % i) for i in range(3)))
+
+    def test_deletes_are_batched_and_retried(self):
+        worker = self.use_worker(failures=1, undeletable=['key-7'])
+        keys = ['key-%d' % i for i in range(2500)]
+
+        with self.assertLogs('store.storage', 'WARNING'):
+            self.assertEqual(worker.delete(keys), ['key-7'])
+        # the first batch fails once, then its key with an error is retried until the attempts run out
+        self.assertEqual(worker.client.calls.count('DeleteObjects'), worker.attempts + 2)
+
+    def test_clean_gallery_storage_removes_lost_and_failed_images(self):
+        self.use_worker()
+        kept = ProductGallery.objects.create(product=self.product, image='store/products/new.png', key='media/store/products/new.png', status='pending')
+        lost = ProductGallery.objects.create(product=self.product, image='store/products/lost.png', key='media/store/products/lost.png', status='pending')
+        ProductGallery.objects.filter(id=lost.id).update(created_date=lost.created_date - timedelta(hours=2))
+        ProductGallery.objects.create(product=self.product, image='store/products/failed.png', status='failed')
+
+        out = io.StringIO()
+        call_command('clean_gallery_storage', stdout=out)
+
+        self.assertEqual(list(ProductGallery.objects.all()), [kept])
+        self.assertIn('Deleted 2 of 2', out.getvalue())
+
+    def test_worker_threads(self):
+        worker = storage.StorageWorker(LocalObjectStore(self.root), 'bucket', threads=2)
+        for i in range(5):
+            worker.submit(worker.upload, 'media/%d.png' % i, b'png')
+
+        self.assertTrue(worker.flush(timeout=10))
+        self.assertTrue(all(self.stored('media/%d.png' % i) for i in range(5)))
+
+
+class ImageDerivativeTest(StorageTestCase):
+    def test_derivatives_are_never_wider_than_the_image(self):
+        width, derivatives = images.render_derivatives(png(800, 400))
+
+        self.assertEqual(width, 800)
+        self.assertEqual([(w, f) for w, f, _, _ in derivatives],
+                         [(w, f) for w in (160, 320, 640, 800) for f in ('webp', 'jpeg')])
+        webp = Image.open(io.BytesIO(derivatives[2][3]))
+        self.assertEqual((webp.format, webp.size), ('WEBP', (320, 160)))
+        self.assertEqual(Image.open(io.BytesIO(derivatives[3][3])).format, 'JPEG')
+        self.assertEqual(images.derivative_name('store/products/a.png', 320, 'jpeg'), 'store/products/a.320w.jpg')
+
+    def test_gallery_images_get_derivatives_and_a_srcset(self):
+        worker = self.use_worker()
+        with self.captureOnCommitCallbacks(execute=True):
+            gallery = storage.save_gallery_image(self.product, 'store/products/shirt_generated.png', png(1200, 1200))
+
+        gallery.refresh_from_db()
+        self.assertEqual(gallery.derivatives, {'source': 'store/products/shirt_generated.png', 'width': 1200, 'widths': [160, 320, 640, 1024]})
+        self.assertTrue(self.stored('media/store/products/shirt_generated.1024w.webp'))
+        response = self.client.get(self.product.get_url())
+        media = settings.MEDIA_URL
+        self.assertContains(response, '<source type="image/webp" srcset="%sstore/products/shirt_generated.160w.webp 160w, ' % media)
+        self.assertContains(response, '%sstore/products/shirt_generated.1024w.jpg 1024w" sizes="80px"' % media)
+        # the product image has no derivatives yet
+        self.assertContains(response, '<picture><img src="%sphotos/products/shirt.jpg" alt="Shirt" loading="eager"></picture>' % media)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            storage.delete_gallery_images(ProductGallery.objects.all())
+        self.assertEqual(worker.client.calls.count('DeleteObjects'), 1)
+        self.assertEqual(os.listdir(os.path.join(self.root, 'bucket', 'media', 'store', 'products')), [])
+
+    def test_backfill_command(self):
+        self.use_worker()
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'photos', 'products'))
+        with open(os.path.join(settings.MEDIA_ROOT, 'photos', 'products', 'shirt.jpg'), 'wb') as f:
+            f.write(png(500, 600, mode='RGB'))
+
+        out = io.StringIO()
+        call_command('generate_image_derivatives', stdout=out)
+        self.assertIn('Images: 1, up to date: 0, generated: 1, failed: 0', out.getvalue())
+        self.assertEqual(Product.objects.get().derivatives['widths'], [160, 320, 500])
+        self.assertTrue(self.stored('media/photos/products/shirt.500w.jpg'))
+
+        call_command('generate_image_derivatives', stdout=out)
+        self.assertIn('Images: 1, up to date: 1, generated: 0', out.getvalue())
+
+
+class MediaURLTest(TestCase):
+    base = 'https://cdn.example.com/media/'
+
+    def test_public_urls(self):
+        resolver = MediaURLResolver(self.base)
+
+        self.assertEqual(resolver.urls(['store/products/a b.png', 'photos/products/shirt.jpg']),
+                         [self.base + 'store/products/a%20b.png', self.base + 'photos/products/shirt.jpg'])
+        self.assertEqual(resolver.external(self.base + 'x.jpg?X-Amz-Signature=old'), self.base + 'x.jpg')
+        self.assertEqual(resolver.external('https://other.example.com/x.jpg?sig=1'), 'https://other.example.com/x.jpg')
+
+    def test_presigned_urls_are_reused_until_close_to_expiry(self):
+        now = [1000.0]
+        presign = mock.Mock(side_effect=lambda name, expire: 'https://s3/%s?expires=%d' % (name, now[0] + expire))
+        resolver = MediaURLResolver(self.base, presign=presign, expire=3600, refresh=900, clock=lambda: now[0])
+
+        first = resolver.urls(['a.png', 'b.png'])
+        now[0] += 2000
+        self.assertEqual(resolver.urls(['a.png', 'b.png', 'a.png']), first + first[:1])
+        self.assertEqual(presign.call_count, 2)
+
+        now[0] += 1000
+        self.assertEqual(resolver.url('a.png'), 'https://s3/a.png?expires=7600')
+        self.assertEqual(presign.call_count, 3)
+
+    def test_one_cloudfront_signature_for_all_urls(self):
+        rsa_signer = mock.Mock(return_value=b'signature')
+        resolver = MediaURLResolver(self.base, cloudfront_signer=CloudFrontSigner('KEYID', rsa_signer), clock=lambda: 1000.0)
+
+        urls = resolver.urls(['p%d.jpg' % i for i in range(50)])
+
+        self.assertEqual(rsa_signer.call_count, 1)
+        policy = json.loads(rsa_signer.call_args[0][0])
+        self.assertEqual(policy['Statement'][0]['Resource'], self.base + '*')
+        self.assertEqual(policy['Statement'][0]['Condition']['DateLessThan']['AWS:EpochTime'], 4600)
+        self.assertRegex(urls[7], r'^https://cdn\.example\.com/media/p7\.jpg\?Policy=[^&]+&Signature=[^&]+&Key-Pair-Id=KEYID$')
+
+    @override_settings(MEDIA_URL='https://cdn.example.com/media/', MEDIA_URL_SIGNING='')
+    def test_media_storage_urls_come_from_the_resolver(self):
+        from retailstore.media_store import MediaStorage
+
+        with mock.patch('storages.backends.s3boto3.S3Boto3Storage.url') as backend_url:
+            self.assertEqual(MediaStorage().url('photos/products/shirt.jpg'), self.base + 'photos/products/shirt.jpg')
+        backend_url.assert_not_called()
+
+
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        self.product = create_product()
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('store'))
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[0-9.]+;desc="\d+ queries", db-dup;desc="0 duplicate queries", app;dur=[0-9.]+$')
+
+    def test_query_shape_ignores_parameters(self):
+        self.assertEqual(query_shape('SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = \'x\' LIMIT 21'),
+                         query_shape('SELECT *  FROM t WHERE id IN (%s) AND name = \'y\' LIMIT 1'))
+
+    @override_settings(QUERY_BUDGETS={'product_detail': {'queries': 1}}, QUERY_BUDGET_STRICT=False)
+    def test_request_over_budget_is_logged(self):
+        with self.assertLogs('query_budget', 'WARNING') as logs:
+            self.client.get(self.product.get_url())
+
+        event = json.loads(logs.records[0].getMessage())
+        self.assertEqual(event['view'], 'product_detail')
+        self.assertEqual(event['over'], ['queries %d > 1' % event['queries']])
+
+    @override_settings(QUERY_BUDGETS={'store': 1}, QUERY_BUDGET_STRICT=True)
+    def test_strict_budget_fails_the_request(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('store'))
+
+
+class TracingTest(TestCase):
+    def setUp(self):
+        self.product = create_product()
+        self.addCleanup(tracing.configure, None)
+
+    def names(self, spans):
+        return [span['name'] for span in tracing.as_dicts(spans)]
+
+    @override_settings(TRACING_EXPORTER='')
+    def test_no_trace_when_tracing_is_off(self):
+        self.assertNotIn(TRACE_HEADER, self.client.get(self.product.get_url()))
+
+    @override_settings(TRACING_EXPORTER='memory')
+    def test_request_trace_has_queries_and_rendering(self):
+        response = self.client.get(self.product.get_url())
+
+        spans = tracing.exporter().traces()[-1]
+        root = spans[-1]
+        self.assertEqual(response[TRACE_HEADER], root.trace_id)
+        self.assertEqual(root.name, 'GET /store/category/<slug:category_slug>/<slug:product_slug>/')
+        self.assertEqual(root.attributes['http.status_code'], 200)
+        self.assertIn('render store/product_detail.html', self.names(spans))
+        self.assertIn('render includes/navbar.html', self.names(spans))
+        self.assertTrue(any(name.startswith('SELECT ') for name in self.names(spans)))
+        self.assertEqual(set(tracing.breakdown(spans)), {'db', 'render'})
+
+    def test_bedrock_and_http_calls_are_children_of_the_current_span(self):
+        tracing.configure(tracing.InMemoryExporter())
+        tracing.instrument()
+        bedrock = InstrumentedBedrockClient(LocalBedrockClient(latency_ms=0, tokens_per_second=0), 'vector_search')
+        http_response = requests.Response()
+        http_response.status_code, http_response._content = 200, b'jpeg'
+
+        with mock.patch('requests.adapters.HTTPAdapter.send', return_value=http_response):
+            with tracing.span('job', root=True, parent='00-%s-%s-01' % ('a' * 32, 'b' * 16)):
+                bedrock.invoke_model(body=json.dumps({'inputText': 'red shirt'}), modelId='amazon.titan-embed-g1-text-02')
+                requests.get('https://example.com/image.jpg?x=1')
+            # outside of a trace nothing is recorded
+            requests.get('https://example.com/image.jpg')
+
+        spans = tracing.as_dicts(tracing.exporter().traces()[0])
+        self.assertEqual(len(tracing.exporter().traces()), 1)
+        self.assertEqual(self.names(spans), ['bedrock amazon.titan-embed-g1-text-02', 'HTTP GET', 'job'])
+        self.assertEqual({span['traceId'] for span in spans}, {'a' * 32})
+        self.assertEqual(spans[2]['parentSpanId'], 'b' * 16)
+        self.assertEqual({spans[0]['parentSpanId'], spans[1]['parentSpanId']}, {spans[2]['spanId']})
+        self.assertIn({'key': 'http.url', 'value': {'stringValue': 'https://example.com/image.jpg'}}, spans[1]['attributes'])
+
+    def test_file_exporter_writes_otlp_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/traces.jsonl'
+            tracing.configure(tracing.FileExporter(path))
+            for _ in range(2):
+                with tracing.span('GET store/', root=True):
+                    with tracing.span('SELECT retail', {'component': 'db'}):
+                        with tracing.span('nested', {'component': 'db'}):
+                            pass
+                    with self.assertRaises(ValueError), tracing.span('render store.html', {'component': 'render'}):
+                        raise ValueError('broken')
+
+            traces = list(tracing.read_file(path))
+
+        self.assertEqual(len(traces), 2)
+        self.assertEqual(traces[0][-1]['name'], 'GET store/')
+        self.assertEqual(traces[0][2]['status'], {'code': tracing.STATUS_ERROR, 'message': 'ValueError: broken'})
+        summary = tracing.aggregate(traces)
+        self.assertEqual(summary['GET store/']['traces'], 2)
+        self.assertEqual(set(summary['GET store/']['components']), {'db', 'render'})
+        self.assertEqual([line.split('ms  ')[1] for line in tracing.format_tree(traces[0])],
+                         ['GET store/', '  SELECT retail', '    nested', '  render store.html  ERROR ValueError: broken'])
@@ -1,25 +1,36 @@
 from django.urls import path
+from django.utils.module_loading import import_string
 from . import views
 
+
+def genai(name):
+    # the GenAI views and their dependencies are imported on the first request to one of them
+    def view(request, *args, **kwargs):
+        return import_string('store.genai_views.' + name)(request, *args, **kwargs)
+    view.__name__ = name
+    return view
+
+
 urlpatterns = [
     path('', views.store, name='store'),
     path('category/<slug:category_slug>/', views.store, name='products_by_category'),
     path('category/<slug:category_slug>/<slug:product_slug>/', views.product_detail, name='product_detail'), 
     path('search/', views.search, name='search'),
     path('submit_review/<int:product_id>/', views.submit_review, name='submit_review'),
-    path('generate_description/<int:product_id>/', views.generate_description, name='generate_description'),
-    path('save_product_description/<int:product_id>/', views.save_product_description, name='save_product_description'),
-    path('design_studio/<int:product_id>/', views.design_studio, name='design_studio'),
-    path('create_response/<int:product_id>/<int:review_id>/', views.create_response, name='create_response'),
-    path('save_review_response/<int:product_id>/<int:review_id>/', views.save_review_response, name='save_review_response'),
-    path('generate_summary/<int:product_id>/', views.generate_summary, name='generate_summary'),
-    path('save_summary/<int:product_id>/', views.save_summary, name='save_summary'),
+    path('generate_description/<int:product_id>/', genai('generate_description'), name='generate_description'),
+    path('save_product_description/<int:product_id>/', genai('save_product_description'), name='save_product_description'),
+    path('design_studio/<int:product_id>/', genai('design_studio'), name='design_studio'),
+    path('create_response/<int:product_id>/<int:review_id>/', genai('create_response'), name='create_response'),
+    path('save_review_response/<int:product_id>/<int:review_id>/', genai('save_review_response'), name='save_review_response'),
+    path('review_responses/', genai('review_responses'), name='review_responses'),
+    path('generate_summary/<int:product_id>/', genai('generate_summary'), name='generate_summary'),
+    path('save_summary/<int:product_id>/', genai('save_summary'), name='save_summary'),
     
     #### REGISTER GENAI URLS BELOW ####
-    path('generate_product_description/<int:product_id>/', views.generate_product_description, name='generate_product_description'),
-    path('create_review_response/<int:product_id>/<int:review_id>/', views.create_review_response, name='create_review_response'),
-    path('create_design_ideas/<int:product_id>', views.create_design_ideas, name='create_design_ideas'),
-    path('generate_review_summary/<int:product_id>/', views.generate_review_summary, name='generate_review_summary'),
-    path('ask_question/', views.ask_question, name='ask_question'),
-    path('vector_search/', views.vector_search, name='vector_search'),
+    path('generate_product_description/<int:product_id>/', genai('generate_product_description'), name='generate_product_description'),
+    path('create_review_response/<int:product_id>/<int:review_id>/', genai('create_review_response'), name='create_review_response'),
+    path('create_design_ideas/<int:product_id>', genai('create_design_ideas'), name='create_design_ideas'),
+    path('generate_review_summary/<int:product_id>/', genai('generate_review_summary'), name='generate_review_summary'),
+    path('ask_question/', genai('ask_question'), name='ask_question'),
+    path('vector_search/', genai('vector_search'), name='vector_search'),
 ]
\ No newline at end of file
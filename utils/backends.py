@@ -0,0 +1,118 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""AWS clients, or local stand-ins for them, selected by the AWS_BACKEND setting
+
+With AWS_BACKEND=aws (the default) `client` is boto3.client. With AWS_BACKEND=local the
+application runs without an AWS account: Bedrock is answered by `fake_bedrock`, S3 objects
+are files under LOCAL_STORAGE_ROOT and secrets are read from LOCAL_SECRETS_FILE.
+"""
+# Python Built-Ins:
+import io
+import json
+import shutil
+from pathlib import Path
+
+# External Dependencies:
+import boto3
+from botocore.exceptions import ClientError
+from decouple import config
+
+AWS_BACKEND = config("AWS_BACKEND", default="aws")
+LOCAL_STORAGE_ROOT = Path(config("LOCAL_STORAGE_ROOT", default=str(Path(__file__).resolve().parent.parent / "local_storage")))
+LOCAL_SECRETS_FILE = Path(config("LOCAL_SECRETS_FILE", default=str(Path(__file__).resolve().parent.parent / "local_secrets.json")))
+
+# Used when LOCAL_SECRETS_FILE does not define a secret: a Postgres server on localhost
+DEFAULT_LOCAL_SECRETS = {
+    "postgresdb-secret": {
+        "host": "localhost",
+        "port": 5432,
+        "username": "postgres",
+        "password": "postgres",
+        "name": "retailstore",
+        "vectorDbIdentifier": "retailstore",
+    },
+}
+
+
+def is_local() -> bool:
+    return AWS_BACKEND == "local"
+
+
+def client(service_name: str, **kwargs):
+    """boto3.client, or its local stand-in when AWS_BACKEND=local"""
+    if not is_local():
+        return boto3.client(service_name, **kwargs)
+    if service_name == "s3":
+        return LocalObjectStore()
+    if service_name == "secretsmanager":
+        return LocalSecrets()
+    raise ValueError("No local stand-in for the %s client" % service_name)
+
+
+class LocalObjectStore:
+    """The part of the S3 client the application uses, storing objects as files
+
+    An object is the file `<root>/<bucket>/<key>`, so objects uploaded under media/ are the
+    files Django's FileSystemStorage serves when MEDIA_ROOT is `<root>/<bucket>/media`.
+    """
+
+    def __init__(self, root: Path = None):
+        self.root = Path(root or LOCAL_STORAGE_ROOT)
+
+    def _path(self, bucket: str, key: str) -> Path:
+        path = (self.root / bucket / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError("Key %s is outside the bucket" % key)
+        return path
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        path = self._path(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(Fileobj, f)
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        if isinstance(Body, bytes):
+            Body = io.BytesIO(Body)
+        self.upload_fileobj(Body, Bucket, Key)
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if not path.is_file():
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "The specified key does not exist."}}, "GetObject")
+        data = path.read_bytes()
+        return {"Body": io.BytesIO(data), "ContentLength": len(data)}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._path(Bucket, Key).unlink(missing_ok=True)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        deleted = []
+        for obj in Delete["Objects"]:
+            self.delete_object(Bucket, obj["Key"])
+            deleted.append({"Key": obj["Key"]})
+        return {"Deleted": deleted}
+
+
+class LocalSecrets:
+    """The part of the Secrets Manager client the application uses, reading a JSON file
+
+    LOCAL_SECRETS_FILE maps secret ids to their values, e.g.
+    {"postgresdb-secret": {"host": "localhost", "port": 5432, ...}}.
+    """
+
+    def __init__(self, path: Path = None):
+        self.path = Path(path or LOCAL_SECRETS_FILE)
+
+    def get_secret_value(self, SecretId, **kwargs):
+        secrets = dict(DEFAULT_LOCAL_SECRETS)
+        if self.path.is_file():
+            secrets.update(json.loads(self.path.read_text()))
+        if SecretId not in secrets:
+            raise ClientError({"Error": {"Code": "ResourceNotFoundException", "Message": "Secrets Manager can't find the specified secret."}}, "GetSecretValue")
+        value = secrets[SecretId]
+        return {"Name": SecretId, "SecretString": value if isinstance(value, str) else json.dumps(value)}
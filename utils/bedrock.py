@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: MIT-0
 """Helper utilities for working with Amazon Bedrock from Python notebooks"""
 # Python Built-Ins:
+import logging
 import os
 from typing import Optional
 
@@ -9,11 +10,20 @@ from typing import Optional
 import boto3
 from botocore.config import Config
 
+# Local Dependencies:
+from .backends import is_local
+from .instrumentation import InstrumentedBedrockClient
+
+logger = logging.getLogger(__name__)
+
 
 def get_bedrock_client(
     assumed_role: Optional[str] = None,
     region: Optional[str] = None,
     runtime: Optional[bool] = True,
+    instrumented: Optional[bool] = True,
+    limiter=None,
+    coalescer=None,
 ):
     """Create a boto3 client for Amazon Bedrock, with optional configuration overrides
 
@@ -27,38 +37,55 @@ def get_bedrock_client(
         If not specified, AWS_REGION or AWS_DEFAULT_REGION environment variable will be used.
     runtime :
         Optional choice of getting different client to perform operations with the Amazon Bedrock service.
+    instrumented :
+        Optional choice of wrapping the runtime client so that the latency, tokens and cost of
+        every model call are exported as Prometheus metrics and logged (see `instrumentation`).
+    limiter :
+        Optional `ratelimit.RateLimiter` the model calls of the instrumented client wait for.
+    coalescer :
+        Optional `singleflight.SingleFlight` sharing identical concurrent model calls of the
+        instrumented client.
     """
+    if runtime and is_local():
+        # AWS_BACKEND=local: answer model calls offline (see fake_bedrock)
+        from .fake_bedrock import FakeBedrockClient
+
+        logger.info("Using the local Bedrock stand-in")
+        fake_client = FakeBedrockClient()
+        return InstrumentedBedrockClient(fake_client, limiter=limiter, coalescer=coalescer) if instrumented else fake_client
+
     if region is None:
         target_region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
     else:
         target_region = region
 
-    print(f"Create new client\n  Using region: {target_region}")
+    logger.info("Creating a Bedrock client in region %s", target_region)
     session_kwargs = {"region_name": target_region}
     client_kwargs = {**session_kwargs}
 
     profile_name = os.environ.get("AWS_PROFILE")
     if profile_name:
-        print(f"  Using profile: {profile_name}")
+        logger.info("Using profile %s", profile_name)
         session_kwargs["profile_name"] = profile_name
 
     retry_config = Config(
         region_name=target_region,
+        # throttling is mostly prevented by the limiter; many retries per call would turn
+        # a throttled burst into a retry storm
         retries={
-            "max_attempts": 10,
+            "max_attempts": 3,
             "mode": "standard",
         },
     )
     session = boto3.Session(**session_kwargs)
 
     if assumed_role:
-        print(f"  Using role: {assumed_role}", end='')
+        logger.info("Assuming role %s", assumed_role)
         sts = session.client("sts")
         response = sts.assume_role(
             RoleArn=str(assumed_role),
             RoleSessionName="langchain-llm-1"
         )
-        print(" ... successful!")
         client_kwargs["aws_access_key_id"] = response["Credentials"]["AccessKeyId"]
         client_kwargs["aws_secret_access_key"] = response["Credentials"]["SecretAccessKey"]
         client_kwargs["aws_session_token"] = response["Credentials"]["SessionToken"]
@@ -74,7 +101,7 @@ def get_bedrock_client(
         **client_kwargs
     )
 
-    print("boto3 Bedrock client successfully created!")
-    print(bedrock_client._endpoint)
+    if runtime and instrumented:
+        return InstrumentedBedrockClient(bedrock_client, limiter=limiter, coalescer=coalescer)
     return bedrock_client
 
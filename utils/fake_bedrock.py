@@ -0,0 +1,196 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Offline stand-in for the Amazon Bedrock runtime client, for load testing and local development"""
+# Python Built-Ins:
+import base64
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# External Dependencies:
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from decouple import config
+
+# Words the canned completions are made of
+WORDS = (
+    "comfortable soft cotton fabric fits true to size and keeps its shape after washing "
+    "the color is bright and the stitching is neat a great choice for everyday wear "
+    "thank you for your feedback we are glad you enjoyed the product"
+).split()
+# Answer to the Q&A assistant's SQL generation prompt; read-only and valid for the store schema
+CANNED_QUERY = "<query>SELECT product_name, price FROM store_product ORDER BY price LIMIT 5</query>"
+EMBEDDING_DIMENSIONS = 1536
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class FakeBedrockClient:
+    """Answers `invoke_model` and `invoke_model_with_response_stream` like bedrock-runtime
+
+    Claude, Titan text, Titan embeddings and Stable Diffusion requests get canned responses in
+    the shape the real models return. Each call waits for a log-normally distributed time to
+    first token, plus the time to generate the output at a fixed token rate, so the application
+    sees realistic latencies without calling AWS.
+
+    Parameters
+    ----------
+    latency_ms :
+        Median time to first token in milliseconds (FAKE_BEDROCK_LATENCY_MS, default 400).
+    latency_sigma :
+        Spread of the log-normal time to first token (FAKE_BEDROCK_LATENCY_SIGMA, default 0.5).
+    tokens_per_second :
+        Output generation rate; 0 returns the whole output right after the first token
+        (FAKE_BEDROCK_TOKENS_PER_SECOND, default 80).
+    output_tokens :
+        Length of text completions, capped by the request's max tokens (FAKE_BEDROCK_OUTPUT_TOKENS, default 150).
+    max_concurrency :
+        Calls in flight beyond this limit fail with ThrottlingException, like an exhausted account
+        quota; 0 means no limit (FAKE_BEDROCK_MAX_CONCURRENCY, default 0).
+    seed :
+        Seed of the latency distribution, for repeatable runs.
+    """
+
+    def __init__(
+        self,
+        latency_ms: Optional[float] = None,
+        latency_sigma: Optional[float] = None,
+        tokens_per_second: Optional[float] = None,
+        output_tokens: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = config("FAKE_BEDROCK_LATENCY_MS", default=400, cast=float) if latency_ms is None else latency_ms
+        self.latency_sigma = config("FAKE_BEDROCK_LATENCY_SIGMA", default=0.5, cast=float) if latency_sigma is None else latency_sigma
+        self.tokens_per_second = config("FAKE_BEDROCK_TOKENS_PER_SECOND", default=80, cast=float) if tokens_per_second is None else tokens_per_second
+        self.output_tokens = config("FAKE_BEDROCK_OUTPUT_TOKENS", default=150, cast=int) if output_tokens is None else output_tokens
+        self.max_concurrency = config("FAKE_BEDROCK_MAX_CONCURRENCY", default=0, cast=int) if max_concurrency is None else max_concurrency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._image = None
+
+    def invoke_model(self, body, modelId, accept="application/json", contentType="application/json"):
+        request = json.loads(body)
+        with self._slot("InvokeModel"):
+            payload, input_tokens, output_tokens = self._respond(modelId, request)
+            self._wait(output_tokens)
+        data = json.dumps(payload).encode("utf-8")
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": 200, "HTTPHeaders": self._headers(input_tokens, output_tokens)},
+            "contentType": "application/json",
+            "body": StreamingBody(io.BytesIO(data), len(data)),
+        }
+
+    def invoke_model_with_response_stream(self, body, modelId, accept="application/json", contentType="application/json"):
+        request = json.loads(body)
+        if not modelId.startswith(("anthropic.", "amazon.titan-t")):
+            raise self._error("ValidationException", "InvokeModelWithResponseStream", "The model does not support streaming")
+        with self._slot("InvokeModelWithResponseStream"):
+            text, input_tokens, output_tokens = self._completion(modelId, request)
+            self._wait(0)
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": 200, "HTTPHeaders": self._headers(input_tokens, output_tokens)},
+            "contentType": "application/json",
+            "body": self._stream(modelId, text),
+        }
+
+    # responses
+
+    def _respond(self, model_id, request):
+        if model_id.startswith("amazon.titan-embed"):
+            text = request["inputText"]
+            return {"embedding": self._embedding(text), "inputTextTokenCount": estimate_tokens(text)}, estimate_tokens(text), 0
+        if model_id.startswith("stability."):
+            prompt = " ".join(p["text"] for p in request.get("text_prompts", []))
+            return {"result": "success", "artifacts": [{"seed": request.get("seed", 0), "base64": self._png(), "finishReason": "SUCCESS"}]}, estimate_tokens(prompt), 0
+        text, input_tokens, output_tokens = self._completion(model_id, request)
+        if model_id.startswith("anthropic."):
+            return {"completion": text, "stop_reason": "stop_sequence"}, input_tokens, output_tokens
+        return {
+            "inputTextTokenCount": input_tokens,
+            "results": [{"tokenCount": output_tokens, "outputText": text, "completionReason": "FINISH"}],
+        }, input_tokens, output_tokens
+
+    def _completion(self, model_id, request):
+        if model_id.startswith("anthropic."):
+            prompt = request["prompt"]
+            limit = request.get("max_tokens_to_sample", 256)
+        elif model_id.startswith("amazon.titan-t"):
+            prompt = request["inputText"]
+            limit = request.get("textGenerationConfig", {}).get("maxTokenCount", 512)
+        else:
+            raise self._error("ValidationException", "InvokeModel", "Unknown model identifier %s" % model_id)
+
+        if "<query></query>" in prompt:
+            text = CANNED_QUERY
+        else:
+            # the views keep what follows the first line, as with the real models
+            words = [WORDS[i % len(WORDS)] for i in range(max(1, min(limit, self.output_tokens) * 3 // 4))]
+            text = "Here is the text you asked for:\n" + " ".join(words).capitalize() + "."
+        return text, estimate_tokens(prompt), estimate_tokens(text)
+
+    def _embedding(self, text):
+        # same text, same vector, so similarity searches are stable across runs
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        vector = [rng.gauss(0, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+        norm = math.sqrt(sum(v * v for v in vector))
+        return [v / norm for v in vector]
+
+    def _png(self):
+        if self._image is None:
+            from PIL import Image
+
+            buffer = io.BytesIO()
+            Image.new("RGB", (512, 512), (200, 200, 200)).save(buffer, format="PNG")
+            self._image = base64.b64encode(buffer.getvalue()).decode("ascii")
+        return self._image
+
+    def _stream(self, model_id, text):
+        key = "completion" if model_id.startswith("anthropic.") else "outputText"
+        pieces = text.split(" ")
+        for i, piece in enumerate(pieces):
+            if self.tokens_per_second:
+                time.sleep(estimate_tokens(piece) / self.tokens_per_second)
+            chunk = {key: piece if i == 0 else " " + piece}
+            yield {"chunk": {"bytes": json.dumps(chunk).encode("utf-8")}}
+
+    # timing and limits
+
+    def _wait(self, output_tokens):
+        seconds = 0.0
+        if self.latency_ms:
+            seconds += self._random.lognormvariate(math.log(self.latency_ms / 1000), self.latency_sigma)
+        if self.tokens_per_second:
+            seconds += output_tokens / self.tokens_per_second
+        time.sleep(seconds)
+
+    @contextmanager
+    def _slot(self, operation):
+        with self._lock:
+            if self.max_concurrency and self._in_flight >= self.max_concurrency:
+                raise self._error("ThrottlingException", operation, "Too many requests, please wait before trying again.")
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _headers(self, input_tokens, output_tokens):
+        return {
+            "content-type": "application/json",
+            "x-amzn-bedrock-input-token-count": str(input_tokens),
+            "x-amzn-bedrock-output-token-count": str(output_tokens),
+        }
+
+    def _error(self, code, operation, message):
+        return ClientError({"Error": {"Code": code, "Message": message}}, operation)
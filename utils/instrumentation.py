@@ -0,0 +1,186 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Latency, token and cost metrics for Amazon Bedrock model calls"""
+# Python Built-Ins:
+import hashlib
+import io
+import json
+import logging
+import time
+
+# External Dependencies:
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from prometheus_client import Counter, Histogram
+
+from . import tracing
+from .ratelimit import UNLIMITED, RateLimitExceeded, estimate_tokens
+from .singleflight import LEADER
+
+logger = logging.getLogger("bedrock")
+
+# Bedrock error codes that mean "slow down" rather than "this request is wrong"
+THROTTLING_CODES = ("ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException", "ModelTimeoutException")
+
+# On-demand prices in USD per 1000 (input, output) tokens. Calls to other models are
+# still timed and counted, they are just not included in the cost.
+MODEL_PRICES = {
+    "anthropic.claude-instant-v1": (0.0008, 0.0024),
+    "anthropic.claude-v2": (0.008, 0.024),
+    "amazon.titan-tg1-large": (0.0008, 0.0016),
+    "amazon.titan-embed-g1-text-02": (0.0001, 0),
+}
+
+LATENCY = Histogram(
+    "bedrock_request_duration_seconds",
+    "Latency of Bedrock model calls",
+    ["model", "feature", "outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+TOKENS = Counter("bedrock_tokens", "Tokens used by Bedrock model calls", ["model", "feature", "direction"])
+COST = Counter("bedrock_cost_dollars", "Estimated cost of Bedrock model calls", ["model", "feature"])
+COALESCED = Counter(
+    "bedrock_coalesced_calls",
+    "Bedrock model calls answered by an identical call in flight (shared), or made after waiting for one too long (timeout)",
+    ["model", "feature", "outcome"],
+)
+RATE_LIMIT_WAIT = Histogram(
+    "bedrock_rate_limit_wait_seconds",
+    "Time Bedrock model calls waited for the client-side rate limits",
+    ["model"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20),
+)
+
+
+def call_outcome(exc: Exception) -> str:
+    """Classify a failed call as rate_limited (by the client-side limits), throttled or error"""
+    if isinstance(exc, RateLimitExceeded):
+        return "rate_limited"
+    if isinstance(exc, ClientError) and exc.response.get("Error", {}).get("Code") in THROTTLING_CODES:
+        return "throttled"
+    return "error"
+
+
+def token_counts(response: dict):
+    """Input and output token counts Bedrock reports in the response headers"""
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    return (
+        int(headers.get("x-amzn-bedrock-input-token-count", 0)),
+        int(headers.get("x-amzn-bedrock-output-token-count", 0)),
+    )
+
+
+def record_call(model: str, feature: str, outcome: str, seconds: float, input_tokens: int = 0, output_tokens: int = 0):
+    """Export one model call as Prometheus metrics and a JSON log line"""
+    LATENCY.labels(model, feature, outcome).observe(seconds)
+    TOKENS.labels(model, feature, "input").inc(input_tokens)
+    TOKENS.labels(model, feature, "output").inc(output_tokens)
+    cost = 0.0
+    if model in MODEL_PRICES:
+        input_price, output_price = MODEL_PRICES[model]
+        cost = input_tokens / 1000 * input_price + output_tokens / 1000 * output_price
+        COST.labels(model, feature).inc(cost)
+    logger.info(json.dumps({
+        "event": "bedrock_call",
+        "model": model,
+        "feature": feature,
+        "outcome": outcome,
+        "latency_ms": round(seconds * 1000, 1),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost_usd": round(cost, 6),
+    }))
+
+
+def call_key(kwargs: dict):
+    """Calls with the same key get the same answer: the model and a hash of the request"""
+    body = kwargs.get("body") or b""
+    digest = hashlib.sha256(body.encode() if isinstance(body, str) else body).hexdigest()
+    return (kwargs.get("modelId"), kwargs.get("accept"), kwargs.get("contentType"), digest)
+
+
+def _read_body(response: dict) -> dict:
+    # a response shared by coalesced calls is kept with its body read, since a stream is read once
+    body = response.get("body")
+    return dict(response, body=body.read()) if hasattr(body, "read") else response
+
+
+def _stream_body(response: dict) -> dict:
+    body = response.get("body")
+    return dict(response, body=StreamingBody(io.BytesIO(body), len(body))) if isinstance(body, bytes) else response
+
+
+class InstrumentedBedrockClient:
+    """Wraps a bedrock-runtime client so that every model call is recorded
+
+    Parameters
+    ----------
+    client :
+        The boto3 bedrock-runtime client to wrap. Attributes other than the model
+        invocation methods are passed through to it.
+    feature :
+        Name of the application feature the calls are made for, used as a metric label.
+        Use `for_feature` to get a wrapper of the same client for another feature.
+    limiter :
+        Optional `ratelimit.RateLimiter` every model call waits for; the wait is not part
+        of the call's latency but is exported on its own.
+    coalescer :
+        Optional `singleflight.SingleFlight` through which concurrent `invoke_model` calls
+        with the same model and body share one call. Only the call made is recorded; the
+        ones answered by it are counted in bedrock_coalesced_calls.
+    """
+
+    def __init__(self, client, feature: str = "unknown", limiter=None, coalescer=None):
+        self._client = client
+        self.feature = feature
+        self.limiter = limiter or UNLIMITED
+        self.coalescer = coalescer
+
+    def for_feature(self, feature: str) -> "InstrumentedBedrockClient":
+        return InstrumentedBedrockClient(self._client, feature, self.limiter, self.coalescer)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def invoke_model(self, **kwargs):
+        if self.coalescer is None:
+            return self._call(self._client.invoke_model, kwargs)
+        model = kwargs.get("modelId", "unknown")
+
+        def observe(outcome):
+            if outcome != LEADER:
+                COALESCED.labels(model, self.feature, outcome).inc()
+
+        response, _ = self.coalescer.do(call_key(kwargs), lambda: _read_body(self._call(self._client.invoke_model, kwargs)), observe)
+        return _stream_body(response)
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        # for streams the latency is the time until the stream is opened, and the tokens
+        # taken from the rate limits are the estimate
+        return self._call(self._client.invoke_model_with_response_stream, kwargs, stream=True)
+
+    def _call(self, method, kwargs, stream=False):
+        model = kwargs.get("modelId", "unknown")
+        with tracing.span("bedrock %s" % model, {"component": "bedrock", "bedrock.model": model, "bedrock.feature": self.feature}, kind=tracing.CLIENT) as span:
+            try:
+                permit = self.limiter.acquire(model, estimate_tokens(kwargs.get("body")))
+            except RateLimitExceeded as e:
+                record_call(model, self.feature, call_outcome(e), 0.0)
+                raise
+            with permit:
+                if permit.limit:
+                    RATE_LIMIT_WAIT.labels(model).observe(permit.waited)
+                    span.set_attribute("bedrock.rate_limit_wait_ms", round(permit.waited * 1000, 1))
+                start = time.perf_counter()
+                try:
+                    response = method(**kwargs)
+                except Exception as e:
+                    record_call(model, self.feature, call_outcome(e), time.perf_counter() - start)
+                    raise
+                input_tokens, output_tokens = token_counts(response)
+                if not stream:
+                    permit.used(input_tokens + output_tokens)
+            span.set_attribute("bedrock.input_tokens", input_tokens)
+            span.set_attribute("bedrock.output_tokens", output_tokens)
+            record_call(model, self.feature, "success", time.perf_counter() - start, input_tokens, output_tokens)
+        return response
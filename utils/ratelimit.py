@@ -0,0 +1,198 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Client-side rate limits of Amazon Bedrock model calls, per model
+
+Bedrock throttles each model at the account's requests and tokens per minute quotas. A
+`RateLimiter` keeps the calls of every worker under limits set a little below them, so a
+burst waits in the application instead of coming back throttled and being retried by
+all workers at once. Each model gets two token buckets, one refilled at its requests per
+second and one at its tokens per minute, kept in a store the workers share (a database
+table, see `store.ratelimit`, or `LocalBuckets` within one process), and a semaphore
+capping the calls each process has in flight. The tokens a call will use are estimated
+from its request body and corrected with the counts Bedrock returns.
+"""
+# Python Built-Ins:
+import json
+import threading
+import time
+from typing import NamedTuple
+
+# External Dependencies:
+from botocore.exceptions import ClientError
+
+# request body keys holding the most output tokens a call may generate
+MAX_TOKENS_KEYS = ("max_tokens_to_sample", "max_tokens", "maxTokenCount", "max_gen_len")
+CHARS_PER_TOKEN = 4
+
+
+class Limit(NamedTuple):
+    """Limits of one model; 0 is no limit. The buckets hold one second of requests and
+    one minute of tokens, so that is the largest burst let through at once."""
+
+    requests_per_second: float = 0
+    tokens_per_minute: float = 0
+    concurrency: int = 0
+
+
+class RateLimitExceeded(ClientError):
+    """A call would have waited longer than the limiter's max_wait. It is a
+    ThrottlingException, so callers back off and retry it as they do Bedrock's own."""
+
+    def __init__(self, model: str, limit: str):
+        super().__init__({"Error": {"Code": "ThrottlingException", "Message": "Client-side %s limit of %s reached" % (limit, model)}}, "InvokeModel")
+        self.model = model
+
+
+def estimate_tokens(body) -> int:
+    """Tokens a call may use: its text at about 4 characters a token plus the most
+    output tokens the request asks for."""
+    try:
+        request = json.loads(body)
+    except (TypeError, ValueError):
+        return 0
+    chars, output = 0, 0
+    values = [request]
+    while values:
+        value = values.pop()
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key in MAX_TOKENS_KEYS and isinstance(item, int):
+                    output += item
+                else:
+                    values.append(item)
+        elif isinstance(value, list):
+            values.extend(value)
+        elif isinstance(value, str):
+            chars += len(value)
+    return chars // CHARS_PER_TOKEN + 1 + output
+
+
+# token buckets; a model's state is (requests left, tokens left, time they were counted)
+
+
+def full(limit: Limit, now: float):
+    return (limit.requests_per_second, limit.tokens_per_minute, now)
+
+
+def take(state, limit: Limit, tokens: int, now: float):
+    """New state of the buckets after a call using `tokens`, and the seconds until the
+    call fits when it doesn't fit now, in which case nothing is taken."""
+    requests_left, tokens_left, counted = state
+    elapsed = max(0.0, now - counted)
+    requests_left = min(limit.requests_per_second, requests_left + elapsed * limit.requests_per_second)
+    tokens_left = min(limit.tokens_per_minute, tokens_left + elapsed * limit.tokens_per_minute / 60)
+    # a call larger than the bucket would never fit; it waits for a full bucket instead
+    tokens = min(tokens, limit.tokens_per_minute)
+    wait = 0.0
+    if limit.requests_per_second and requests_left < 1:
+        wait = (1 - requests_left) / limit.requests_per_second
+    if limit.tokens_per_minute and tokens_left < tokens:
+        wait = max(wait, (tokens - tokens_left) / limit.tokens_per_minute * 60)
+    if not wait:
+        requests_left -= 1 if limit.requests_per_second else 0
+        tokens_left -= tokens if limit.tokens_per_minute else 0
+    # workers' clocks differ a little; the buckets never go back in time
+    return (requests_left, tokens_left, max(now, counted)), wait
+
+
+def give(state, limit: Limit, tokens: int):
+    """State after `tokens` are returned to the token bucket (or taken, when negative)."""
+    requests_left, tokens_left, counted = state
+    if not limit.tokens_per_minute:
+        return state
+    return (requests_left, min(limit.tokens_per_minute, tokens_left + tokens), counted)
+
+
+class LocalBuckets:
+    """Buckets kept in this process; each process gets the full limits."""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def take(self, model: str, limit: Limit, tokens: int, now: float) -> float:
+        with self._lock:
+            state = self._states.get(model) or full(limit, now)
+            self._states[model], wait = take(state, limit, tokens, now)
+        return wait
+
+    def give(self, model: str, limit: Limit, tokens: int):
+        with self._lock:
+            if model in self._states:
+                self._states[model] = give(self._states[model], limit, tokens)
+
+
+class Permit:
+    """A call let through by the limiter, holding a slot of the model's concurrency until
+    it is released (or its `with` block ends); `used` corrects the estimate of its tokens."""
+
+    def __init__(self, limiter, model, limit, tokens, waited, semaphore=None):
+        self.limiter = limiter
+        self.model = model
+        self.limit = limit
+        self.tokens = tokens
+        self.waited = waited
+        self._semaphore = semaphore
+
+    def used(self, tokens: int):
+        if self.limit and tokens != self.tokens:
+            self.limiter.buckets.give(self.model, self.limit, self.tokens - tokens)
+
+    def release(self):
+        if self._semaphore:
+            self._semaphore.release()
+            self._semaphore = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class RateLimiter:
+    """Holds calls to the models in `limits` (model id: Limit) until they fit; calls to
+    other models are not limited. A call waiting longer than `max_wait` seconds, for a
+    free slot or for the buckets, raises RateLimitExceeded."""
+
+    def __init__(self, limits: dict, buckets=None, max_wait: float = 20.0, clock=time.time, sleep=time.sleep):
+        self.limits = limits
+        self.buckets = buckets or LocalBuckets()
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, model, limit):
+        with self._lock:
+            if model not in self._semaphores:
+                self._semaphores[model] = threading.BoundedSemaphore(limit.concurrency)
+            return self._semaphores[model]
+
+    def acquire(self, model: str, tokens: int = 0) -> Permit:
+        """Wait until a call to `model` using about `tokens` tokens fits its limits."""
+        limit = self.limits.get(model)
+        if limit is None:
+            return Permit(self, model, None, tokens, 0.0)
+        start = self.clock()
+        semaphore = self._semaphore(model, limit) if limit.concurrency else None
+        if semaphore and not semaphore.acquire(timeout=self.max_wait):
+            raise RateLimitExceeded(model, "concurrency")
+        try:
+            while True:
+                now = self.clock()
+                wait = self.buckets.take(model, limit, tokens, now)
+                if not wait:
+                    break
+                if now + wait - start > self.max_wait:
+                    raise RateLimitExceeded(model, "rate")
+                self.sleep(wait)
+        except BaseException:
+            if semaphore:
+                semaphore.release()
+            raise
+        return Permit(self, model, limit, min(tokens, limit.tokens_per_minute or tokens), self.clock() - start, semaphore)
+
+
+UNLIMITED = RateLimiter({})
@@ -0,0 +1,61 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Coalescing of identical concurrent calls
+
+While a call is in flight, callers making the same call (by key) wait for it and get its
+result, or its exception, instead of making it again. A caller that waited `timeout`
+seconds stops waiting and makes the call itself. Calls are only shared within a process.
+"""
+# Python Built-Ins:
+import threading
+
+# how a call was answered
+LEADER, SHARED, TIMED_OUT = "leader", "shared", "timeout"
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, timeout: float = 60.0):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, observe=None):
+        """Result of `function()`, shared with the concurrent calls of the same `key`, and
+        how it was answered: LEADER (this caller made the call), SHARED or TIMED_OUT.
+        `observe`, if given, is called with the same, also when the call failed."""
+        observe = observe or (lambda outcome: None)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                observe(TIMED_OUT)
+                return function(), TIMED_OUT
+            observe(SHARED)
+            if call.error is not None:
+                raise call.error
+            return call.result, SHARED
+
+        observe(LEADER)
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, LEADER
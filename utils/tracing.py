@@ -0,0 +1,374 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Lightweight request tracing, exported in the OpenTelemetry (OTLP/JSON) span format
+
+Spans are only recorded inside a trace, which `span(..., root=True)` starts (the Django
+middleware starts one per request), so the instrumented libraries cost next to nothing
+outside of traced requests. `instrument()` adds spans to botocore API calls, `requests`
+calls and psycopg2 connections opened directly; ORM queries and template rendering are
+added by `retailstore.tracing`. Finished traces go to the configured exporter: an
+`InMemoryExporter` for tests and the shell, or a `FileExporter` writing one OTLP/JSON
+document per trace, which the OpenTelemetry Collector's otlpjsonfile receiver can read.
+"""
+# Python Built-Ins:
+import json
+import random
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+# OTLP status codes
+STATUS_OK, STATUS_ERROR = 1, 2
+
+_current_span = ContextVar("current_span", default=None)
+_instrumented = False
+_exporter = None
+_sample_rate = 1.0
+
+
+class Span:
+    """One timed operation; `trace` is the list all spans of its trace end up in."""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "message", "trace")
+
+    def __init__(self, name, kind, trace_id, parent_id, attributes, trace):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_OK
+        self.message = ""
+        self.trace = trace
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, exc):
+        self.status = STATUS_ERROR
+        self.message = "%s: %s" % (type(exc).__name__, exc)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status, "message": self.message} if self.message else {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoSpan:
+    """Stands in for a span outside of a trace."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, exc):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, attributes: dict = None, kind: int = INTERNAL, root: bool = False, parent: str = None):
+    """Time the enclosed block as a child of the current span.
+
+    With root=True the block starts a new trace (continuing the W3C `traceparent`
+    header value `parent`, if given) that is exported when it ends. Without a current
+    span and root=False nothing is recorded.
+    """
+    current = _current_span.get()
+    if current is None and not root:
+        yield NO_SPAN
+        return
+    if root:
+        if _exporter is None or random.random() >= _sample_rate:
+            yield NO_SPAN
+            return
+        trace_id, parent_id = _parse_traceparent(parent) or (secrets.token_hex(16), None)
+        new = Span(name, kind, trace_id, parent_id, attributes, [])
+    else:
+        new = Span(name, kind, current.trace_id, current.span_id, attributes, current.trace)
+
+    token = _current_span.set(new)
+    try:
+        yield new
+    except BaseException as e:
+        new.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        new.end_ns = time.time_ns()
+        new.trace.append(new)
+        if root:
+            _exporter.export(new.trace)
+
+
+def traceparent(span: Span) -> str:
+    """W3C trace context header value of `span`, to continue its trace elsewhere."""
+    return "00-%s-%s-01" % (span.trace_id, span.span_id)
+
+
+def _parse_traceparent(value):
+    parts = (value or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16 and parts[1] != "0" * 32:
+        return parts[1], parts[2]
+    return None
+
+
+# exporters
+
+
+class InMemoryExporter:
+    """Keeps the last `max_traces` traces; each trace is a list of spans, the root last."""
+
+    def __init__(self, max_traces: int = 100):
+        self._traces = deque(maxlen=max_traces)
+
+    def export(self, spans):
+        self._traces.append(spans)
+
+    def traces(self):
+        return list(self._traces)
+
+    def clear(self):
+        self._traces.clear()
+
+
+class FileExporter:
+    """Appends each trace to `path` as one line of OTLP/JSON."""
+
+    def __init__(self, path, service_name: str = "retailstore"):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        document = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "retailstore.tracing"}, "spans": [s.to_otlp() for s in spans]}],
+            }]
+        }
+        line = json.dumps(document, separators=(",", ":")) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+
+def configure(exporter, sample_rate: float = 1.0):
+    """Send finished traces to `exporter`, or stop tracing with None."""
+    global _exporter, _sample_rate
+    _exporter = exporter
+    _sample_rate = sample_rate
+
+
+def exporter():
+    return _exporter
+
+
+# reading traces back
+
+
+def read_file(path):
+    """Traces written by FileExporter, as lists of OTLP span dicts."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield [s for rs in json.loads(line)["resourceSpans"] for ss in rs["scopeSpans"] for s in ss["spans"]]
+
+
+def as_dicts(spans):
+    """OTLP span dicts of a trace, whether it holds Span objects or dicts already."""
+    return [s.to_otlp() if isinstance(s, Span) else s for s in spans]
+
+
+def duration_ms(span):
+    return (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+
+
+def _attribute(span, key, default=None):
+    for attribute in span["attributes"]:
+        if attribute["key"] == key:
+            return next(iter(attribute["value"].values()))
+    return default
+
+
+def root_span(spans):
+    ids = {s["spanId"] for s in spans}
+    return next(s for s in spans if s.get("parentSpanId") not in ids)
+
+
+def format_tree(spans):
+    """Lines of the span tree of a trace, children indented under their parent."""
+    spans = as_dicts(spans)
+    children = defaultdict(list)
+    for s in spans:
+        children[s.get("parentSpanId")].append(s)
+    lines = []
+
+    def add(s, depth):
+        error = "  ERROR %s" % s["status"].get("message", "") if s["status"]["code"] == STATUS_ERROR else ""
+        lines.append("%9.1f ms  %s%s%s" % (duration_ms(s), "  " * depth, s["name"], error))
+        for child in sorted(children[s["spanId"]], key=lambda c: int(c["startTimeUnixNano"])):
+            add(child, depth + 1)
+
+    add(root_span(spans), 0)
+    return lines
+
+
+def breakdown(spans):
+    """Milliseconds of a trace spent per component (db, aws, http, render...). A span
+    inside another span of the same component is not counted twice."""
+    spans = as_dicts(spans)
+    by_id = {s["spanId"]: s for s in spans}
+    totals = defaultdict(float)
+    for s in spans:
+        component = _attribute(s, "component")
+        if not component:
+            continue
+        parent = by_id.get(s.get("parentSpanId"))
+        while parent is not None and _attribute(parent, "component") != component:
+            parent = by_id.get(parent.get("parentSpanId"))
+        if parent is None:
+            totals[component] += duration_ms(s)
+    return dict(totals)
+
+
+def aggregate(traces):
+    """Per root span name (e.g. "GET store/vector_search/"): number of traces, mean
+    duration and mean milliseconds per component."""
+    summary = {}
+    for spans in traces:
+        spans = as_dicts(spans)
+        root = root_span(spans)
+        entry = summary.setdefault(root["name"], {"traces": 0, "total_ms": 0.0, "components": defaultdict(float)})
+        entry["traces"] += 1
+        entry["total_ms"] += duration_ms(root)
+        for component, ms in breakdown(spans).items():
+            entry["components"][component] += ms
+    return {
+        name: {
+            "traces": entry["traces"],
+            "mean_ms": entry["total_ms"] / entry["traces"],
+            "components": {c: ms / entry["traces"] for c, ms in sorted(entry["components"].items())},
+        }
+        for name, entry in summary.items()
+    }
+
+
+# library instrumentation
+
+
+def instrument():
+    """Add spans to botocore, requests and directly opened psycopg2 connections; idempotent."""
+    global _instrumented
+    if _instrumented:
+        return
+    _instrumented = True
+    _instrument_botocore()
+    _instrument_requests()
+    _instrument_psycopg2()
+
+
+def _instrument_botocore():
+    from botocore.client import BaseClient
+
+    make_api_call = BaseClient._make_api_call
+
+    def traced_make_api_call(self, operation_name, api_params):
+        service = self.meta.service_model.service_id.hyphenize()
+        attributes = {"component": "aws", "rpc.system": "aws-api", "rpc.service": service, "rpc.method": operation_name, "cloud.region": self.meta.region_name or ""}
+        if "Bucket" in api_params:
+            attributes["aws.s3.bucket"] = api_params["Bucket"]
+        with span("%s.%s" % (service, operation_name), attributes, kind=CLIENT):
+            return make_api_call(self, operation_name, api_params)
+
+    BaseClient._make_api_call = traced_make_api_call
+
+
+def _instrument_requests():
+    import requests
+
+    send = requests.Session.send
+
+    def traced_send(self, request, **kwargs):
+        with span("HTTP %s" % request.method, {"component": "http", "http.method": request.method, "http.url": request.url.split("?")[0]}, kind=CLIENT) as s:
+            response = send(self, request, **kwargs)
+            s.set_attribute("http.status_code", response.status_code)
+            s.set_attribute("http.response_content_length", len(response.content) if not kwargs.get("stream") else 0)
+            return response
+
+    requests.Session.send = traced_send
+
+
+# set while the ORM's own spans time a query, so the cursor doesn't record it again
+orm_query = ContextVar("orm_query", default=False)
+
+
+def db_span(sql, system, name, **attributes):
+    operation = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "QUERY"
+    attributes.update({"component": "db", "db.system": system, "db.name": name or "", "db.statement": sql[:1000]})
+    return span("%s %s" % (operation, name or system), attributes, kind=CLIENT)
+
+
+def _instrument_psycopg2():
+    try:
+        import psycopg2
+        import psycopg2.extensions
+    except ImportError:
+        return
+
+    class TracedCursor(psycopg2.extensions.cursor):
+        def execute(self, query, vars=None):
+            if orm_query.get() or current_span() is None:
+                return super().execute(query, vars)
+            sql = query.decode() if isinstance(query, bytes) else str(query)
+            with db_span(sql, "postgresql", self.connection.info.dbname):
+                return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            if orm_query.get() or current_span() is None:
+                return super().executemany(query, vars_list)
+            sql = query.decode() if isinstance(query, bytes) else str(query)
+            with db_span(sql, "postgresql", self.connection.info.dbname, **{"db.executemany": True}):
+                return super().executemany(query, vars_list)
+
+    connect = psycopg2.connect
+
+    def traced_connect(*args, **kwargs):
+        kwargs.setdefault("cursor_factory", TracedCursor)
+        with span("psycopg2.connect", {"component": "db", "db.system": "postgresql", "db.name": kwargs.get("database") or kwargs.get("dbname") or ""}, kind=CLIENT):
+            return connect(*args, **kwargs)
+
+    psycopg2.connect = traced_connect